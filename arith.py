@@ -0,0 +1,207 @@
+"""
+Aquí se encuentra la aritmética modular sobre la que se apoyan
+:mod:`crypto`, :mod:`cryptoutils` y :mod:`shamir`.
+
+Hay dos implementaciones (*backends*):
+
+* ``"gmpy2"``: usa los enteros ``mpz`` de gmpy2 (GMP), mucho más
+  rápidos que los de Python con números de 2048 bits.
+* ``"python"``: usa los enteros de Python. Es la alternativa cuando
+  gmpy2 no está instalado.
+
+Por defecto se usa gmpy2 si está disponible. Con :func:`use_backend`
+se puede cambiar en tiempo de ejecución, por ejemplo para comparar el
+rendimiento de ambas.
+
+:func:`powmod` e :func:`invert` devuelven siempre enteros de Python.
+Los bucles que encadenan muchas multiplicaciones convierten antes sus
+operandos con :func:`number` y el resultado final con ``int``.
+"""
+
+from random import SystemRandom
+
+try:
+    import gmpy2
+except ImportError:
+    gmpy2 = None
+
+
+BACKENDS = ("gmpy2", "python")
+"""
+Los *backends* disponibles.
+"""
+
+BACKEND = "gmpy2" if gmpy2 is not None else "python"
+"""
+El *backend* en uso. Se cambia con :func:`use_backend`.
+"""
+
+PRIMALITY_ROUNDS = 25
+"""
+Las rondas de Miller-Rabin de :func:`is_prime`. La probabilidad de
+aceptar un número compuesto es como mucho :math:`4^{-r}`.
+"""
+
+
+def _python_number(x):
+    return int(x)
+
+
+def _python_powmod(base, exponent, modulus):
+    return pow(base, exponent, modulus)
+
+
+def _python_invert(a, modulus):
+    try:
+        return pow(a, -1, modulus)
+    except ValueError:
+        raise ValueError("El número no tiene inverso en ese módulo")
+
+
+def _python_jacobi(a, n):
+    a %= n
+    result = 1
+    while a:
+        zeros = (a & -a).bit_length() - 1
+        a >>= zeros
+        if zeros & 1 and n & 7 in (3, 5):
+            result = -result
+        if a & n & 2:
+            result = -result
+        a, n = n % a, a
+    return result if n == 1 else 0
+
+
+def _python_is_prime(n, rounds):
+    if n < 2:
+        return False
+    for small in (2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37):
+        if n % small == 0:
+            return n == small
+    d = n - 1
+    s = (d & -d).bit_length() - 1
+    d >>= s
+    random = SystemRandom()
+    for _ in range(rounds):
+        x = pow(random.randrange(2, n - 1), d, n)
+        if x == 1 or x == n - 1:
+            continue
+        for _ in range(s - 1):
+            x = x * x % n
+            if x == n - 1:
+                break
+        else:
+            return False
+    return True
+
+
+def _gmpy2_powmod(base, exponent, modulus):
+    return int(gmpy2.powmod(base, exponent, modulus))
+
+
+def _gmpy2_invert(a, modulus):
+    try:
+        return int(gmpy2.invert(a, modulus))
+    except ZeroDivisionError:
+        raise ValueError("El número no tiene inverso en ese módulo")
+
+
+def _gmpy2_jacobi(a, n):
+    return int(gmpy2.jacobi(a, n))
+
+
+def _gmpy2_is_prime(n, rounds):
+    return bool(gmpy2.is_prime(n, rounds))
+
+
+def use_backend(name):
+    """
+    Cambia el *backend* de todas las funciones del módulo.
+
+    :param name: ``"gmpy2"`` o ``"python"``.
+
+    :raises ValueError: Si el *backend* no existe o si es ``"gmpy2"``
+        y gmpy2 no está instalado.
+    """
+    global BACKEND, _number, _powmod, _invert, _jacobi, _is_prime
+    if name not in BACKENDS:
+        raise ValueError("No existe el backend aritmético {}".format(name))
+    if name == "gmpy2":
+        if gmpy2 is None:
+            raise ValueError("gmpy2 no está instalado")
+        _number = gmpy2.mpz
+        _powmod = _gmpy2_powmod
+        _invert = _gmpy2_invert
+        _jacobi = _gmpy2_jacobi
+        _is_prime = _gmpy2_is_prime
+    else:
+        _number = _python_number
+        _powmod = _python_powmod
+        _invert = _python_invert
+        _jacobi = _python_jacobi
+        _is_prime = _python_is_prime
+    BACKEND = name
+
+
+def number(x):
+    """
+    Convierte un entero al tipo nativo del *backend* (``mpz`` o
+    ``int``). Las operaciones aritméticas entre un número convertido y
+    un ``int`` usan el *backend*.
+    """
+    return _number(x)
+
+
+def powmod(base, exponent, modulus):
+    """
+    Calcula :math:`b^e \\bmod m`. Un exponente negativo eleva el
+    inverso de la base.
+
+    :returns: El resultado como un entero de Python.
+    """
+    return _powmod(base, exponent, modulus)
+
+
+def invert(a, modulus):
+    """
+    Calcula el inverso de a módulo m.
+
+    :returns: El inverso como un entero de Python.
+
+    :raises ValueError: Si a no tiene inverso.
+    """
+    return _invert(a, modulus)
+
+
+def jacobi(a, n):
+    """
+    Calcula el símbolo de Jacobi :math:`(a/n)`. Si n es primo es el
+    símbolo de Legendre: 1 si a es un residuo cuadrático módulo n, -1
+    si no lo es y 0 si n divide a a.
+
+    Es mucho más barato que comprobar el residuo con una
+    exponenciación modular.
+
+    :param a: Un entero.
+    :param n: Un entero impar positivo.
+
+    :returns: 1, -1 o 0.
+    """
+    return _jacobi(a, n)
+
+
+def is_prime(n, rounds=PRIMALITY_ROUNDS):
+    """
+    Comprueba si un número es primo mediante la prueba probabilística
+    de Miller-Rabin.
+
+    :param n: Un entero.
+    :param rounds: Las rondas de la prueba.
+
+    :returns: `True` si n es primo con probabilidad muy alta, `False`
+        si es compuesto.
+    """
+    return _is_prime(n, rounds)
+
+
+use_backend(BACKEND)
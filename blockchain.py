@@ -3,24 +3,359 @@ Aquí se encuentra la definición de las clases necesarias para el uso de
 la blockchain.
 """
 
+import hashlib
+import itertools
 import json
+import multiprocessing
 import os
 import time
 
-from functools import reduce
 from pprint import pformat, saferepr
 from random import SystemRandom
 
-from crypto import reconstruct_key, serialize_key, sha256hash
+import codec
+
+from blocklog import BLOCK, CHECKPOINT, GENESIS, TRUNCATE, VOTE, BlockLog, BlockStore
+from checkpoint import CHECKPOINT_INTERVAL, digest_hex, signature_term, verify_checkpoints
+from crypto import (invert_ballot, parallel_tally, precompute, reconstruct_key, serialize_key, tally_votes,
+                    verify_ballots)
+from mempool import Mempool
+from merkle import merkle_proof, merkle_root, ticket_hash
+from miner import difficulty_target, mine, proof_value
+from signature import import_public_key, sign, verify
 
 
 DIFFICULTY = 5 
 """
-La dificultad de generar un proof válido. Corresponde a la cantidad de
-ceros que se busca tenga el resultado de la función hash sobre la
-concatenación de las cadenas apropiadas.
+La dificultad inicial de generar un proof válido. Corresponde a la
+cantidad de ceros que se busca tenga el resultado de la función hash
+sobre la concatenación de las cadenas apropiadas.
+"""
+
+INITIAL_TARGET = difficulty_target(DIFFICULTY)
+"""
+El objetivo del primer bloque de cada cadena, equivalente a
+:data:`DIFFICULTY`. Es también el objetivo de los bloques creados antes
+de que las cadenas ajustasen su dificultad, que no lo incluyen.
+"""
+
+MAX_TARGET = difficulty_target(3)
+"""
+El objetivo más fácil al que puede llegar una cadena.
+"""
+
+BLOCK_INTERVAL = 10
+"""
+Los segundos que se busca que pasen entre dos bloques consecutivos.
+"""
+
+RETARGET_WINDOW = 10
+"""
+Cada cuántos bloques se ajusta el objetivo, según el tiempo que han
+tardado en crearse los últimos :data:`RETARGET_WINDOW` bloques.
+"""
+
+MAX_RETARGET_FACTOR = 4
+"""
+El factor máximo por el que puede cambiar el objetivo en cada ajuste.
 """
 
+CONSENSUS_MODES = ("pow", "poa")
+"""
+Los modos de consenso disponibles: *proof-of-work* (``"pow"``), donde
+cada bloque necesita una prueba de trabajo, y *proof-of-authority*
+(``"poa"``), donde cada bloque lo firma (lo sella) uno de los
+selladores autorizados en el bloque génesis.
+"""
+
+SEAL_FIELDS = ("index", "timestamp", "previous_hash", "merkle_root", "sealer")
+"""
+Los campos de la cabecera de un bloque que firma su sellador. La raíz
+de Merkle compromete la firma con los votos del bloque.
+"""
+
+UNDO_DEPTH = 2 * CHECKPOINT_INTERVAL
+"""
+La cantidad de bloques recientes cuyos cambios en los índices se
+guardan para poder deshacerlos. Una reorganización que no baja del
+último punto de control y no supera esta profundidad se deshace bloque
+a bloque; si no, se reconstruyen los índices recorriendo la cadena.
+"""
+
+VALIDATION_CHUNK_SIZE = 16
+"""
+La cantidad de bloques que se envía de una vez a cada proceso durante
+una validación completa.
+"""
+
+
+class Block(dict):
+    """
+    Un bloque de la *blockchain*. Se comporta como un `dict` de solo
+    lectura: una vez creado queda sellado, de modo que su serialización
+    canónica (JSON con las claves ordenadas) y su *hash* SHA256 se
+    calculan una única vez y se reutilizan en cada consulta.
+
+    .. note:: El sellado es superficial: la lista de transacciones no
+        debe modificarse una vez creado el bloque.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        #: Los bytes de la serialización canónica del bloque.
+        self.canonical = json.dumps(self.serializable(), sort_keys=True).encode()
+        #: El *hash* SHA256 de la serialización canónica.
+        self.hash = hashlib.sha256(self.canonical).hexdigest()
+        self._tickets = None
+        self._binary = None
+
+    def serializable(self):
+        """
+        Devuelve un `dict` con el contenido del bloque apto para ser
+        serializado: igual que el bloque, pero con la clave pública del
+        bloque génesis en forma de `dict`.
+        """
+        serializable = dict(self)
+        key = serializable.get("public_key")
+        if key is not None and not isinstance(key, dict):
+            serializable["public_key"] = serialize_key(key)
+        return serializable
+
+    @staticmethod
+    def decode(payload):
+        """
+        Construye un bloque a partir de su codificación en cualquiera
+        de los formatos (ver :meth:`encoded`). Si está en JSON, los
+        bytes ya son la serialización canónica y no se vuelve a
+        codificar.
+
+        :param payload: los bytes del bloque.
+        """
+        if codec.is_binary(payload):
+            return Block(codec.loads(payload))
+        block = Block.__new__(Block)
+        dict.update(block, json.loads(bytes(payload)))
+        block.canonical = bytes(payload)
+        block.hash = hashlib.sha256(block.canonical).hexdigest()
+        block._tickets = None
+        block._binary = None
+        return block
+
+    def get_binary(self):
+        if self._binary is None:
+            self._binary = codec.encode_value(self.serializable())
+        return self._binary
+
+    #: La codificación binaria del bloque (ver :mod:`codec`), sin
+    #: cabecera, calculada la primera vez que se consulta.
+    binary = property(get_binary)
+
+    def encoded(self, fmt="json"):
+        """
+        Devuelve el bloque codificado en el formato indicado,
+        reutilizando las codificaciones ya calculadas.
+
+        :param fmt: ``"json"`` o ``"binary"``.
+        """
+        if fmt == "binary":
+            return codec.with_header(self.binary)
+        return self.canonical
+
+    def _sealed(self, *args, **kwargs):
+        raise TypeError("Un bloque no puede modificarse una vez creado")
+
+    __setitem__ = __delitem__ = _sealed
+    clear = pop = popitem = setdefault = update = _sealed
+
+    def __reduce__(self):
+        # Las claves de pycryptodome no se pueden serializar con pickle,
+        # así que el bloque génesis viaja con la clave en forma de dict.
+        return (Block, (self.serializable(),))
+
+    def get_tickets(self):
+        if self._tickets is None:
+            self._tickets = [ticket_hash(vote) for vote in self.get("transactions", ())]
+        return self._tickets
+
+    #: Los *hashes* de los votos del bloque, calculados la primera vez
+    #: que se consultan.
+    tickets = property(get_tickets)
+
+
+_validator_key = None
+_validator_voters = None
+_validator_sealers = None
+
+
+def _init_validator(key, voter_list, sealers=None):
+    """
+    Prepara la clave, la lista de votantes y la de selladores
+    utilizadas por :func:`_validate_pair` en el proceso actual.
+    """
+    global _validator_key, _validator_voters, _validator_sealers
+    _validator_key = reconstruct_key(key)
+    precompute(_validator_key)
+    _validator_voters = voter_list
+    _validator_sealers = import_sealers(sealers)
+
+
+def import_sealers(sealers):
+    """
+    Importa las claves públicas de los selladores, en formato PEM.
+
+    :return: una lista de claves ECDSA, o `None` si la cadena usa
+        *proof-of-work*.
+    """
+    if sealers is None:
+        return None
+    return [import_public_key(sealer) for sealer in sealers]
+
+
+def seal_message(block):
+    """
+    :return: los bytes que firma el sellador de un bloque (ver
+        :data:`SEAL_FIELDS`).
+    """
+    return json.dumps({field: block[field] for field in SEAL_FIELDS}, sort_keys=True).encode()
+
+
+def _valid_seal(block, sealers):
+    """
+    Comprueba que un bloque lo ha sellado uno de los selladores. Un
+    bloque al que le falta alguno de los campos sellados
+    (:data:`SEAL_FIELDS`) no es válido.
+
+    :param sealers: las claves devueltas por :func:`import_sealers`.
+    """
+    if "seal" not in block or any(field not in block for field in SEAL_FIELDS):
+        return False
+    sealer = block["sealer"]
+    if type(sealer) is not int or not 0 <= sealer < len(sealers):
+        return False
+    try:
+        seal = bytes.fromhex(block["seal"])
+    except (TypeError, ValueError):
+        return False
+    return verify(sealers[sealer], seal, seal_message(block))
+
+
+def _valid_header(prev_block, block, sealers=None):
+    """
+    Comprueba la cabecera de un bloque respecto a su bloque anterior:
+    índice, *hash* anterior, tiempo de creación y, según el modo de
+    consenso de la cadena, *proof-of-work* respecto al objetivo del
+    bloque o sello de uno de los selladores.
+
+    Que el objetivo sea el que corresponde a la cadena se comprueba
+    aparte (ver :func:`_valid_targets`).
+
+    :param sealers: las claves de los selladores (ver
+        :func:`import_sealers`) si la cadena usa *proof-of-authority*.
+
+    :return: `True` si la cabecera es válida, `False` en cualquier otro
+        caso.
+    """
+    prev_hash = prev_block.hash
+    if block["index"] != prev_block["index"] + 1:
+        return False
+    if block["previous_hash"] != prev_hash:
+        return False
+    if sealers is not None:
+        if not _valid_seal(block, sealers):
+            return False
+    else:
+        if "target" not in block and "target" in prev_block:
+            return False
+        if not Blockchain.valid_proof(prev_block["proof"], prev_hash, block.get("proof"), block.get("target")):
+            return False
+    return block["timestamp"] >= prev_block["timestamp"]
+
+
+def _expected_target(blocks, height):
+    """
+    Calcula el objetivo que debe cumplir el bloque a una altura.
+
+    El objetivo es el del bloque anterior, salvo justo después de cada
+    :data:`RETARGET_WINDOW` bloques: entonces se multiplica por el
+    tiempo que han tardado en crearse esos bloques dividido entre el
+    tiempo buscado (:data:`BLOCK_INTERVAL` por bloque), con el cambio
+    limitado por :data:`MAX_RETARGET_FACTOR` y el resultado por
+    :data:`MAX_TARGET`.
+
+    :param blocks: los bloques anteriores, accesibles por altura.
+    :param height: la altura del bloque.
+    """
+    prev_block = blocks[height - 1]
+    target = prev_block.get("target", INITIAL_TARGET)
+    if height - 1 < RETARGET_WINDOW or (height - 1) % RETARGET_WINDOW:
+        return target
+    expected = RETARGET_WINDOW * BLOCK_INTERVAL * 1000
+    elapsed = int((prev_block["timestamp"] - blocks[height - 1 - RETARGET_WINDOW]["timestamp"]) * 1000)
+    elapsed = min(max(elapsed, expected // MAX_RETARGET_FACTOR), expected * MAX_RETARGET_FACTOR)
+    return min(target * elapsed // expected, MAX_TARGET)
+
+
+def _valid_targets(blocks, start, stop):
+    """
+    Comprueba que los bloques en ``[start, stop)`` tienen el objetivo
+    que les corresponde. Los bloques creados antes de que las cadenas
+    ajustasen su dificultad no incluyen objetivo y no se comprueban.
+
+    :param blocks: los bloques, accesibles por altura.
+    """
+    for height in range(max(start, 1), stop):
+        block = blocks[height]
+        if "target" in block and block["target"] != _expected_target(blocks, height):
+            return False
+    return True
+
+
+def _validate_pair(pair):
+    """
+    Comprueba un bloque respecto a su bloque anterior: índice, *hash*
+    anterior, *proof-of-work*, tiempo de creación y las papeletas que
+    contiene.
+
+    :param pair: una tupla (bloque anterior, bloque).
+
+    :return: `True` si el bloque es válido, `False` en cualquier otro
+        caso.
+    """
+    prev_block, block = pair
+    if not _valid_header(prev_block, block, _validator_sealers):
+        return False
+    if "merkle_root" in block and block["merkle_root"] != merkle_root(block.tickets):
+        return False
+    return verify_ballots(_validator_key, block["transactions"], _validator_voters)
+
+
+def _sealed(blocks, i):
+    """
+    Devuelve el bloque ``i`` de una lista como :class:`Block`,
+    sellándolo solo si hace falta.
+    """
+    block = blocks[i]
+    return block if isinstance(block, Block) else Block(block)
+
+
+class _TipChanged:
+    """
+    Señal de cancelación para :func:`miner.mine` que se activa cuando
+    cambia el último bloque de una cadena o cuando se activa una señal
+    externa.
+    """
+
+    def __init__(self, blockchain, tip, cancel=None):
+        self.blockchain = blockchain
+        self.tip = tip
+        self.cancel = cancel
+
+    def is_set(self):
+        if self.cancel is not None and self.cancel.is_set():
+            return True
+        return self.blockchain.blocks[-1].hash != self.tip.hash
+
+
 class Blockchain:
     """
     Esta clase implementa la blockchain junto con los mecanismos
@@ -29,10 +364,15 @@ class Blockchain:
     actualización.
     """
 
-    def __init__(self, start_time, timestamp, end_time, public_key, voter_list, option_list, name="votacion"):
-        genesis_block = {
+    def __init__(self, start_time, timestamp, end_time, public_key, voter_list, option_list, name="votacion", proof=None,
+                 consensus="pow", sealers=None):
+        if consensus not in CONSENSUS_MODES:
+            raise ValueError("Modo de consenso desconocido: {}".format(consensus))
+        if consensus == "poa" and not sealers:
+            raise ValueError("Una cadena proof-of-authority necesita al menos un sellador")
+        genesis = {
             "index": 0,
-            "proof": SystemRandom().randint(0, 2**128),
+            "proof": proof if proof is not None else SystemRandom().randint(0, 2**128),
             "start_time": start_time if start_time else time.time(),
             "timestamp": timestamp if timestamp else time.time(),
             "end_time": end_time,
@@ -41,8 +381,41 @@ class Blockchain:
             "option_list": option_list,
             "name": name
         }
-        self.blocks = [genesis_block]
-        self.pending_votes = []
+        if consensus != "pow":
+            genesis["consensus"] = consensus
+            genesis["sealers"] = sealers
+        self.blocks = [Block(genesis)]
+        precompute(public_key)
+        #: Las claves de los selladores, ya importadas.
+        self._sealer_keys = import_sealers(genesis.get("sealers"))
+        #: Los votos pendientes de añadirse a un bloque.
+        self.mempool = Mempool()
+        #: La altura del último bloque validado por :meth:`validate`.
+        self.validated_height = 0
+        #: El registro en disco de la cadena (ver :meth:`attach_log`).
+        self.log = None
+        #: Para cada firma, la posición (índice del bloque, posición en
+        #: el bloque) de su último voto guardado en un bloque.
+        self.signature_index = {}
+        #: Para cada *hash* de voto (ver :func:`merkle.ticket_hash`), su
+        #: posición en la cadena.
+        self.ticket_index = {}
+        self._vote_count = 0
+        #: Los puntos de control de la cadena, de menor a mayor altura
+        #: (ver :mod:`checkpoint`).
+        self.checkpoints = []
+        #: Para cada firma que ha vuelto a votar después del último
+        #: punto de control, la posición del voto que contaba en él.
+        self._superseded = {}
+        self._signatures_digest = 0
+        #: El recuento cifrado de los votos que cuentan, al día con el
+        #: último bloque (ver :meth:`encrypted_tally`). Vale `None`
+        #: mientras se reconstruyen los índices.
+        self._tally = []
+        #: Para cada uno de los últimos :data:`UNDO_DEPTH` bloques, la
+        #: firma de cada voto y la posición del voto anterior de esa
+        #: firma (ver :meth:`_unindex_blocks`).
+        self._undo = {}
 
     @staticmethod
     def construct(blocks):
@@ -53,44 +426,135 @@ class Blockchain:
         :param blocks: una lista de dicts que representen una
             *blockchain*.
         """
-        blocks[0].pop("index")
-        blocks[0].pop("proof")
-        key = reconstruct_key(blocks[0].pop("public_key"))
-        blocks[0]["public_key"] = key
-        genesis = blocks[0]
+        genesis = dict(blocks[0])
+        genesis.pop("index")
+        genesis["public_key"] = reconstruct_key(genesis["public_key"])
         ret = Blockchain(**genesis)
-        ret.blocks.extend(blocks[1:])
+        for block in blocks[1:]:
+            ret.blocks.append(Block(block))
+            ret._index_block(ret.blocks[-1])
         return ret
 
+    @staticmethod
+    def from_log(log, workers=None):
+        """
+        Reconstruye una cadena a partir de su registro en disco y la
+        deja asociada a él.
+
+        El registro se recorre una sola vez para construir los índices
+        de votos y la cola de votos pendientes; los bloques no se
+        mantienen en memoria, sino que se leen del registro cuando se
+        consultan (ver :class:`blocklog.BlockStore`).
+
+        Los puntos de control que coincidan con la cadena se recuperan,
+        y la cadena se da por validada hasta el último de ellos. Su
+        recuento no se comprueba aquí, sino en la validación completa
+        (ver :meth:`validate`).
+
+        :param log: un :class:`blocklog.BlockLog`.
+        :param workers: el número de procesos para el recuento cifrado
+            (ver :meth:`_recount_tally`). Por defecto uno por núcleo.
+        """
+        chain = None
+        mempool = Mempool()
+        height = 0
+        block = None
+        checkpoints = []
+        truncated = False
+        for kind, payload in log.records():
+            if kind == GENESIS:
+                chain = Blockchain.construct([codec.decode(payload)])
+                chain._tally = None
+                block = chain.blocks[0]
+                height = 0
+            elif kind == BLOCK:
+                block = Block.decode(payload)
+                mempool.discard(block["transactions"], block.tickets)
+                chain._index_block(block)
+                height += 1
+            elif kind == TRUNCATE:
+                height = int(payload)
+                checkpoints = [c for c in chain.checkpoints + checkpoints if c["height"] <= height]
+                chain.checkpoints = []
+                truncated = True
+            elif kind == CHECKPOINT:
+                checkpoint = codec.decode(payload)
+                if truncated:
+                    checkpoints.append(checkpoint)
+                elif chain._matches_checkpoint(checkpoint, block):
+                    chain._add_checkpoint(checkpoint)
+            elif kind == VOTE:
+                try:
+                    mempool.add(codec.decode(payload), len(payload))
+                except ValueError:
+                    pass
+        if log.block_count() != height + 1:
+            log.rebuild_block_index()
+        chain.mempool = mempool
+        chain.attach_log(log)
+        if truncated:
+            chain._reindex(checkpoints, workers)
+        else:
+            chain._tally = chain._recount_tally(workers)
+        if chain.checkpoints:
+            chain.validated_height = chain.checkpoints[-1]["height"]
+        return chain
+
+    def attach_log(self, log):
+        """
+        Asocia un registro en disco a la cadena. A partir de entonces
+        cada bloque y cada voto nuevo se añade al final del registro en
+        lugar de reescribir la cadena entera, y los bloques se leen del
+        registro a medida que se consultan.
+
+        Si el registro está vacío se escribe en él el estado actual de
+        la cadena.
+
+        :param log: un :class:`blocklog.BlockLog`.
+        """
+        if log.is_empty():
+            log.append(GENESIS, self.blocks[0].encoded(log.format))
+            for block in self.blocks[1:]:
+                log.append(BLOCK, block.encoded(log.format))
+            for vote in self.mempool:
+                log.append(VOTE, codec.encode(vote, log.format))
+        self.log = log
+        self.blocks = BlockStore(log, Block.decode, lambda block: block.encoded(log.format),
+                                 self.blocks[0])
+
     @staticmethod
     def load(filename):
         """
         Carga desde un fichero la configuración de una blockchain y
         devuelve el objeto resultante.
 
+        El formato del fichero (JSON o binario, ver :mod:`codec`) se
+        detecta automáticamente.
+
         :param filename: el fichero desde el que cargar la
-            configuración.
+            configuración, o el directorio de su registro en disco.
         """
         try:
+            if os.path.isdir(filename):
+                return Blockchain.from_log(BlockLog(filename))
             if os.path.isfile(filename):
-                with open(filename, "r") as infile: 
-                    blocks = json.load(infile)
-                    loaded_blockchain = Blockchain(**blocks[0])
-                    loaded_blockchain.blocks = blocks
-                    return loaded_blockchain
+                with open(filename, "rb") as infile:
+                    return Blockchain.construct(codec.decode(infile.read()))
         except Exception as e:
             print(e)
             return None
 
-    def save(self, filename):
+    def save(self, filename, fmt="json"):
         """
         Guarda en un fichero la configuración de la *blockchain*.
 
         :param filename: El fichero donde guardar la configuración.
+        :param fmt: el formato, ``"json"`` o ``"binary"`` (ver
+            :mod:`codec`).
         """
         try:
-            with open(filename, "w") as outfile:
-                json.dump(self.blocks, outfile)
+            with open(filename, "wb") as outfile:
+                outfile.write(self.serialize_bytes(fmt))
         except Exception as e:
             print(e)
 
@@ -103,18 +567,39 @@ class Blockchain:
         formato serializable la clave del bloque génesis para poder
         guardarlo en disco duro o producir un *hash* de este bloque.
         """
-        serializable_genesis_block = self.blocks[0].copy()
-        serializable_genesis_block["public_key"] = serialize_key(serializable_genesis_block["public_key"])
-        return serializable_genesis_block
+        return json.loads(self.blocks[0].canonical)
 
     def serialize(self):
         """
         Serializa en formato JSON en una forma compacta.
 
+        Reutiliza la serialización canónica guardada en cada bloque en
+        lugar de volver a codificar la cadena entera.
+
         :return: una cadena representando el contenido de la
             *blockchain* apta para ser guardada en disco duro.
         """
-        return json.dumps([self.serialize_genesis_block()] + self.blocks[1:], sort_keys=True)
+        return self.serialize_bytes().decode()
+
+    def serialize_bytes(self, fmt="json"):
+        """
+        Igual que :meth:`serialize`, pero devuelve directamente los
+        bytes, aptos para ser enviados por la red.
+
+        :param fmt: el formato, ``"json"`` o ``"binary"`` (ver
+            :mod:`codec`).
+        """
+        if fmt == "binary":
+            return codec.with_header(self.binary_value())
+        return b"[" + b", ".join(block.canonical for block in self.blocks) + b"]"
+
+    def binary_value(self):
+        """
+        Devuelve la cadena codificada en binario y sin cabecera (ver
+        :func:`codec.encode_value`), reutilizando la codificación de
+        cada bloque.
+        """
+        return codec.list_value([block.binary for block in self.blocks])
 
     def pretty_serialize(self):
         """
@@ -128,54 +613,100 @@ class Blockchain:
         return pformat([self.serialize_genesis_block()] + self.blocks[1:])
         
     @staticmethod
-    def valid_proof(prev_proof, prev_hash, proof):
+    def valid_proof(prev_proof, prev_hash, proof, target=None):
         """
-        Devuelve si la cadena resultante de aplicar una función hash
-        sobre un conjunto de cadenas concatenadas es igual a un número
-        de ceros determinado por la dificultad.
+        Devuelve si el resultado de aplicar una función hash sobre un
+        conjunto de cadenas concatenadas, leído como un entero, es
+        menor que el objetivo.
+
+        :param target: el objetivo. Por defecto
+            :data:`INITIAL_TARGET`.
 
         :return: Si el argumento `proof` sirve como *proof-of-work*.
         """
-        proof_hash = sha256hash(f"{prev_proof}{prev_hash}{proof}")
-        return proof_hash[:DIFFICULTY] == "0" * DIFFICULTY
+        if target is None:
+            target = INITIAL_TARGET
+        return proof_value(prev_proof, prev_hash, proof) < target
+
+    def next_target(self):
+        """
+        :return: el objetivo que debe cumplir el siguiente bloque de la
+            cadena.
+        """
+        return _expected_target(self.blocks, len(self.blocks))
 
-    def create_new_block(self, proof):
+    def create_new_block(self, proof=None, sealer_key=None):
         """
         Crea un bloque nuevo en la blockchain.
 
-        Solo se creara un bloque si la prueba nueva es válida y hay
-        votos pendientes de guardar en un bloque.
+        Solo se creara un bloque si hay votos pendientes de guardar en
+        un bloque y, según el modo de consenso, la prueba nueva es
+        válida o la clave es la de uno de los selladores. El bloque incluye los
+        votos pendientes más antiguos dentro de los límites de tamaño
+        de la cola (ver :class:`mempool.Mempool`); el resto sigue
+        pendiente.
 
         :param proof: una prueba valida respecto al último bloque en la
-            cadena.
+            cadena, si la cadena usa *proof-of-work*.
+        :param sealer_key: la clave ECDSA privada de un sellador, si la
+            cadena usa *proof-of-authority*.
 
         :return: el bloque nuevo creado en caso de que se haya creado
             correctamente o un `dict` vacío en caso contrario.
         
         """
-        if not self.pending_votes:
+        if not self.mempool:
             return {}
 
-        prev_proof = self.blocks[-1]["proof"]
         prev_hash = self.hash(self.blocks[-1])
+        if self.consensus == "poa":
+            sealer = self.sealer_index(sealer_key) if sealer_key is not None else None
+            if sealer is None:
+                return {}
+        else:
+            target = self.next_target()
+            if proof is None or not self.valid_proof(self.blocks[-1]["proof"], prev_hash, proof, target):
+                return {}
 
-        if not self.valid_proof(prev_proof, prev_hash, proof):
-            return {}
-
-        new_block = {
+        votes = self.mempool.take_block()
+        tickets = [ticket_hash(vote) for vote in votes]
+        fields = {
             "index": len(self.blocks),
             "timestamp": time.time(),
-            "proof": proof,
-            "previous_hash": self.hash(self.blocks[-1]),
-            "transactions": self.pending_votes
+            "previous_hash": prev_hash,
+            "merkle_root": merkle_root(tickets),
+            "transactions": votes
         }
-
-        self.pending_votes = []
+        if self.consensus == "poa":
+            fields["sealer"] = sealer
+            fields["seal"] = sign(sealer_key, seal_message(fields)).hex()
+        else:
+            fields["proof"] = proof
+            fields["target"] = target
+        new_block = Block(fields)
+        new_block._tickets = tickets
 
         self.blocks.append(new_block)
+        self._index_block(new_block)
+        self._checkpoint()
 
         return self.blocks[-1]
 
+    def sealer_index(self, sealer_key):
+        """
+        Busca una clave entre los selladores de la cadena.
+
+        :param sealer_key: una clave ECDSA.
+
+        :return: la posición de la clave en la lista de selladores o
+            `None` si no es uno de ellos.
+        """
+        public_key = sealer_key.public_key()
+        for i, key in enumerate(self._sealer_keys or ()):
+            if key == public_key:
+                return i
+        return None
+
     def create_vote(self, options, proofs, signature):
         """
         Añade un voto a la lista de votos pendientes a ser añadidos a un
@@ -186,86 +717,499 @@ class Blockchain:
         :param signature: la firma digital.
 
         :return: El índice del bloque en el que va a estar el voto
+
+        :raises ValueError: si la cola de votos pendientes no admite el
+            voto.
         """
 
-        self.pending_votes.append({
+        vote = {
             "options": options,
             "proofs":  proofs,
             "signature": signature
-            })
+        }
+        payload = codec.encode(vote, self.log.format if self.log else "json")
+        self.mempool.add(vote, len(payload))
+        if self.log:
+            self.log.append(VOTE, payload)
 
-       	return self.blocks[-1]["index"] + 1
+        return self.blocks[-1]["index"] + 1
    
+    def _index_block(self, block):
+        """
+        Añade los votos de un bloque al índice de firmas. Como los
+        bloques se indexan en orden, cada firma queda apuntando a su
+        último voto.
+
+        Los votos se suman también al recuento cifrado y, si sustituyen
+        a un voto anterior de la misma firma, se le suma el inverso del
+        voto sustituido (ver :func:`crypto.invert_ballot`).
+
+        :param block: el bloque recién añadido a la cadena.
+        """
+        checkpoint_height = self.checkpoints[-1]["height"] if self.checkpoints else 0
+        ballots = []
+        undo = []
+        for position, vote in enumerate(block["transactions"]):
+            signature = vote["signature"]
+            previous = self.signature_index.get(signature)
+            undo.append((signature, previous))
+            if previous is None:
+                self._signatures_digest += signature_term(signature)
+            else:
+                if previous[0] <= checkpoint_height < block["index"]:
+                    self._superseded[signature] = previous
+                if self._tally is not None:
+                    if previous[0] == block["index"]:
+                        replaced = block["transactions"][previous[1]]
+                    else:
+                        replaced = self._vote_at(previous)
+                    ballots.append(invert_ballot(self.public_key, replaced["options"]))
+            ballots.append(vote["options"])
+            self.signature_index[signature] = (block["index"], position)
+        for position, ticket in enumerate(block.tickets):
+            self.ticket_index[ticket] = (block["index"], position)
+        self._vote_count += len(block["transactions"])
+        self._undo[block["index"]] = undo
+        self._undo.pop(block["index"] - UNDO_DEPTH, None)
+        if self._tally is not None and ballots:
+            self._tally = tally_votes(self.public_key,
+                                      itertools.chain([self._tally] if self._tally else [], ballots))
+
+    def _unindex_blocks(self, ancestor):
+        """
+        Deshace los cambios de los bloques posteriores a ``ancestor`` en
+        los índices de votos y en el recuento cifrado, del último al
+        primero. A cada firma se le devuelve su voto anterior, que
+        vuelve a sumarse al recuento en lugar del voto deshecho. El
+        coste depende de la cantidad de bloques deshechos y de los
+        posteriores al último punto de control, no del tamaño de la
+        cadena.
+
+        Los puntos de control posteriores a ``ancestor`` ya deben estar
+        descartados. Los bloques no se quitan de la cadena.
+
+        :param ancestor: la altura del último bloque que se mantiene.
+
+        :return: `False` si no se han guardado los cambios de alguno de
+            los bloques necesarios (ver :data:`UNDO_DEPTH`); entonces no
+            se modifica nada y hay que llamar a :meth:`_reindex`.
+        """
+        checkpoint_height = self.checkpoints[-1]["height"] if self.checkpoints else 0
+        if any(height not in self._undo for height in range(checkpoint_height + 1, len(self.blocks))):
+            return False
+
+        ballots = []
+        for height in range(len(self.blocks) - 1, ancestor, -1):
+            block = self.blocks[height]
+            undo = self._undo.pop(height)
+            for position in reversed(range(len(undo))):
+                signature, previous = undo[position]
+                ballots.append(invert_ballot(self.public_key, block["transactions"][position]["options"]))
+                if previous is None:
+                    del self.signature_index[signature]
+                    self._signatures_digest -= signature_term(signature)
+                else:
+                    self.signature_index[signature] = previous
+                    ballots.append(self._vote_at(previous)["options"])
+            for ticket in block.tickets:
+                self.ticket_index.pop(ticket, None)
+            self._vote_count -= len(undo)
+        if not self.signature_index:
+            self._tally = []
+        elif self._tally is not None and ballots:
+            self._tally = tally_votes(self.public_key, itertools.chain([self._tally], ballots))
+
+        #: Los votos sustituidos se recalculan respecto al último punto
+        #: de control, que puede ser anterior al que había.
+        self._superseded = {}
+        for height in range(checkpoint_height + 1, ancestor + 1):
+            for position, (signature, _) in enumerate(self._undo[height]):
+                if self.signature_index.get(signature) != (height, position):
+                    continue
+                location = (height, position)
+                while location is not None and location[0] > checkpoint_height:
+                    location = self._undo[location[0]][location[1]][1]
+                if location is not None:
+                    self._superseded[signature] = location
+        return True
+
+    def _reindex(self, checkpoints=(), workers=None):
+        """
+        Reconstruye los índices de votos recorriendo la cadena.
+
+        :param checkpoints: puntos de control leídos del registro que
+            se comprueban al llegar a su altura y, si coinciden, se
+            añaden a :attr:`checkpoints`.
+        :param workers: el número de procesos para el recuento cifrado.
+        """
+        self.signature_index = {}
+        self.ticket_index = {}
+        self._vote_count = 0
+        self._superseded = {}
+        self._signatures_digest = 0
+        self._tally = None
+        self._undo = {}
+        pending = list(checkpoints)
+        for block_index in range(1, len(self.blocks)):
+            block = self.blocks[block_index]
+            self._index_block(block)
+            while pending and pending[0]["height"] <= block_index:
+                checkpoint = pending.pop(0)
+                if self._matches_checkpoint(checkpoint, block):
+                    self._add_checkpoint(checkpoint)
+        self._tally = self._recount_tally(workers)
+
+    def _matches_checkpoint(self, checkpoint, block):
+        """
+        Comprueba que un punto de control corresponde al estado actual
+        de los índices, que acaban de procesar ``block``.
+        """
+        return (checkpoint["height"] == block["index"]
+                and checkpoint["block_hash"] == block.hash
+                and checkpoint["vote_count"] == self._vote_count
+                and checkpoint["signatures"] == digest_hex(self._signatures_digest))
+
+    def _add_checkpoint(self, checkpoint):
+        self.checkpoints.append(checkpoint)
+        self._superseded = {}
+
+    def _checkpoint(self):
+        """
+        Guarda un punto de control si la cadena ha llegado a una altura
+        múltiplo de :data:`checkpoint.CHECKPOINT_INTERVAL`.
+        """
+        height = len(self.blocks) - 1
+        if height % CHECKPOINT_INTERVAL:
+            return
+        if self.checkpoints and self.checkpoints[-1]["height"] >= height:
+            return
+        checkpoint = {
+            "height": height,
+            "block_hash": self.blocks[-1].hash,
+            "tally": [list(i) for i in self._tally],
+            "vote_count": self._vote_count,
+            "signatures": digest_hex(self._signatures_digest),
+        }
+        self._add_checkpoint(checkpoint)
+        if self.log:
+            self.log.append(CHECKPOINT, codec.encode(checkpoint, self.log.format))
+
+    def has_voted(self, signature):
+        """
+        Indica si una firma tiene algún voto en la cadena, ya sea en un
+        bloque o pendiente de añadirse a uno.
+
+        :param signature: la firma del votante.
+        """
+        return signature in self.signature_index or signature in self.mempool
+
+    def get_vote(self, signature):
+        """
+        Devuelve el último voto guardado en un bloque para una firma.
+
+        :param signature: la firma del votante.
+
+        :return: el voto o `None` si la firma no ha votado.
+        """
+        location = self.signature_index.get(signature)
+        if location is None:
+            return None
+        return self._vote_at(location)
+
+    def _vote_at(self, location):
+        block_index, position = location
+        return self.blocks[block_index]["transactions"][position]
+
+    def vote_receipt(self, signature=None, ticket=None):
+        """
+        Devuelve la prueba de inclusión de un voto en su bloque, que
+        cualquiera puede verificar con
+        :func:`merkle.verify_merkle_proof` sin descargar el bloque.
+
+        :param signature: la firma del votante; se usa su último voto.
+        :param ticket: el *hash* del voto (ver :func:`merkle.ticket_hash`).
+
+        :return: un `dict` con el índice y el *hash* del bloque, la raíz
+            de Merkle, el *hash* del voto y la prueba, o `None` si el
+            voto no está en ningún bloque.
+        """
+        if ticket is not None:
+            location = self.ticket_index.get(ticket)
+        else:
+            location = self.signature_index.get(signature)
+        if location is None:
+            return None
+        block_index, position = location
+        block = self.blocks[block_index]
+        if "merkle_root" not in block:
+            return None
+        return {
+            "block_index": block_index,
+            "block_hash": block.hash,
+            "merkle_root": block["merkle_root"],
+            "ticket": block.tickets[position],
+            "proof": merkle_proof(block.tickets, position),
+        }
+
+    def final_votes(self, start=1):
+        """
+        Recorre los votos que cuentan para el escrutinio: el último voto
+        de cada firma.
+
+        :param start: si se indica, solo se recorren los votos guardados
+            a partir de este bloque.
+
+        :return: un generador de votos.
+        """
+        for location in sorted(l for l in self.signature_index.values() if l[0] >= start):
+            yield self._vote_at(location)
+
+    def encrypted_tally(self):
+        """
+        Devuelve el recuento cifrado de los votos que cuentan para el
+        escrutinio (ver :func:`crypto.tally_votes`).
+
+        El recuento se actualiza al añadir cada bloque, así que
+        consultarlo no depende de la cantidad de votos. Se guarda en
+        disco con cada punto de control y, al cargar la cadena, se
+        recupera del último (ver :meth:`_recount_tally`).
+
+        :return: una lista con un texto cifrado por opción.
+        """
+        return list(self._tally)
+
+    def _recount_tally(self, workers=None):
+        """
+        Calcula el recuento cifrado a partir de los bloques (ver
+        :func:`crypto.parallel_tally`).
+
+        Se parte del recuento del último punto de control: se suman los
+        votos que cuentan guardados después de él y se restan los votos
+        que contaban en él y han sido sustituidos desde entonces.
+
+        :param workers: el número de procesos para la suma. Por defecto
+            uno por núcleo.
+
+        :return: una lista con un texto cifrado por opción.
+        """
+        key = self.public_key
+        if not self.checkpoints:
+            return parallel_tally(key, (vote["options"] for vote in self.final_votes()), workers)
+        checkpoint = self.checkpoints[-1]
+        ballots = itertools.chain(
+            [checkpoint["tally"]] if checkpoint["tally"] else [],
+            (vote["options"] for vote in self.final_votes(checkpoint["height"] + 1)),
+            (invert_ballot(key, self._vote_at(location)["options"])
+             for location in sorted(self._superseded.values())))
+        return parallel_tally(key, ballots, workers)
+
     def hash(self, block):
         """
         Produce un *hash* SHA256 de los datos de un bloque.
 
+        Para los bloques sellados (:class:`Block`) se devuelve el *hash*
+        ya calculado al crearlos.
+
         :param block: el bloque a pasar por la función *hash*.
 
         :return: el *hash* SHA256 de los datos del bloque.
         """
-        if block == self.blocks[0]:
-            return sha256hash(json.dumps(self.serialize_genesis_block()))
-        block_info = json.dumps(block, sort_keys=True)
-        return sha256hash(block_info)
+        if not isinstance(block, Block):
+            block = Block(block)
+        return block.hash
 
-    def proof_of_work(self):
+    def proof_of_work(self, workers=None, cancel=None):
         """
         Implementación sencilla de *proof-of-work* (POW): se concatena
         un número con el número anterior tal que, al aplicarle una
-        función hash, la cadena resultante empiece con tantos ceros
-        como defina la dificultad actual de la cadena.
+        función hash, el resultado sea menor que el objetivo actual de
+        la cadena (ver :meth:`next_target`).
 
-        :return: Un *proof-of-work* apropiado para crear un bloque
-            nuevo.
-        """
+        La búsqueda se reparte entre varios procesos mediante
+        :func:`miner.mine` y se detiene en cuanto uno de ellos encuentra
+        una prueba, cuando se activa ``cancel`` o cuando cambia el
+        último bloque de la cadena.
 
-        prev_proof = self.blocks[-1]["proof"]
-        prev_hash = self.hash(self.blocks[-1])
+        :param workers: el número de procesos mineros.
+        :param cancel: un objeto con un método ``is_set`` que permite
+            cancelar la búsqueda desde fuera.
 
-        proof = SystemRandom().randint(0, 2**128)
+        :return: Un *proof-of-work* apropiado para crear un bloque
+            nuevo o `None` si la búsqueda se ha cancelado.
+        """
 
-        while not self.valid_proof(prev_proof, prev_hash, proof):
-            proof += 1
+        tip = self.blocks[-1]
+        prev_proof = tip["proof"]
+        prev_hash = self.hash(tip)
 
-        return proof
+        return mine(prev_proof, prev_hash, self.next_target(), workers,
+                    _TipChanged(self, tip, cancel))
 
-    def validate(self):
+    def validate(self, full=False, workers=None):
         """
         Comprueba la validez de la blockchain: verifica que los bloques
-        tengan tiempos de creación ordenados en el tiempo y que todas
-        las pruebas para sus bloques sean válidas.
-        
+        estén encadenados por su *hash*, tengan tiempos de creación
+        ordenados en el tiempo, que todas las pruebas para sus bloques
+        sean válidas para el objetivo que corresponde a cada bloque (o,
+        en una cadena *proof-of-authority*, que los haya sellado uno de
+        sus selladores) y que cada papeleta tenga pruebas DCP y firma
+        válidas.
+
+        La cadena recuerda hasta qué altura ha sido validada
+        (:attr:`validated_height`), así que una validación normal solo
+        comprueba los bloques nuevos. Con ``full`` se vuelve a validar
+        la cadena entera repartiendo los bloques entre un conjunto de
+        procesos, y se comprueba también el recuento de cada punto de
+        control (ver :func:`checkpoint.verify_checkpoints`), del que
+        parte el recuento cifrado de la cadena.
+
+        :param full: si se debe validar la cadena completa.
+        :param workers: el número de procesos para la validación
+            completa. Por defecto uno por núcleo.
+
         :returns: `True` si la cadena válida, un `False` en cualquier
             otro caso.
         """
-        last_time = self.blocks[0]
-        for block_i in range(1, len(self.blocks)-1):
-            #: Verificamos que el pow es válido
-            prev_block = self.blocks[block_i-1]
-            block = self.blocks[block_i]
-            if not self.valid_proof(prev_block["proof"], self.hash(prev_block), block["proof"]):
-                return False
-            if block["timestamp"] < prev_block["timestamp"]:
-                return False
-        return True
+        key = serialize_key(self.public_key)
+        voters = self.voters
+        sealers = self.sealers
+
+        start = 1 if full else self.validated_height + 1
+        if not _valid_targets(self.blocks, start, len(self.blocks)):
+            return False
+
+        if full:
+            self.validated_height = 0
+            pairs = ((self.blocks[i - 1], self.blocks[i])
+                     for i in range(1, len(self.blocks)))
+            with multiprocessing.Pool(workers, _init_validator, (key, voters, sealers)) as pool:
+                valid = all(pool.imap(_validate_pair, pairs, VALIDATION_CHUNK_SIZE))
+            valid = valid and verify_checkpoints(self, self.checkpoints, workers)
+        else:
+            _init_validator(key, voters, sealers)
+            valid = all(_validate_pair((self.blocks[i - 1], self.blocks[i]))
+                        for i in range(self.validated_height + 1, len(self.blocks)))
+
+        if valid:
+            self.validated_height = len(self.blocks) - 1
+        return valid
 
     def update_chain(self, chains):
         """
         Actualiza la cadena con la cádena válida más larga a partir de
         una lista.
 
-        :param chains: Una lista de otras versiones de la misma blockchain
+        Las candidatas se prueban de la más larga a la más corta, y
+        solo las que sean más largas que la cadena actual. Para cada
+        una se busca el último bloque en común (mediante búsqueda
+        binaria sobre los *hashes*, que ya encadenan todo lo anterior),
+        se comprueban las cabeceras del tramo divergente y después sus
+        papeletas. La primera candidata válida sustituye a la cadena a
+        partir del bloque en común, de modo que el coste depende del
+        tamaño de la divergencia y no del de la cadena.
+
+        Los votos de los bloques descartados cuyo votante no tenga ningún
+        voto en la cadena nueva vuelven a la cola de votos pendientes.
+
+        :param chains: Una lista de otras versiones de la misma
+            blockchain, como objetos :class:`Blockchain` o como listas
+            de bloques.
+
+        :return: `True` si la cadena ha cambiado, `False` en cualquier
+            otro caso.
+        """
+        candidates = [c.blocks if isinstance(c, Blockchain) else c for c in chains]
+        candidates = sorted((c for c in candidates if len(c) > len(self.blocks)),
+                            key=len, reverse=True)
+        for candidate in candidates:
+            if _sealed(candidate, 0).hash != self.blocks[0].hash:
+                continue
+            ancestor = self._common_ancestor(candidate)
+            suffix = [_sealed(candidate, i) for i in range(ancestor + 1, len(candidate))]
+            if self._valid_suffix(ancestor, suffix):
+                self._splice(ancestor, suffix)
+                return True
+        return False
+
+    def _common_ancestor(self, blocks):
+        """
+        Busca la altura del último bloque que la cadena comparte con
+        otra versión de ella.
+
+        :param blocks: los bloques de la otra versión, con el mismo
+            bloque génesis.
+        """
+        low, high = 0, min(len(self.blocks), len(blocks)) - 1
+        while low < high:
+            middle = (low + high + 1) // 2
+            if _sealed(blocks, middle).hash == self.blocks[middle].hash:
+                low = middle
+            else:
+                high = middle - 1
+        return low
+
+    def _valid_suffix(self, ancestor, suffix):
+        """
+        Comprueba que un tramo de bloques puede continuar la cadena a
+        partir de la altura ``ancestor``: primero todas las cabeceras y
+        después las papeletas.
         """
-        get_longest = lambda x, y: x if len(x) > len(y) else y
+        pairs = list(zip([self.blocks[ancestor]] + suffix[:-1], suffix))
+        if not all(_valid_header(prev_block, block, self._sealer_keys) for prev_block, block in pairs):
+            return False
+        blocks = {height: self.blocks[height]
+                  for height in range(max(ancestor - RETARGET_WINDOW, 0), ancestor + 1)}
+        blocks.update((block["index"], block) for block in suffix)
+        if not _valid_targets(blocks, ancestor + 1, ancestor + 1 + len(suffix)):
+            return False
+        _init_validator(serialize_key(self.public_key), self.voters, self.sealers)
+        return all(_validate_pair(pair) for pair in pairs)
 
-        valid_chains = filter(Blockchain.validate, chains)
+    def _splice(self, ancestor, suffix):
+        """
+        Sustituye los bloques posteriores a ``ancestor`` por ``suffix``,
+        que ya ha sido validado. Los cambios de los bloques sustituidos
+        se deshacen con :meth:`_unindex_blocks` y solo si no es posible
+        se reconstruyen los índices.
+        """
+        removed = self.blocks[ancestor + 1:]
+        if removed:
+            self.checkpoints = [c for c in self.checkpoints if c["height"] <= ancestor]
+            undone = self._unindex_blocks(ancestor)
+            del self.blocks[ancestor + 1:]
+            if not undone:
+                self._reindex()
 
-        longest_chain = reduce(get_longest, valid_chains)
+        for block in suffix:
+            self.blocks.append(block)
+            self._index_block(block)
+            self.mempool.discard(block["transactions"], block.tickets)
+            self._checkpoint()
 
-        if len(longest_chain.blocks) > self.blocks:
-            self.blocks.extend(other[len(self.blocks):])
+        # Un voto huérfano vuelve a la cola si no está en la nueva cadena y
+        # la firma no ha votado después de ``ancestor``. Un voto pendiente
+        # es más reciente que los de los bloques sustituidos, salvo que
+        # lo haya vuelto a poner aquí un bloque anterior.
+        replayed = set()
+        for block in removed:
+            for vote, ticket in zip(block["transactions"], block.tickets):
+                signature = vote["signature"]
+                if ticket in self.ticket_index:
+                    continue
+                location = self.signature_index.get(signature)
+                if location is not None and location[0] > ancestor:
+                    continue
+                if signature in self.mempool:
+                    if signature not in replayed:
+                        continue
+                    self.mempool.remove([signature])
+                try:
+                    self.create_vote(**vote)
+                except ValueError:
+                    continue
+                replayed.add(signature)
 
+        self.validated_height = len(self.blocks) - 1
 
     def __repr__(self):
         return self.pretty_serialize()
@@ -291,9 +1235,39 @@ class Blockchain:
     def get_end_time(self):
         return self.blocks[0].get("end_time")
 
+    def get_consensus(self):
+        return self.blocks[0].get("consensus", "pow")
+
+    def get_sealers(self):
+        return self.blocks[0].get("sealers")
+
+    def iter_votes(self, start=1, stop=None, signatures=None):
+        """
+        Recorre los votos guardados en bloques sin construir una lista
+        con todos ellos.
+
+        :param start: el índice del primer bloque a recorrer.
+        :param stop: el índice del bloque donde parar (sin incluirlo).
+            Por defecto, hasta el final de la cadena.
+        :param signatures: si se indica, solo se devuelven los votos
+            cuya firma esté en este conjunto.
+
+        :return: un generador de votos.
+        """
+        stop = len(self.blocks) if stop is None else min(stop, len(self.blocks))
+        for block_index in range(max(start, 1), stop):
+            for vote in self.blocks[block_index]["transactions"]:
+                if signatures is None or vote["signature"] in signatures:
+                    yield vote
+
     def get_votes(self):
-        votes = [b.get("transactions") for b in self.blocks[1:]]
-        return reduce(lambda x, y: x + y, votes) if votes else []
+        return list(self.iter_votes())
+
+    def get_pending_votes(self):
+        return list(self.mempool)
+
+    def get_vote_count(self):
+        return self._vote_count
 
     name = property(get_name)
     public_key = property(get_public_key)
@@ -301,4 +1275,8 @@ class Blockchain:
     start_time = property(get_start_time)
     end_time = property(get_end_time)
     voters = property(get_voters)
+    consensus = property(get_consensus)
+    sealers = property(get_sealers)
     votes = property(get_votes)
+    pending_votes = property(get_pending_votes)
+    vote_count = property(get_vote_count)
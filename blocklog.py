@@ -0,0 +1,353 @@
+"""
+Aquí se encuentra el registro en disco de una *blockchain*: un fichero
+de solo añadido, dividido en segmentos, donde se escribe cada bloque y
+cada voto pendiente en el momento en que se crea.
+
+Cada registro se guarda con una cabecera de 5 bytes (el tipo de
+registro y la longitud del contenido) seguida de su contenido. Cuando
+un segmento supera :data:`SEGMENT_SIZE` se empieza uno nuevo y se
+actualiza el fichero índice, que contiene la lista ordenada de
+segmentos.
+
+Además, el fichero :data:`BLOCK_INDEX_FILE` guarda para cada altura de
+la cadena el segmento, la posición y la longitud de su bloque. Los
+segmentos se leen mapeados en memoria, así que :class:`BlockStore`
+puede decodificar un bloque cualquiera sin leer el resto del registro.
+"""
+
+import json
+import mmap
+import os
+import struct
+
+from collections import OrderedDict
+
+
+SEGMENT_SIZE = 16 * 2**20
+"""
+El tamaño en bytes a partir del cual se empieza un segmento nuevo.
+"""
+
+INDEX_FILE = "index.json"
+"""
+El nombre del fichero índice dentro del directorio del registro.
+"""
+
+BLOCK_INDEX_FILE = "blocks.idx"
+"""
+El nombre del fichero con la posición de cada bloque dentro de los
+segmentos. Si no existe se reconstruye recorriendo los segmentos.
+"""
+
+BLOCK_CACHE_SIZE = 64
+"""
+La cantidad de bloques decodificados que :class:`BlockStore` mantiene
+en memoria.
+"""
+
+GENESIS = 0
+"""Tipo de registro: el bloque génesis."""
+BLOCK = 1
+"""Tipo de registro: un bloque."""
+VOTE = 2
+"""Tipo de registro: un voto pendiente de ser añadido a un bloque."""
+TRUNCATE = 3
+"""
+Tipo de registro: los bloques posteriores a la altura indicada se
+descartan (tras cambiar a otra versión de la cadena).
+"""
+CHECKPOINT = 4
+"""
+Tipo de registro: un punto de control de la cadena (ver
+:mod:`checkpoint`).
+"""
+
+_HEADER = struct.Struct(">BI")
+_BLOCK_ENTRY = struct.Struct(">IQI")
+
+
+class BlockLog:
+    """
+    Registro segmentado de solo añadido para una elección.
+
+    :param directory: el directorio donde se guardan los segmentos y el
+        índice. Se crea si no existe.
+    :param segment_size: el tamaño máximo aproximado de cada segmento.
+    :param fmt: el formato en el que se escriben los registros nuevos,
+        ``"json"`` o ``"binary"`` (ver :mod:`codec`). Al leer, el
+        formato de cada registro se detecta automáticamente.
+    """
+
+    def __init__(self, directory, segment_size=SEGMENT_SIZE, fmt="json"):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.format = fmt
+        os.makedirs(directory, exist_ok=True)
+        try:
+            with open(self._path(INDEX_FILE)) as f:
+                self.segments = json.load(f)["segments"]
+        except FileNotFoundError:
+            self.segments = []
+        self._file = None
+        #: número de segmento -> segmento mapeado en memoria
+        self._maps = {}
+        self._block_index = None
+        if os.path.isfile(self._path(BLOCK_INDEX_FILE)):
+            self._open_block_index()
+        else:
+            self.rebuild_block_index()
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _save_index(self):
+        """
+        Reescribe el índice de segmentos de forma atómica.
+        """
+        tmp_path = self._path(INDEX_FILE + ".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump({"segments": self.segments}, f)
+        os.replace(tmp_path, self._path(INDEX_FILE))
+
+    def _open_block_index(self):
+        if self._block_index:
+            self._block_index.close()
+        self._block_index = open(self._path(BLOCK_INDEX_FILE), "r+b")
+        self._block_count = os.path.getsize(self._path(BLOCK_INDEX_FILE)) // _BLOCK_ENTRY.size
+
+    def rebuild_block_index(self):
+        """
+        Reconstruye el fichero con la posición de cada bloque
+        recorriendo todos los segmentos.
+        """
+        entries = []
+        for kind, segment, offset, length in self._scan():
+            if kind in (GENESIS, BLOCK):
+                entries.append(_BLOCK_ENTRY.pack(segment, offset, length))
+            elif kind == TRUNCATE:
+                del entries[int(self._read(segment, offset, length)) + 1:]
+        tmp_path = self._path(BLOCK_INDEX_FILE + ".tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(b"".join(entries))
+        os.replace(tmp_path, self._path(BLOCK_INDEX_FILE))
+        self._open_block_index()
+
+    def _roll_segment(self):
+        """
+        Cierra el segmento actual y empieza uno nuevo.
+        """
+        if self._file:
+            self._file.close()
+        self.segments.append("{:08d}.log".format(len(self.segments)))
+        self._save_index()
+        self._file = open(self._path(self.segments[-1]), "ab")
+
+    def _open_last_segment(self):
+        """
+        Abre el último segmento para escritura, descartando antes un
+        posible registro incompleto al final.
+        """
+        path = self._path(self.segments[-1])
+        end = 0
+        with open(path, "rb") as f:
+            data = f.read()
+        while end + _HEADER.size <= len(data):
+            _, length = _HEADER.unpack_from(data, end)
+            if end + _HEADER.size + length > len(data):
+                break
+            end += _HEADER.size + length
+        if end != len(data):
+            mapped = self._maps.pop(len(self.segments) - 1, None)
+            if mapped is not None:
+                mapped.close()
+            with open(path, "r+b") as f:
+                f.truncate(end)
+        self._file = open(path, "ab")
+
+    def _map(self, segment, end):
+        """
+        Devuelve un segmento mapeado en memoria. Si el segmento ha
+        crecido desde que se mapeó y ``end`` queda fuera, se vuelve a
+        mapear.
+        """
+        mapped = self._maps.get(segment)
+        if mapped is None or len(mapped) < end:
+            if mapped is not None:
+                mapped.close()
+            with open(self._path(self.segments[segment]), "rb") as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._maps[segment] = mapped
+        return mapped
+
+    def _read(self, segment, offset, length):
+        return self._map(segment, offset + length)[offset:offset + length]
+
+    def _scan(self):
+        """
+        Recorre las cabeceras de todos los registros completos.
+
+        :return: un generador de tuplas (tipo, segmento, posición del
+            contenido, longitud).
+        """
+        for segment, name in enumerate(self.segments):
+            size = os.path.getsize(self._path(name))
+            if not size:
+                continue
+            data = self._map(segment, size)
+            offset = 0
+            while offset + _HEADER.size <= size:
+                kind, length = _HEADER.unpack_from(data, offset)
+                offset += _HEADER.size
+                if offset + length > size:
+                    break
+                yield kind, segment, offset, length
+                offset += length
+
+    def is_empty(self):
+        """
+        :return: `True` si el registro no contiene ningún segmento.
+        """
+        return not self.segments
+
+    def append(self, kind, payload):
+        """
+        Añade un registro al final del segmento actual.
+
+        :param kind: el tipo de registro (:data:`GENESIS`,
+            :data:`BLOCK`, :data:`VOTE`, :data:`TRUNCATE` o
+            :data:`CHECKPOINT`).
+        :param payload: el contenido del registro en bytes.
+        """
+        if self._file is None:
+            if self.segments:
+                self._open_last_segment()
+            else:
+                self._roll_segment()
+        if self._file.tell() and self._file.tell() + len(payload) > self.segment_size:
+            self._roll_segment()
+        offset = self._file.tell() + _HEADER.size
+        self._file.write(_HEADER.pack(kind, len(payload)) + payload)
+        self._file.flush()
+
+        if kind in (GENESIS, BLOCK):
+            self._block_index.seek(self._block_count * _BLOCK_ENTRY.size)
+            self._block_index.write(_BLOCK_ENTRY.pack(len(self.segments) - 1, offset, len(payload)))
+            self._block_index.flush()
+            self._block_count += 1
+        elif kind == TRUNCATE:
+            self._block_count = int(payload) + 1
+            self._block_index.truncate(self._block_count * _BLOCK_ENTRY.size)
+
+    def block_count(self):
+        """
+        :return: la cantidad de bloques guardados, incluido el génesis.
+        """
+        return self._block_count
+
+    def block_payload(self, height):
+        """
+        Lee el contenido del registro de un bloque.
+
+        :param height: la altura del bloque.
+
+        :return: el bloque codificado, en bytes.
+        """
+        self._block_index.seek(height * _BLOCK_ENTRY.size)
+        segment, offset, length = _BLOCK_ENTRY.unpack(self._block_index.read(_BLOCK_ENTRY.size))
+        return self._read(segment, offset, length)
+
+    def records(self):
+        """
+        Recorre en orden todos los registros guardados.
+
+        Un registro incompleto al final del último segmento (por
+        ejemplo tras una interrupción durante la escritura) se ignora.
+
+        :return: un generador de tuplas (tipo, contenido).
+        """
+        for kind, segment, offset, length in self._scan():
+            yield kind, self._read(segment, offset, length)
+
+    def close(self):
+        """
+        Cierra el segmento abierto para escritura, el índice de bloques
+        y los segmentos mapeados en memoria.
+        """
+        if self._file:
+            self._file.close()
+            self._file = None
+        for mapped in self._maps.values():
+            mapped.close()
+        self._maps = {}
+        self._block_index.close()
+
+
+class BlockStore:
+    """
+    Secuencia de los bloques de un :class:`BlockLog` con acceso
+    aleatorio por altura: ``store[i]`` lee y decodifica solo el bloque
+    ``i``. Los últimos bloques consultados se mantienen en una caché y
+    el bloque génesis siempre está en memoria.
+
+    Añadir un bloque con ``append`` o descartar los últimos con
+    ``del store[i:]`` escribe el registro correspondiente en disco.
+
+    :param log: el registro en disco.
+    :param decode: una función que convierte el contenido de un
+        registro en un bloque.
+    :param encode: una función que convierte un bloque en el contenido
+        de un registro.
+    :param genesis: el bloque génesis.
+    :param cache_size: la cantidad de bloques en la caché.
+    """
+
+    def __init__(self, log, decode, encode, genesis, cache_size=BLOCK_CACHE_SIZE):
+        self.log = log
+        self.decode = decode
+        self.encode = encode
+        self.genesis = genesis
+        self.cache_size = cache_size
+        #: altura -> bloque, del menos al más reciente
+        self._cache = OrderedDict()
+
+    def _remember(self, height, block):
+        self._cache[height] = block
+        self._cache.move_to_end(height)
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def __len__(self):
+        return self.log.block_count()
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("No hay ningún bloque a esa altura")
+        if i == 0:
+            return self.genesis
+        block = self._cache.get(i)
+        if block is None:
+            block = self.decode(self.log.block_payload(i))
+        self._remember(i, block)
+        return block
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def append(self, block):
+        self.log.append(BLOCK, self.encode(block))
+        self._remember(len(self) - 1, block)
+
+    def __delitem__(self, i):
+        if not isinstance(i, slice) or i.stop is not None or i.step is not None:
+            raise TypeError("Solo se pueden descartar los últimos bloques")
+        start = max(i.indices(len(self))[0], 1)
+        if start >= len(self):
+            return
+        self.log.append(TRUNCATE, str(start - 1).encode())
+        for height in [h for h in self._cache if h >= start]:
+            del self._cache[height]
@@ -0,0 +1,115 @@
+"""
+Aquí se encuentran los puntos de control de una *blockchain*.
+
+Cada :data:`CHECKPOINT_INTERVAL` bloques la cadena guarda en su
+registro en disco un punto de control con:
+
+* ``height``: la altura del bloque.
+* ``block_hash``: el *hash* de ese bloque.
+* ``tally``: el recuento cifrado (ver :func:`crypto.tally_votes`) de
+  los votos que cuentan a esa altura, es decir, del último voto de cada
+  firma.
+* ``vote_count``: la cantidad de votos guardados en bloques hasta esa
+  altura.
+* ``signatures``: el resumen del conjunto de firmas que han votado
+  (ver :func:`signatures_digest`).
+
+Al reiniciar, validar o hacer el recuento basta con partir del último
+punto de control y procesar los bloques posteriores.
+"""
+
+import hashlib
+
+from crypto import parallel_tally
+
+
+CHECKPOINT_INTERVAL = 100
+"""
+La cantidad de bloques entre dos puntos de control.
+"""
+
+_DIGEST_MODULUS = 2**256
+
+
+def signature_term(signature):
+    """
+    :return: el sumando de una firma en :func:`signatures_digest`.
+    """
+    return int.from_bytes(hashlib.sha256(signature.encode()).digest(), "big")
+
+
+def digest_hex(value):
+    """
+    :return: un resumen en forma de entero, en hexadecimal.
+    """
+    return "{:064x}".format(value % _DIGEST_MODULUS)
+
+
+def signatures_digest(signatures):
+    """
+    Calcula el resumen de un conjunto de firmas: la suma, módulo
+    :math:`2^{256}`, de sus *hashes* SHA256. No depende del orden de
+    las firmas y se puede actualizar con cada firma nueva sin recorrer
+    las anteriores.
+
+    :param signatures: un iterable de firmas distintas.
+
+    :return: el resumen en hexadecimal.
+    """
+    return digest_hex(sum(signature_term(signature) for signature in signatures))
+
+
+def verify_checkpoint(blockchain, checkpoint, workers=None):
+    """
+    Comprueba un punto de control recorriendo la cadena desde el
+    principio hasta su altura y volviendo a calcular el recuento. Sirve
+    para auditar un punto de control sin confiar en el registro que lo
+    contiene.
+
+    :param blockchain: la cadena.
+    :param checkpoint: el punto de control, como un `dict`.
+    :param workers: el número de procesos para volver a calcular el
+        recuento (ver :func:`crypto.parallel_tally`).
+
+    :return: `True` si el punto de control corresponde a la cadena,
+        `False` en cualquier otro caso.
+    """
+    return verify_checkpoints(blockchain, [checkpoint], workers)
+
+
+def verify_checkpoints(blockchain, checkpoints, workers=None):
+    """
+    Comprueba varios puntos de control, como :func:`verify_checkpoint`,
+    recorriendo la cadena una sola vez.
+
+    :param blockchain: la cadena.
+    :param checkpoints: los puntos de control, de menor a mayor altura.
+    :param workers: el número de procesos para volver a calcular cada
+        recuento (ver :func:`crypto.parallel_tally`).
+
+    :return: `True` si todos los puntos de control corresponden a la
+        cadena, `False` en cualquier otro caso.
+    """
+    final_votes = {}
+    vote_count = 0
+    previous = 0
+    for checkpoint in checkpoints:
+        height = checkpoint["height"]
+        if height < previous or height >= len(blockchain.blocks):
+            return False
+        if blockchain.blocks[height].hash != checkpoint["block_hash"]:
+            return False
+
+        for vote in blockchain.iter_votes(previous + 1, height + 1):
+            final_votes[vote["signature"]] = vote["options"]
+            vote_count += 1
+        previous = height
+        if vote_count != checkpoint["vote_count"]:
+            return False
+        if signatures_digest(final_votes) != checkpoint["signatures"]:
+            return False
+
+        tally = parallel_tally(blockchain.public_key, final_votes.values(), workers)
+        if [list(i) for i in tally] != [list(i) for i in checkpoint["tally"]]:
+            return False
+    return True
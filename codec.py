@@ -0,0 +1,250 @@
+"""
+Aquí se encuentra el formato binario utilizado para guardar y enviar
+bloques, votos y claves.
+
+JSON escribe cada entero de 2048 bits como una cadena decimal de unos
+620 caracteres. Este formato los escribe en binario: cada valor va
+precedido de un byte que indica su tipo, los enteros se escriben en
+*big-endian* precedidos de su longitud y las listas de enteros no
+negativos (textos cifrados, pruebas DCP) se escriben como un vector de
+enteros de ancho fijo. Los valores decodificados son los mismos que
+devolvería JSON, así que la serialización canónica y los *hashes* de
+los bloques no cambian.
+
+Un documento binario empieza por :data:`MAGIC` y un byte de versión,
+lo que permite distinguirlo de un documento JSON.
+"""
+
+import json
+import struct
+
+
+MAGIC = b"TFGB"
+"""
+Los bytes con los que empieza todo documento binario.
+"""
+
+VERSION = 1
+"""
+La versión del formato binario.
+"""
+
+FORMATS = ("json", "binary")
+"""
+Los formatos de serialización disponibles.
+"""
+
+_NONE = 0x00
+_FALSE = 0x01
+_TRUE = 0x02
+_INT = 0x03
+_NEG_INT = 0x04
+_FLOAT = 0x05
+_STR = 0x06
+_BYTES = 0x07
+_LIST = 0x08
+_DICT = 0x09
+_INT_ARRAY = 0x0A
+
+_U16 = struct.Struct(">H")
+_U32 = struct.Struct(">I")
+_FLOAT64 = struct.Struct(">d")
+
+
+def _int_bytes(n):
+    return n.to_bytes((n.bit_length() + 7) // 8, "big")
+
+
+def encode_value(obj):
+    """
+    Codifica un valor sin la cabecera del formato.
+
+    :param obj: un valor compuesto de `None`, `bool`, `int`, `float`,
+        `str`, `bytes`, listas, tuplas y `dicts` con claves `str`.
+
+    :return: los bytes del valor.
+
+    :raises TypeError: si el valor contiene un tipo no soportado.
+    """
+    if obj is None:
+        return bytes((_NONE,))
+    if obj is True:
+        return bytes((_TRUE,))
+    if obj is False:
+        return bytes((_FALSE,))
+    if isinstance(obj, int):
+        raw = _int_bytes(abs(obj))
+        return bytes((_INT if obj >= 0 else _NEG_INT,)) + _U16.pack(len(raw)) + raw
+    if isinstance(obj, float):
+        return bytes((_FLOAT,)) + _FLOAT64.pack(obj)
+    if isinstance(obj, str):
+        raw = obj.encode()
+        return bytes((_STR,)) + _U32.pack(len(raw)) + raw
+    if isinstance(obj, bytes):
+        return bytes((_BYTES,)) + _U32.pack(len(obj)) + obj
+    if isinstance(obj, (list, tuple)):
+        if len(obj) > 1 and all(type(i) is int and i >= 0 for i in obj):
+            width = max(1, (max(obj).bit_length() + 7) // 8)
+            return (bytes((_INT_ARRAY,)) + _U32.pack(len(obj)) + _U16.pack(width)
+                    + b"".join(i.to_bytes(width, "big") for i in obj))
+        return list_value([encode_value(i) for i in obj])
+    if isinstance(obj, dict):
+        return dict_value((key, encode_value(value)) for key, value in obj.items())
+    raise TypeError("No se puede codificar un valor de tipo {}".format(type(obj).__name__))
+
+
+def list_value(encoded_items):
+    """
+    Construye una lista a partir de valores ya codificados con
+    :func:`encode_value`. Permite reutilizar codificaciones guardadas.
+
+    :param encoded_items: una lista de valores codificados.
+    """
+    return bytes((_LIST,)) + _U32.pack(len(encoded_items)) + b"".join(encoded_items)
+
+
+def dict_value(encoded_pairs):
+    """
+    Construye un `dict` a partir de pares (clave, valor codificado).
+
+    :param encoded_pairs: un iterable de pares (`str`, bytes).
+    """
+    encoded_pairs = list(encoded_pairs)
+    return (bytes((_DICT,)) + _U32.pack(len(encoded_pairs))
+            + b"".join(encode_value(str(key)) + value for key, value in encoded_pairs))
+
+
+def with_header(encoded_value):
+    """
+    Añade la cabecera del formato a un valor codificado.
+    """
+    return MAGIC + bytes((VERSION,)) + encoded_value
+
+
+def _decode(data, offset):
+    tag = data[offset]
+    offset += 1
+    if tag == _NONE:
+        return None, offset
+    if tag == _TRUE:
+        return True, offset
+    if tag == _FALSE:
+        return False, offset
+    if tag == _INT or tag == _NEG_INT:
+        length, = _U16.unpack_from(data, offset)
+        offset += 2
+        n = int.from_bytes(data[offset:offset + length], "big")
+        return (n if tag == _INT else -n), offset + length
+    if tag == _FLOAT:
+        return _FLOAT64.unpack_from(data, offset)[0], offset + 8
+    if tag == _STR or tag == _BYTES:
+        length, = _U32.unpack_from(data, offset)
+        offset += 4
+        raw = bytes(data[offset:offset + length])
+        return (raw.decode() if tag == _STR else raw), offset + length
+    if tag == _LIST:
+        count, = _U32.unpack_from(data, offset)
+        offset += 4
+        items = []
+        for _ in range(count):
+            item, offset = _decode(data, offset)
+            items.append(item)
+        return items, offset
+    if tag == _DICT:
+        count, = _U32.unpack_from(data, offset)
+        offset += 4
+        items = {}
+        for _ in range(count):
+            key, offset = _decode(data, offset)
+            items[key], offset = _decode(data, offset)
+        return items, offset
+    if tag == _INT_ARRAY:
+        count, = _U32.unpack_from(data, offset)
+        width, = _U16.unpack_from(data, offset + 4)
+        offset += 6
+        end = offset + count * width
+        return [int.from_bytes(data[i:i + width], "big")
+                for i in range(offset, end, width)], end
+    raise ValueError("Tipo de valor desconocido en el formato binario: {}".format(tag))
+
+
+def is_binary(data):
+    """
+    :return: `True` si los bytes son un documento en formato binario.
+    """
+    return bytes(data[:len(MAGIC)]) == MAGIC
+
+
+def dumps(obj):
+    """
+    Codifica un valor en formato binario, con cabecera.
+    """
+    return with_header(encode_value(obj))
+
+
+def loads(data):
+    """
+    Decodifica un documento en formato binario.
+
+    :raises ValueError: si el documento no está en formato binario o es
+        de una versión desconocida.
+    """
+    data = memoryview(data)
+    if not is_binary(data):
+        raise ValueError("El documento no está en formato binario")
+    version = data[len(MAGIC)]
+    if version != VERSION:
+        raise ValueError("Versión del formato binario no soportada: {}".format(version))
+    obj, _ = _decode(data, len(MAGIC) + 1)
+    return obj
+
+
+def encode(obj, fmt="json"):
+    """
+    Codifica un valor en el formato indicado.
+
+    :param obj: el valor a codificar.
+    :param fmt: ``"json"`` o ``"binary"``.
+
+    :return: los bytes del documento.
+    """
+    if fmt == "binary":
+        return dumps(obj)
+    if fmt == "json":
+        return json.dumps(obj, sort_keys=True).encode()
+    raise ValueError("Formato desconocido: {}".format(fmt))
+
+
+def decode(data):
+    """
+    Decodifica un documento en cualquiera de los formatos, detectando
+    cuál es por su cabecera.
+
+    :param data: los bytes del documento.
+    """
+    if is_binary(data):
+        return loads(data)
+    return json.loads(bytes(data))
+
+
+def pack_message(header, obj, fmt="json"):
+    """
+    Construye un mensaje para la red de nodos: una cabecera de texto
+    (``PEER``, ``VOTE``...) seguida de un espacio y del contenido.
+
+    :param header: la cabecera del mensaje.
+    :param obj: el contenido del mensaje.
+    :param fmt: el formato del contenido.
+    """
+    return header.encode() + b" " + encode(obj, fmt)
+
+
+def unpack_message(message):
+    """
+    Separa la cabecera y el contenido de un mensaje construido con
+    :func:`pack_message`, en cualquiera de los formatos.
+
+    :return: una tupla (cabecera, contenido).
+    """
+    header, _, payload = message.partition(b" ")
+    return header.decode(), decode(payload)
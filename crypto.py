@@ -5,19 +5,28 @@ cifrado ElGamal y un conjunto de utilidades que permiten trabajar con
 """
 
 import hashlib
+import itertools
 import json
+import multiprocessing
+import os
+import sys
 
+from collections import deque
+from functools import lru_cache
 from math import ceil, floor, log, sqrt
 from random import SystemRandom
 from time import sleep
 
-from gmpy2 import is_prime
-
 from Crypto.PublicKey import ElGamal
 from Crypto import Random
 from Crypto.Random import random
 
-from shamir import make_shares, recover_secret
+import arith
+
+from arith import invert, jacobi, number, powmod
+from cryptoutils import DiscreteLogSolver, FixedBase, multi_exp, multi_pow
+from groups import DEFAULT_GROUPS, get_group
+from shamir import lagrange_coefficients, make_shares
 from signature import is_valid_signature
 
 """
@@ -68,19 +77,146 @@ def reconstruct_key(k_dict):
     y = k_dict.get("y")
     x = k_dict.get("x")
     if x:
-        return ElGamal.construct((p, g, y, x))
+        return int_key(ElGamal.construct((p, g, y, x)))
     else:
-        return ElGamal.construct((p, g, y))
+        return int_key(ElGamal.construct((p, g, y)))
+
+def int_key(key):
+    """
+    Convierte en enteros de Python los componentes de una clave
+    ElGamal. pycryptodome los guarda como ``Integer``, que no se pueden
+    usar como clave de las cachés de este módulo (ver
+    :func:`fixed_base`) ni en las operaciones de :mod:`arith`.
+
+    :param key: La clave ElGamal. Se modifica en el sitio.
+
+    :return: La misma clave.
+    """
+    for component in ("p", "g", "y", "x"):
+        if hasattr(key, component):
+            setattr(key, component, int(getattr(key, component)))
+    return key
+
+FIXED_BASE_CACHE_SIZE = 64
+"""
+La cantidad de tablas de :func:`fixed_base` que se mantienen en
+memoria. Cada clave usa dos: la de g y la de su clave pública.
+"""
+
+@lru_cache(maxsize=FIXED_BASE_CACHE_SIZE)
+def fixed_base(base, p, backend):
+    """
+    Devuelve la tabla de potencias de una base fija (ver
+    :class:`cryptoutils.FixedBase`). Las tablas se construyen una vez y
+    se guardan en caché, de modo que las claves de un mismo grupo
+    comparten la tabla de g.
+
+    :param base: La base.
+    :param p: El módulo primo.
+    :param backend: El *backend* aritmético con el que se construye la
+        tabla (ver :mod:`arith`). Forma parte de la clave de la caché.
+    """
+    return FixedBase(base, p)
+
+def precompute(key):
+    """
+    Construye (o recupera de la caché) las tablas de potencias de g y
+    de la clave pública de una clave ElGamal. Se llama al crear o
+    cargar una elección, así que cifrar y verificar votos después no
+    tiene que esperar a construirlas.
+
+    :param key: La clave ElGamal.
 
-def generate_ElGamal_key(keysize):
+    :returns: Una tupla con las tablas de g y de la clave pública.
+    """
+    p = int(key.p)
+    return (fixed_base(int(key.g), p, arith.BACKEND),
+            fixed_base(int(key.y), p, arith.BACKEND))
+
+def generate_ElGamal_key(keysize, group=None):
     """
     Genera una clave ElGamal del tamaño especificado.
 
+    Si hay un grupo precalculado para ese tamaño (ver :mod:`groups`) la
+    clave se genera sobre él: solo hay que elegir x y calcular
+    :math:`g^x` con la tabla de potencias de g, que comparten todas las
+    claves del grupo. Si no, se busca un primo seguro nuevo, lo que con
+    claves grandes puede tardar minutos (ver :class:`KeyPool`).
+
     :param keysize: El tamaño de la clave.
+    :param group: El nombre de un grupo de :data:`groups.GROUPS`. Por
+        defecto el de :data:`groups.DEFAULT_GROUPS` para ese tamaño.
 
     :returns: Una clave ElGamal.
+
+    :raises ValueError: Si el grupo no existe.
+    """
+    if group is None:
+        group = DEFAULT_GROUPS.get(keysize)
+        if group is None:
+            return int_key(ElGamal.generate(keysize, Random.new().read))
+    p, g, q = get_group(group)
+    x = SystemRandom().randrange(2, q)
+    y = fixed_base(g, p, arith.BACKEND).pow(x)
+    return int_key(ElGamal.construct((p, g, y, x)))
+
+KEY_POOL_SIZE = 4
+"""
+La cantidad de claves que :class:`KeyPool` mantiene generadas.
+"""
+
+def _fill_key_pool(queue, keysize, group):
+    while True:
+        queue.put(serialize_key(generate_ElGamal_key(keysize, group)))
+
+class KeyPool:
     """
-    return ElGamal.generate(keysize, Random.new().read)
+    Un conjunto de claves ElGamal generadas de antemano en un proceso
+    aparte, para que crear una elección no tenga que esperar a
+    generar la suya. El proceso se bloquea cuando ya hay ``size``
+    claves esperando y vuelve a generar cuando se saca alguna.
+
+    Con los grupos precalculados generar una clave ya es rápido, así
+    que es útil sobre todo con tamaños sin grupo, que necesitan un
+    primo seguro nuevo.
+
+    :param keysize: El tamaño de las claves.
+    :param group: El grupo de las claves (ver
+        :func:`generate_ElGamal_key`).
+    :param size: La cantidad de claves que se mantienen generadas.
+    """
+
+    def __init__(self, keysize, group=None, size=KEY_POOL_SIZE):
+        self.keysize = keysize
+        self.group = group
+        self._queue = multiprocessing.Queue(maxsize=size)
+        self._process = multiprocessing.Process(
+            target=_fill_key_pool,
+            args=(self._queue, keysize, group),
+            daemon=True
+        )
+        self._process.start()
+
+    def get(self, timeout=None):
+        """
+        Saca una clave del conjunto. Si no queda ninguna espera a que
+        el proceso genere la siguiente.
+
+        :param timeout: Los segundos máximos de espera. Por defecto
+            espera indefinidamente.
+
+        :returns: Una clave ElGamal.
+
+        :raises queue.Empty: Si se agota el tiempo de espera.
+        """
+        return reconstruct_key(self._queue.get(timeout=timeout))
+
+    def close(self):
+        """
+        Detiene el proceso que genera las claves.
+        """
+        self._process.terminate()
+        self._process.join()
 
 def encrypt_for_vote(key, options):
     """
@@ -103,7 +239,11 @@ def encrypt_for_vote(key, options):
     k = generate_k(127)#key.size())
     k_array = [k for i in range(len(options))]
 
-    encrypted_ballot = [key.encrypt(pow(key.g, option, key.p), k) for option, k in zip(options, k_array)]
+    g_table, pk_table = precompute(key)
+    encrypted_ballot = []
+    for option, k in zip(options, k_array):
+        r = int(k.hex(), base=16)
+        encrypted_ballot.append((g_table.pow(r), pk_table.pow(r) * powmod(key.g, option, key.p) % key.p))
     proofs = construct_proof(key, options, encrypted_ballot, k_array)
 
     return encrypted_ballot, proofs
@@ -136,6 +276,7 @@ def construct_proof(key, non_encrypted_ballot, encrypted_ballot, k_array):
     g = key.g
     p = key.p
     q = (p - 1) // 2
+    g_table, pk_table = precompute(key)
 
     random = SystemRandom().randint
 
@@ -148,11 +289,11 @@ def construct_proof(key, non_encrypted_ballot, encrypted_ballot, k_array):
             r0 = random(0, q - 1)
             r1 = random(0, q - 1)
 
-            a1 = pow(g, r1, p) * pow(a, c1 * (p - 2), p) % p
-            b1 = pow(pk, r1, p) * pow(b * pow(g, p - 2, p) % p, c1 * (p - 2), p) % p
+            a1 = g_table.pow(r1) * powmod(invert(a, p), c1, p) % p
+            b1 = pk_table.pow(r1) * powmod(g * invert(b, p) % p, c1, p) % p
 
-            a0 = pow(g, r0, p)
-            b0 = pow(pk, r0, p)
+            a0 = g_table.pow(r0)
+            b0 = pk_table.pow(r0)
 
             c = hash_proof([pk, a, b, a0, b0, a1, b1])
             c0 = (q + (c1 - c) % q) % q
@@ -167,11 +308,11 @@ def construct_proof(key, non_encrypted_ballot, encrypted_ballot, k_array):
             r0 = random(0, q - 1)
             r1 = random(0, q - 1)
 
-            a0 = pow(g, r0, p) * pow(a, c0 * (p - 2), p) % p
-            b0 = pow(pk, r0, p) * pow(b, c0 * (p - 2), p) % p
+            a0 = g_table.pow(r0) * powmod(invert(a, p), c0, p) % p
+            b0 = pk_table.pow(r0) * powmod(invert(b, p), c0, p) % p
 
-            a1 = pow(g, r1, p)
-            b1 = pow(pk, r1, p)
+            a1 = g_table.pow(r1)
+            b1 = pk_table.pow(r1)
 
             c = hash_proof([pk, a, b, a0, b0, a1, b1])
             c1 = (q + (c0 - c) % q) % q
@@ -190,19 +331,156 @@ def verify_ballot(key, vote, voter_list):
     :param key: La clave ElGamal.
     :param vote: La papeleta cifrada con las opciones en texto cifrado,
         las pruebas DCP y la firma.
+    :param voter_list: La lista de claves públicas de los votantes. Si
+        está vacía no se comprueba la firma.
 
     :return: Devuelve `True` si la papeleta es válida, `False` en
         cualquier otro caso.
     """
-    valid_proofs = True
+    if len(vote["options"]) != len(vote["proofs"]):
+        return False
 
     for ballot, proof in zip(vote["options"], vote["proofs"]):
-      proof_valid = verify_proof(key, ballot, proof)
-      valid_proofs = valid_proofs and proof_valid
+        if not verify_proof(key, ballot, proof):
+            return False
+
+    if voter_list and not is_valid_signature(vote["signature"], voter_list):
+        return False
+
+    return True
+
+BATCH_SECURITY = 64
+"""
+El tamaño en bits de los exponentes aleatorios de la verificación por
+lotes. Un lote con alguna prueba inválida se da por válido con una
+probabilidad de como mucho :math:`2^{-64}`.
+"""
+
+def verify_ballots(key, votes, voter_list):
+    """
+    Verifica un conjunto de papeletas a la vez: igual que
+    :func:`verify_ballot` para cada una, pero con todas sus pruebas DCP
+    comprobadas en un único lote (ver :func:`batch_verify_proofs`).
+
+    :param key: La clave ElGamal.
+    :param votes: Las papeletas.
+    :param voter_list: La lista de claves públicas de los votantes. Si
+        está vacía no se comprueban las firmas.
+
+    :return: Devuelve `True` si todas las papeletas son válidas,
+        `False` en cualquier otro caso.
+    """
+    items = []
+    for vote in votes:
+        if len(vote["options"]) != len(vote["proofs"]):
+            return False
+        items.extend(zip(vote["options"], vote["proofs"]))
+
+    if not batch_verify_proofs(key, items):
+        return False
+
+    if voter_list:
+        return all(is_valid_signature(vote["signature"], voter_list) for vote in votes)
+
+    return True
+
+def _sign(symbol, exponent):
+    return symbol if exponent & 1 else 1
+
+def batch_verify_proofs(key, items):
+    """
+    Verifica a la vez un conjunto de pruebas DCP de una misma clave.
 
-    valid_signature = valid_signature(vote["signature"], voter_list)
+    Cada prueba consiste en cuatro ecuaciones (ver :func:`verify_proof`).
+    Cada ecuación se eleva a un exponente aleatorio de
+    :data:`BATCH_SECURITY` bits y se multiplican todas, de modo que
+    las potencias de g y de la clave pública se agrupan en una sola
+    exponenciación cada una y el resto se calcula con
+    :func:`cryptoutils.multi_pow`.
 
-    return valid_proofs and valid_signature
+    La combinación se comprueba salvo el signo, lo que permite reducir
+    los exponentes módulo q. El signo de cada ecuación (su símbolo de
+    Legendre) se comprueba aparte y de forma exacta, así que el
+    resultado coincide con el de :func:`verify_proof`. Requiere que p
+    sea un primo seguro.
+
+    :param key: La clave ElGamal.
+    :param items: Una lista de pares (texto cifrado, prueba).
+
+    :return: Devuelve `True` si todas las pruebas son válidas, `False`
+        en cualquier otro caso.
+    """
+    g = key.g
+    p = key.p
+    pk = key.y
+    q = (p - 1) // 2
+    random = SystemRandom().getrandbits
+
+    chi_g = jacobi(g, p)
+    chi_pk = jacobi(pk, p)
+    exp_g = 0
+    exp_pk = 0
+    terms = []
+
+    for ciphertext, proof in items:
+        try:
+            a, b = ciphertext
+            a0, a1, b0, b1, c0, c1, r0, r1 = proof
+        except (TypeError, ValueError):
+            return False
+
+        chi_a, chi_b, chi_a0, chi_a1, chi_b0, chi_b1 = (
+            jacobi(x, p) for x in (a, b, a0, a1, b0, b1))
+        if 0 in (chi_a, chi_b, chi_a0, chi_a1, chi_b0, chi_b1):
+            return False
+        if (_sign(chi_g, r0) != chi_a0 * _sign(chi_a, c0)
+                or _sign(chi_g, r1) != chi_a1 * _sign(chi_a, c1)
+                or _sign(chi_pk, r0) != chi_b0 * _sign(chi_b, c0)
+                or _sign(chi_pk, r1) * _sign(chi_g, c1) != chi_b1 * _sign(chi_b, c1)):
+            return False
+
+        d1, d2, d3, d4 = (random(BATCH_SECURITY) for _ in range(4))
+        exp_g += d1 * r0 + d2 * r1 + d4 * c1
+        exp_pk += d3 * r0 + d4 * r1
+        terms += [(a0, d1), (a1, d2), (b0, d3), (b1, d4),
+                  (a, (d1 * c0 + d2 * c1) % q), (b, (d3 * c0 + d4 * c1) % q)]
+
+    g_table, pk_table = precompute(key)
+    lhs = g_table.pow(exp_g % q) * pk_table.pow(exp_pk % q) % p
+    rhs = multi_pow(terms, p)
+    return lhs == rhs or lhs == p - rhs
+
+def find_invalid_proofs(key, items):
+    """
+    Busca las pruebas DCP inválidas de un conjunto: se verifica el lote
+    entero y, si falla, se divide en dos mitades y se busca en cada una.
+    Con pocas pruebas inválidas el coste es cercano al de verificar el
+    lote una sola vez.
+
+    :param key: La clave ElGamal.
+    :param items: Una lista de pares (texto cifrado, prueba).
+
+    :return: Una lista con las posiciones de las pruebas inválidas.
+    """
+    if batch_verify_proofs(key, items):
+        return []
+    return _bisect_invalid_proofs(key, items, 0)
+
+def _bisect_invalid_proofs(key, items, offset):
+    """
+    Busca las pruebas inválidas de un lote que ya se sabe inválido.
+    """
+    if len(items) == 1:
+        return [offset]
+    middle = len(items) // 2
+    left, right = items[:middle], items[middle:]
+    invalid = []
+    if not batch_verify_proofs(key, left):
+        invalid += _bisect_invalid_proofs(key, left, offset)
+        if batch_verify_proofs(key, right):
+            return invalid
+    invalid += _bisect_invalid_proofs(key, right, offset + middle)
+    return invalid
 
 def verify_proof(key, ciphertext, proof):
     """
@@ -221,14 +499,14 @@ def verify_proof(key, ciphertext, proof):
     """
     a, b = ciphertext
     a0, a1, b0, b1, c0, c1, r0, r1 = proof
-    g = key.g
     p = key.p
-    pk = key.y
 
-    s1 = pow(g, r0, p) == a0 * pow(a, c0, p) % p
-    s2 = pow(g, r1, p) == a1 * pow(a, c1, p) % p
-    s3 = pow(pk, r0, p) == b0 * pow(b, c0, p) % p
-    s4 = pow(pk, r1, p) == b1 * pow(b * pow(g, p - 2, p) % p, c1, p) % p
+    g_table, pk_table = precompute(key)
+
+    s1 = g_table.pow(r0) == a0 * powmod(a, c0, p) % p
+    s2 = g_table.pow(r1) == a1 * powmod(a, c1, p) % p
+    s3 = pk_table.pow(r0) == b0 * powmod(b, c0, p) % p
+    s4 = pk_table.pow(r1) == b1 * powmod(b * g_table.pow(-1) % p, c1, p) % p
     # TODO: Hay un problema con cómo está descrito en el artículo, al 
     # parecer. La siguiente línea amerita revisión
     # s5 = (c0 + c1) % q == custom_hash([pk, a, b, a0, b0, a1, b1])
@@ -261,22 +539,140 @@ def hash_proof(proof):
 def tally_votes(key, ballot_list):
     """
     Realiza la sumatoria de los votos en texto cifrado.
-    
+
     :param key: La clave de la elección.
-    :param ballot_list: La lista de papeletas cifradas.
+    :param ballot_list: Las papeletas cifradas. Puede ser cualquier
+        iterable, incluido un generador: las papeletas se consumen una
+        a una sin guardarlas.
 
     :returns: La sumatoria de votos.
     """
-    if not ballot_list:
+    return _tally(key.p, ballot_list)
+
+def _tally(p, ballot_list):
+    tallied = None
+    for ballot in ballot_list:
+        if tallied is None:
+            tallied = [[number(1), number(1)] for _ in ballot]
+        for acc, (a, b) in zip(tallied, ballot):
+            acc[0] = acc[0] * a % p
+            acc[1] = acc[1] * b % p
+    if tallied is None:
         return []
-    tallied = [[1,1] for i in range(len(ballot_list[0]))]
-    for i in ballot_list:
-        for c in range(len(i)):
-            tallied[c][0] *= i[c][0]
-            tallied[c][0] %= key.p
-            tallied[c][1] *= i[c][1]
-            tallied[c][1] %= key.p
-    return [tuple(i) for i in tallied]
+    return [(int(a), int(b)) for a, b in tallied]
+
+TALLY_CHUNK_SIZE = 4096
+"""
+La cantidad de papeletas que suma cada proceso de una vez en
+:func:`parallel_tally`.
+"""
+
+def _merge_tallies(p, left, right):
+    """
+    Suma dos recuentos parciales. Un recuento vacío es el neutro.
+    """
+    if not left:
+        return right
+    if not right:
+        return left
+    return [(a0 * a1 % p, b0 * b1 % p) for (a0, b0), (a1, b1) in zip(left, right)]
+
+def green_threads():
+    """
+    Indica si eventlet ha sustituido los hilos de la librería estándar
+    (``eventlet.monkey_patch()``, como hace el servidor). Con los hilos
+    sustituidos ``multiprocessing.Pool`` se bloquea, porque sus hilos
+    internos pasan a ser hilos verdes, así que las funciones de este
+    módulo que usan uno trabajan entonces en el proceso actual.
+    """
+    eventlet = sys.modules.get("eventlet")
+    return eventlet is not None and eventlet.patcher.is_monkey_patched("thread")
+
+def _partial_tallies(p, chunks, workers):
+    """
+    Suma cada bloque de papeletas en un conjunto de procesos. Como
+    mucho hay dos bloques por proceso pendientes a la vez, así que los
+    bloques se leen a medida que los procesos quedan libres.
+    """
+    with multiprocessing.Pool(workers) as pool:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(pool.apply_async(_tally, (p, chunk)))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+
+def parallel_tally(key, ballot_list, workers=None, chunk_size=TALLY_CHUNK_SIZE):
+    """
+    Realiza la sumatoria de los votos en texto cifrado igual que
+    :func:`tally_votes`, pero repartida entre un conjunto de procesos.
+
+    Las papeletas se leen por bloques de ``chunk_size`` y cada proceso
+    suma los bloques que se le asignan. Los recuentos parciales se
+    combinan por parejas a medida que llegan, como en un contador
+    binario, formando un árbol de sumas. En memoria solo están los
+    bloques pendientes y un recuento parcial por nivel del árbol.
+
+    Si todas las papeletas caben en un solo bloque, con un solo
+    proceso o bajo eventlet (ver :func:`green_threads`), la suma se
+    hace en el proceso actual.
+
+    :param key: La clave de la elección.
+    :param ballot_list: Las papeletas cifradas. Puede ser cualquier
+        iterable, incluido un generador.
+    :param workers: El número de procesos. Por defecto uno por núcleo.
+    :param chunk_size: La cantidad de papeletas por bloque.
+
+    :returns: La sumatoria de votos.
+    """
+    p = key.p
+    workers = 1 if green_threads() else workers or os.cpu_count() or 1
+    ballots = iter(ballot_list)
+    chunks = iter(lambda: list(itertools.islice(ballots, chunk_size)), [])
+
+    first = next(chunks, [])
+    second = next(chunks, None)
+    if second is None:
+        return _tally(p, first)
+    chunks = itertools.chain([first, second], chunks)
+    if workers == 1:
+        partials = (_tally(p, chunk) for chunk in chunks)
+    else:
+        partials = _partial_tallies(p, chunks, workers)
+
+    #: levels[i] es la suma de 2^i bloques o `None`
+    levels = []
+    for partial in partials:
+        i = 0
+        while i < len(levels) and levels[i] is not None:
+            partial = _merge_tallies(p, levels[i], partial)
+            levels[i] = None
+            i += 1
+        if i == len(levels):
+            levels.append(partial)
+        else:
+            levels[i] = partial
+
+    tallied = []
+    for partial in levels:
+        if partial is not None:
+            tallied = _merge_tallies(p, tallied, partial)
+    return tallied
+
+
+def invert_ballot(key, ballot):
+    """
+    Devuelve el inverso de una papeleta cifrada: al sumarlo a un
+    recuento con :func:`tally_votes`, la papeleta se resta de él.
+
+    :param key: La clave de la elección.
+    :param ballot: La papeleta cifrada.
+
+    :returns: Una lista con el inverso de cada texto cifrado.
+    """
+    p = key.p
+    return [(invert(a, p), invert(b, p)) for a, b in ballot]
 
 
 def decrypt_vote_tally(key, vote_tally):
@@ -294,45 +690,115 @@ def decrypt_vote_tally(key, vote_tally):
     """
     if not key.has_private():
         raise ValueError("La clave para esta elección no tiene componente de clave privada")
-    return list(map(lambda x: key.decrypt(x), vote_tally))
+    p = key.p
+    return [b * invert(powmod(a, key.x, p), p) % p for a, b in vote_tally]
 
 
-def decrypt_vote_tally_threshold(public_key, shares, vote_tally):
+def make_key_shares(key, minimum, shares):
     """
-    Realiza el descifrado de los votos mediante un esquema de cifrado
-    umbral.
+    Reparte la clave privada de una elección entre varios custodios
+    para el descifrado umbral (ver
+    :func:`decrypt_vote_tally_threshold`). Es :func:`shamir.make_shares`
+    sobre el orden q del subgrupo de cuadrados, donde se hace la
+    interpolación en el exponente.
 
-    .. note:: Idealmente no se reconstruye la clave sino que se usa
-        algún protocolo de computación distribuida para ejectuar el
-        cómputo **SIN** reconstruir la clave.
+    :param key: La clave ElGamal, con componente privada. p debe ser un
+        primo seguro.
+    :param minimum: La cantidad mínima de *shares*.
+    :param shares: La cantidad de *shares*.
+
+    :return: Una lista de tuplas :math:`(i, f(i))`.
+    """
+    return make_shares(key, minimum, shares, (key.p - 1) // 2)
+
+def _partial_decrypt(p, share, vote_tally):
+    i, y_i = share
+    q = (p - 1) // 2
+    return i, [powmod(a * a % p, y_i % q, p) for a, _ in vote_tally]
+
+def partial_decrypt(public_key, share, vote_tally):
+    """
+    El descifrado parcial de un custodio: eleva el cuadrado de la
+    primera componente de cada texto cifrado a su *share*,
+    :math:`(a^2)^{y_i}`. No revela el *share* y no necesita ninguno de
+    los otros, así que cada custodio lo calcula por su cuenta, en su
+    propio proceso o nodo.
 
     :param public_key: La clave pública de la elección.
+    :param share: El *share* del custodio (ver :func:`make_key_shares`).
     :param vote_tally: El escrutinio cifrado de votos.
-    :param shares: Una lista de secretos compartidos que permiten
-        descifrar conjuntamente los votos.
 
-    :returns: El escrutinio de votos descifrado.
+    :returns: Una tupla con el índice del *share* y el descifrado
+        parcial de cada opción.
     """
-    private_key = ElGamal.construct((public_key.p, public_key.g, public_key.y, recover_secret(shares)))
-    return list(map(lambda x: private_key.decrypt(x), vote_tally))
-
+    return _partial_decrypt(public_key.p, share, vote_tally)
 
-def vote_lookup_table(key, n_votes):
+def combine_partial_decryptions(public_key, partials, vote_tally):
     """
-    Genera una *lookup table* para el logaritmo discreto a partir de
-    una clave. La tabla resultante contiene en cada índice el valor del
-    logaritmo discreto para el número correspondiente en el grupo 
-    cíclico de la clave.
+    Combina los descifrados parciales de los custodios interpolando en
+    el exponente: con los coeficientes de Lagrange :math:`\\lambda_i`
+    de sus índices, :math:`\\prod_i ((a^2)^{y_i})^{\\lambda_i} = a^{2x}`,
+    así que :math:`b^2 / a^{2x} = g^{2m}`. La clave privada no se
+    reconstruye en ningún momento.
+
+    Los coeficientes se calculan una vez para todas las opciones, y el
+    inverso se incluye en los exponentes (:math:`q - \\lambda_i`), de
+    modo que cada opción es un único producto de potencias (ver
+    :func:`cryptoutils.multi_exp`).
 
-    :param key: La clave.
-    :param n_votes: El número máximo de votos posibles para una misma
-        opción. No es necesario calcular para más de esta cantidad.
+    :param public_key: La clave pública de la elección.
+    :param partials: Los descifrados parciales (ver
+        :func:`partial_decrypt`) de al menos tantos custodios como el
+        mínimo de los *shares*.
+    :param vote_tally: El escrutinio cifrado de votos.
+
+    :returns: El escrutinio descifrado al cuadrado: :math:`g^{2m}` para
+        cada opción (ver :func:`decode_tally`).
+
+    :raises ValueError: Si hay descifrados parciales con el mismo
+        índice.
+    """
+    p = public_key.p
+    q = (p - 1) // 2
+    indices = [i for i, _ in partials]
+    exponents = [(q - l) % q for l in lagrange_coefficients(indices, q)]
+    return [multi_exp([(b, 2)] + [(values[k], e) for (_, values), e in zip(partials, exponents)], p)
+            for k, (_, b) in enumerate(vote_tally)]
 
-    :returns: Una lista donde se encuentra los valores de :math:`g^i mod p`
-        para cada i desde 0 hasta el número de votantes. El valor del
-        logaritmo discreto para un número x se consigue en el índice x.
+def decrypt_vote_tally_threshold(public_key, shares, vote_tally, workers=None):
     """
-    return [pow(key.g, x, key.p) for x in range(n_votes)]
+    Realiza el descifrado de los votos mediante un esquema de cifrado
+    umbral, sin reconstruir la clave: cada *share* hace su descifrado
+    parcial (ver :func:`partial_decrypt`), en paralelo en un conjunto
+    de procesos, y después se combinan (ver
+    :func:`combine_partial_decryptions`).
+
+    Cuando los custodios están en nodos distintos, cada uno llama a
+    :func:`partial_decrypt` y solo se envían los resultados.
+
+    :param public_key: La clave pública de la elección.
+    :param vote_tally: El escrutinio cifrado de votos.
+    :param shares: Una lista de secretos compartidos que permiten
+        descifrar conjuntamente los votos (ver
+        :func:`make_key_shares`).
+    :param workers: El número de procesos. Por defecto uno por
+        *share*, como mucho uno por núcleo. Bajo eventlet (ver
+        :func:`green_threads`) se usa siempre el proceso actual.
+
+    :returns: El escrutinio descifrado al cuadrado: :math:`g^{2m}` para
+        cada opción (ver :func:`decode_tally`).
+    """
+    vote_tally = [tuple(c) for c in vote_tally]
+    if green_threads():
+        workers = 1
+    workers = workers or min(len(shares), os.cpu_count() or 1)
+    jobs = [(public_key.p, share, vote_tally) for share in shares]
+    if workers == 1:
+        partials = [_partial_decrypt(*job) for job in jobs]
+    else:
+        with multiprocessing.Pool(workers) as pool:
+            partials = pool.starmap(_partial_decrypt, jobs)
+    return combine_partial_decryptions(public_key, partials, vote_tally)
 
 
 def serialize_key(key):
@@ -359,32 +825,56 @@ def serialize_key(key):
             "y": key.y,
         }
 
-DECRYPTION_TABLE_DEFAULT = 100
-
-def update_decryption_table(decryption_table, key, n_voters=DECRYPTION_TABLE_DEFAULT):
-    if not key.has_private():
-        return None
-    if key.x not in decryption_table:
-        decryption_table[key.y] = vote_lookup_table(key, n_voters)
-    return decryption_table[key.y]
-
-
-def save_decryption_table(decryption_table, filepath):
-    try:
-        with open(filepath, "w") as f:
-            json.dump(decryption_table, f)
-    except:
-        pass
+DISCRETE_LOG_CACHE_SIZE = 16
+"""
+La cantidad de tablas de :func:`discrete_log_solver` que se mantienen
+en memoria.
+"""
 
+@lru_cache(maxsize=DISCRETE_LOG_CACHE_SIZE)
+def discrete_log_solver(g, p, bound):
+    """
+    Devuelve un :class:`cryptoutils.DiscreteLogSolver` para la base g,
+    guardado en caché. La cota se redondea a la siguiente potencia de
+    dos, así que los recuentos de una elección que crece reutilizan la
+    misma tabla.
 
-def load_decryption_table(decryption_table, filepath):
-    try:
-        with open(filepath, "r") as f:
-            serialized = json.load(f)
-        return {int(y): serialized[y] for y in serialized}
-    except:
-        return {}
+    :param g: La base.
+    :param p: El módulo primo.
+    :param bound: El mayor logaritmo que se busca.
+    """
+    return DiscreteLogSolver(g, p, 1 << max(0, bound - 1).bit_length())
 
+def decode_tally(key, decrypted_tally, n_voters, table=None, squared=False):
+    """
+    Convierte un escrutinio descifrado, donde cada opción vale
+    :math:`g^m`, en la cantidad m de votos de cada opción.
 
-def consult_decryption_table(decryption_table, key, n):
-    return decryption_table.get(key.y).index(n)
+    :param key: La clave de la elección.
+    :param decrypted_tally: El escrutinio descifrado (ver
+        :func:`decrypt_vote_tally`).
+    :param n_voters: El número de votantes: ninguna opción puede tener
+        más votos.
+    :param table: Una tabla de descifrado ya construida (ver
+        :mod:`dlogtable`). Si no se indica o es demasiado pequeña, se
+        construye una en memoria.
+    :param squared: Si cada opción vale :math:`g^{2m}`, como en el
+        descifrado umbral (ver :func:`decrypt_vote_tally_threshold`).
+        La tabla debe ser entonces la de :math:`g^2`.
+
+    :returns: Una lista con la cantidad de votos de cada opción.
+
+    :raises ValueError: Si alguna opción no corresponde a una cantidad
+        de votos entre 0 y ``n_voters``.
+    """
+    n_voters = max(1, n_voters)
+    p = int(key.p)
+    base = int(key.g) ** 2 % p if squared else int(key.g)
+    if table is not None and table.steps ** 2 > n_voters:
+        solver = DiscreteLogSolver(base, p, n_voters, table)
+    else:
+        solver = discrete_log_solver(base, p, n_voters)
+    counts = solver.solve_many(decrypted_tally)
+    if any(count is None or count > n_voters for count in counts):
+        raise ValueError("El escrutinio no corresponde a ninguna cantidad de votos posible")
+    return counts
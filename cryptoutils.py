@@ -1,6 +1,8 @@
-from math import ceil, log, sqrt
+from math import isqrt
 
-from shamir import _divmod
+import arith
+
+from arith import invert, number, powmod
 
 def discrete_log(a, b, n):
     """
@@ -23,23 +25,283 @@ def discrete_log(a, b, n):
     :returns: El logaritmo discreto de b base a en el grupo cíclico G o
         -1 si no existe.
     """
-    
-    m = ceil(sqrt(n))
+    result = DiscreteLogSolver(a, n, n - 1).solve(b)
+    return result if result is not None else "-1"
+
+
+class DiscreteLogSolver:
+    """
+    Calcula logaritmos discretos acotados mediante el algoritmo
+    *baby-step giant-step*: dado y, encuentra el x entre 0 y la cota
+    tal que :math:`b^x \\equiv y \\pmod p`.
+
+    Los pasos pequeños (*baby steps*) :math:`b^j` para j menor que
+    :math:`s = \\lfloor\\sqrt{cota}\\rfloor + 1` se guardan en un
+    `dict` indexado por elemento, así que cada paso grande es una sola
+    consulta. Un logaritmo cuesta como mucho s multiplicaciones, y la
+    tabla se construye una vez y sirve para todos.
+
+    En lugar del `dict` se puede usar una tabla ya construida, por
+    ejemplo una guardada en disco (ver :mod:`dlogtable`). Esa tabla
+    puede devolver coincidencias falsas, así que cada resultado se
+    comprueba.
+
+    Está pensado para descifrar recuentos: la cota es el número de
+    votantes, y con millones de votantes la tabla tiene solo miles de
+    entradas.
+
+    :param base: La base b.
+    :param modulus: El módulo primo p.
+    :param bound: El mayor logaritmo que se busca.
+    :param table: Una tabla de pasos pequeños ya construida: un objeto
+        con un atributo ``steps`` y un método ``get`` que, dado un
+        elemento, devuelve su j o `None`.
+
+    :raises ValueError: Si la tabla es demasiado pequeña para la cota.
+    """
+
+    def __init__(self, base, modulus, bound, table=None):
+        self.base = base % modulus
+        self.modulus = modulus
+        self.bound = bound
+        self._exact = table is None
+        if table is None:
+            self.steps = self.steps_for(bound)
+            #: :math:`b^j` -> j
+            self.table = {}
+            power = number(1)
+            for j in range(self.steps):
+                self.table.setdefault(int(power), j)
+                power = power * self.base % modulus
+        else:
+            if table.steps ** 2 <= bound:
+                raise ValueError("La tabla de pasos pequeños es demasiado pequeña para esa cota")
+            self.steps = table.steps
+            self.table = table
+            power = powmod(self.base, self.steps, modulus)
+        #: :math:`b^{-s}`, el paso grande
+        self.giant_step = invert(int(power), modulus)
 
-    trial = []
+    @staticmethod
+    def steps_for(bound):
+        """
+        :returns: La cantidad de pasos pequeños para una cota.
+        """
+        return isqrt(bound) + 1
+
+    def solve(self, element):
+        """
+        :param element: El elemento y.
+
+        :returns: El logaritmo de y o `None` si no hay ninguno menor o
+            igual que la cota.
+        """
+        return self.solve_many([element])[0]
+
+    def solve_many(self, elements):
+        """
+        Calcula a la vez los logaritmos de varios elementos, por
+        ejemplo los recuentos de todas las opciones de una elección.
+        Todos comparten los pasos grandes.
+
+        :param elements: Una lista de elementos.
+
+        :returns: Una lista con el logaritmo de cada elemento, o `None`
+            para los que no tienen ninguno menor o igual que la cota.
+        """
+        modulus = self.modulus
+        targets = [y % modulus for y in elements]
+        results = [None] * len(elements)
+        #: posición -> elemento tras i pasos grandes
+        pending = {i: number(y) for i, y in enumerate(targets)}
+        for i in range(self.steps):
+            for position, current in list(pending.items()):
+                j = self.table.get(current)
+                x = i * self.steps + (j or 0)
+                if (j is not None and x <= self.bound
+                        and (self._exact or powmod(self.base, x, modulus) == targets[position])):
+                    results[position] = x
+                    del pending[position]
+                else:
+                    pending[position] = current * self.giant_step % modulus
+            if not pending:
+                break
+        return results
+
+
+STRAUS_WINDOW = 4
+"""
+El ancho máximo en bits de las ventanas de :func:`multi_exp`.
+"""
+
+STRAUS_MIN_PAIRS = {"gmpy2": 4, "python": 2}
+"""
+A partir de cuántas potencias compensa :func:`multi_exp` frente a
+calcular cada potencia por separado, según el *backend* aritmético
+(ver :mod:`arith`). Con gmpy2 cada potencia separada se calcula
+entera en GMP, así que el bucle de Python solo gana con varias bases.
+"""
+
+
+def multi_exp(pairs, n):
+    """
+    Calcula el producto :math:`\\prod_i b_i^{e_i} \\bmod n` con el
+    método de Straus (el truco de Shamir con ventanas entrelazadas).
 
-    for j in range(0, m):
-        trial.append((j, pow(a, j, n)))
+    Todas las potencias comparten un mismo acumulador, que se eleva al
+    cuadrado una vez por bit del exponente más largo: con k bases se
+    hacen las elevaciones al cuadrado de una sola exponenciación en
+    lugar de k. Cada exponente se recorre con ventanas deslizantes y
+    cada base tiene su tabla de potencias impares. Los exponentes
+    cortos usan ventanas más estrechas y solo participan en los
+    últimos bits.
 
-    a_m = n + _divmod(1, pow(a, m, n), n)
+    :param pairs: Un iterable de pares (base, exponente no negativo).
+    :param n: El módulo.
+
+    :returns: El producto de las potencias.
+    """
+    pairs = [(b, e) for b, e in pairs if e]
+    if len(pairs) < STRAUS_MIN_PAIRS[arith.BACKEND]:
+        result = 1
+        for b, e in pairs:
+            result = result * powmod(b, e, n) % n
+        return result
+
+    bits = max(e.bit_length() for _, e in pairs)
+    #: posición del bit -> potencias por las que multiplicar en él
+    steps = [[] for _ in range(bits)]
+    for b, e in pairs:
+        width = min(STRAUS_WINDOW, max(1, e.bit_length().bit_length() // 2))
+        b = number(b % n)
+        square = b * b % n
+        odd_powers = [b]
+        for _ in range((1 << (width - 1)) - 1):
+            odd_powers.append(odd_powers[-1] * square % n)
+
+        i = e.bit_length() - 1
+        while i >= 0:
+            if not (e >> i) & 1:
+                i -= 1
+                continue
+            j = max(i - width + 1, 0)
+            while not (e >> j) & 1:
+                j += 1
+            digit = (e >> j) & ((1 << (i - j + 1)) - 1)
+            steps[j].append(odd_powers[digit >> 1])
+            i = j - 1
+
+    result = number(1)
+    for i in reversed(range(bits)):
+        result = result * result % n
+        for power in steps[i]:
+            result = result * power % n
+    return int(result)
+
+
+def multi_pow(pairs, n):
+    """
+    Calcula el producto :math:`\\prod_i b_i^{e_i} \\bmod n` mediante el
+    método de los cubos (*buckets*) de Pippenger.
+
+    Los exponentes se recorren por ventanas de bits, de la más alta a
+    la más baja. En cada ventana cada base se multiplica una única vez
+    en el cubo correspondiente a su dígito, así que el número de
+    multiplicaciones por base es el número de ventanas y no el número
+    de bits de su exponente. Con muchas bases el coste crece mucho más
+    despacio que calculando cada potencia por separado. Las bases con
+    exponentes cortos solo participan en las ventanas bajas.
+
+    :param pairs: Un iterable de pares (base, exponente no negativo).
+    :param n: El módulo.
+
+    :returns: El producto de las potencias.
+    """
+    pairs = sorted(((number(b % n), e) for b, e in pairs if e),
+                   key=lambda pair: pair[1].bit_length(), reverse=True)
+    if len(pairs) < 8:
+        return multi_exp(pairs, n)
+
+    width = max(2, len(pairs).bit_length() - 3)
+    mask = (1 << width) - 1
+    windows = -(-pairs[0][1].bit_length() // width)
+    result = 1
+    for window in reversed(range(windows)):
+        for _ in range(width if result != 1 else 0):
+            result = result * result % n
+        shift = window * width
+        buckets = [1] * (mask + 1)
+        for b, e in pairs:
+            if e.bit_length() <= shift:
+                break
+            digit = (e >> shift) & mask
+            if digit:
+                buckets[digit] = buckets[digit] * b % n
+        running = 1
+        total = 1
+        for digit in range(mask, 0, -1):
+            if buckets[digit] != 1:
+                running = running * buckets[digit] % n
+            if running != 1:
+                total = total * running % n
+        result = result * total % n
+    return int(result)
+
+
+FIXED_BASE_WINDOW = 5
+"""
+El ancho en bits de las ventanas de :class:`FixedBase`. Cada bit más
+reduce las multiplicaciones de cada potencia en un factor
+:math:`w/(w+1)` pero casi duplica el tamaño de la tabla.
+"""
+
+
+class FixedBase:
+    """
+    Tabla de potencias de una base fija para calcular
+    :math:`b^e \\bmod p` sin elevar al cuadrado.
+
+    La fila i de la tabla contiene :math:`b^{d \\cdot 2^{wi}}` para cada
+    dígito d de w bits, así que una potencia es el producto de una
+    entrada por cada ventana del exponente: unas :math:`\\log_2(p)/w`
+    multiplicaciones en lugar de las :math:`\\log_2(p)` elevaciones al
+    cuadrado y multiplicaciones de una exponenciación normal.
+
+    :param base: La base.
+    :param modulus: El módulo, que debe ser primo: los exponentes se
+        reducen módulo :math:`p - 1`.
+    :param window: El ancho de las ventanas en bits.
+    """
 
-    y = b
+    def __init__(self, base, modulus, window=FIXED_BASE_WINDOW):
+        self.base = base % modulus
+        self.modulus = modulus
+        self.window = window
+        self.order = modulus - 1
+        self.table = []
+        power = number(self.base)
+        for _ in range(-(-self.order.bit_length() // window)):
+            row = [1, power]
+            for _ in range(2, 1 << window):
+                row.append(row[-1] * power % modulus)
+            self.table.append(row)
+            power = row[-1] * power % modulus
 
-    for i in range(0, m):
-        for first, second in trial:
-            if second == y:
-                return (i * m) + first
-        y *= a_m
-        y %= n
+    def pow(self, exponent):
+        """
+        :param exponent: Un entero cualquiera, incluso negativo.
 
-    return "-1"
+        :returns: :math:`b^e \\bmod p`.
+        """
+        exponent %= self.order
+        mask = (1 << self.window) - 1
+        modulus = self.modulus
+        result = 1
+        for row in self.table:
+            if not exponent:
+                break
+            digit = exponent & mask
+            if digit:
+                result = result * row[digit] % modulus
+            exponent >>= self.window
+        return int(result)
@@ -0,0 +1,261 @@
+"""
+Aquí se encuentran las tablas de descifrado: las tablas de pasos
+pequeños de :class:`cryptoutils.DiscreteLogSolver` guardadas en disco,
+una por grupo (g, p).
+
+Cada tabla es un fichero binario con una cabecera (la cantidad de
+pasos) seguida de una entrada de 12 bytes por cada :math:`g^j`: un
+resumen de 8 bytes del elemento y j. Las entradas están ordenadas por
+resumen, así que una consulta es una búsqueda binaria sobre el fichero
+mapeado en memoria, sin cargarlo. Los procesos que abren la misma
+tabla comparten sus páginas, de solo lectura.
+
+Las tablas se construyen en procesos aparte con :class:`TableBuilder`,
+que informa del progreso de cada una, y solo se vuelven a escribir si
+hace falta una tabla más grande.
+"""
+
+import hashlib
+import mmap
+import multiprocessing
+import os
+import struct
+
+from collections import deque
+
+from arith import number
+from cryptoutils import DiscreteLogSolver
+
+
+DECRYPTION_TABLE_DEFAULT = 2**20
+"""
+La cantidad de votos por opción para la que se construye una tabla
+cuando no se conoce el número de votantes.
+"""
+
+PROGRESS_INTERVAL = 4096
+"""
+Cada cuántas entradas actualiza su progreso el proceso que construye
+una tabla.
+"""
+
+JOIN_TIMEOUT = 1
+"""
+Los segundos máximos que :meth:`TableBuilder.poll` espera a que
+termine un proceso que ya ha escrito su tabla.
+"""
+
+_HEADER = struct.Struct(">Q")
+_ENTRY = struct.Struct(">8sI")
+_DIGEST_SIZE = 8
+
+
+def _digest(element, size):
+    return hashlib.blake2b(int(element).to_bytes(size, "big"), digest_size=_DIGEST_SIZE).digest()
+
+
+def table_name(g, p):
+    """
+    :returns: El nombre del fichero de la tabla del grupo (g, p).
+    """
+    return hashlib.sha256("{}:{}".format(g, p).encode()).hexdigest()[:32] + ".dlog"
+
+
+def build_table(path, g, p, steps, progress=None):
+    """
+    Construye una tabla de descifrado y la escribe de forma atómica.
+
+    :param path: El fichero de la tabla.
+    :param g: La base.
+    :param p: El módulo primo.
+    :param steps: La cantidad de pasos pequeños (ver
+        :meth:`cryptoutils.DiscreteLogSolver.steps_for`).
+    :param progress: Un ``multiprocessing.Value`` donde se va guardando
+        la fracción de la tabla ya construida.
+    """
+    size = (p.bit_length() + 7) // 8
+    entries = []
+    power = number(1)
+    for j in range(steps):
+        entries.append(_ENTRY.pack(_digest(power, size), j))
+        power = power * g % p
+        if progress is not None and j % PROGRESS_INTERVAL == 0:
+            progress.value = j / steps
+    entries.sort()
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_HEADER.pack(steps))
+        f.write(b"".join(entries))
+    os.replace(tmp_path, path)
+    if progress is not None:
+        progress.value = 1.0
+
+
+class DecryptionTable:
+    """
+    Una tabla de descifrado guardada en disco, mapeada en memoria. Se
+    puede pasar como ``table`` a :class:`cryptoutils.DiscreteLogSolver`.
+
+    :param path: El fichero de la tabla.
+    :param p: El módulo del grupo.
+    """
+
+    def __init__(self, path, p):
+        self._size = (p.bit_length() + 7) // 8
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (self.steps,) = _HEADER.unpack_from(self._map)
+        self._entries = (len(self._map) - _HEADER.size) // _ENTRY.size
+
+    def get(self, element):
+        """
+        Busca un elemento en la tabla. Como solo se guarda un resumen
+        del elemento, puede devolver una coincidencia falsa.
+
+        :param element: El elemento :math:`g^j`.
+
+        :returns: j, o `None` si el elemento no está en la tabla.
+        """
+        digest = _digest(element, self._size)
+        low, high = 0, self._entries
+        while low < high:
+            middle = (low + high) // 2
+            offset = _HEADER.size + middle * _ENTRY.size
+            if self._map[offset:offset + _DIGEST_SIZE] < digest:
+                low = middle + 1
+            else:
+                high = middle
+        if low == self._entries:
+            return None
+        found, j = _ENTRY.unpack_from(self._map, _HEADER.size + low * _ENTRY.size)
+        return j if found == digest else None
+
+    def close(self):
+        self._map.close()
+
+
+def open_table(directory, g, p):
+    """
+    Abre la tabla de descifrado de un grupo.
+
+    :param directory: El directorio de las tablas.
+    :param g: La base.
+    :param p: El módulo primo.
+
+    :returns: Una :class:`DecryptionTable` o `None` si no existe.
+    """
+    path = os.path.join(directory, table_name(g, p))
+    if not os.path.isfile(path):
+        return None
+    return DecryptionTable(path, p)
+
+
+class TableBuilder:
+    """
+    Construye tablas de descifrado en un conjunto de procesos aparte,
+    para no ocupar el proceso del servidor. Las peticiones que no caben
+    se quedan en cola y empiezan cuando termina otra tabla (ver
+    :meth:`poll`).
+
+    :param directory: El directorio de las tablas. Se crea si no
+        existe.
+    :param workers: El número máximo de tablas construyéndose a la vez.
+    """
+
+    def __init__(self, directory, workers=1):
+        self.directory = directory
+        self.workers = workers
+        os.makedirs(directory, exist_ok=True)
+        #: nombre de la tabla -> (proceso, progreso, pasos)
+        self._running = {}
+        #: peticiones pendientes: (nombre, g, p, pasos)
+        self._queue = deque()
+        #: Los nombres de las tablas cuyo proceso ha terminado sin
+        #: escribirlas. Quien llama a :meth:`poll` puede vaciarla.
+        self.failed = []
+
+    def _steps_on_disk(self, name):
+        try:
+            with open(os.path.join(self.directory, name), "rb") as f:
+                return _HEADER.unpack(f.read(_HEADER.size))[0]
+        except (FileNotFoundError, struct.error):
+            return 0
+
+    def request(self, g, p, bound=DECRYPTION_TABLE_DEFAULT):
+        """
+        Pide una tabla para descifrar hasta ``bound`` votos por opción.
+        No hace nada si ya hay una tabla suficiente en disco, en
+        construcción o en cola. Si la que está en cola es más pequeña
+        se amplía, y si la que está en construcción es más pequeña la
+        grande se pone en cola y empieza cuando termine esa.
+
+        :param g: La base.
+        :param p: El módulo primo.
+        :param bound: El número de votantes.
+        """
+        g, p = int(g), int(p)
+        name = table_name(g, p)
+        steps = DiscreteLogSolver.steps_for(bound)
+        if self._steps_on_disk(name) >= steps:
+            return
+        if name in self._running and self._running[name][2] >= steps:
+            return
+        for position, job in enumerate(self._queue):
+            if job[0] == name:
+                if job[3] < steps:
+                    self._queue[position] = (name, g, p, steps)
+                return
+        self._queue.append((name, g, p, steps))
+        self.poll()
+
+    def poll(self):
+        """
+        Recoge las tablas terminadas y empieza las pendientes.
+
+        Una tabla ha terminado cuando su progreso llega a 1, que
+        :func:`build_table` solo escribe después de guardar el fichero.
+        No basta con ``is_alive``: con eventlet y ``monkey_patch()``
+        sigue devolviendo `True` después de que el proceso termine. Si
+        el proceso termina sin llegar a 1, la tabla se añade a
+        :attr:`failed` y no se devuelve.
+
+        :returns: Una lista con los nombres de las tablas terminadas
+            desde la última llamada.
+        """
+        finished = []
+        for name, (process, progress, _) in list(self._running.items()):
+            if progress.value < 1.0 and process.is_alive():
+                continue
+            process.join(JOIN_TIMEOUT)
+            del self._running[name]
+            #: Se vuelve a leer: el proceso ha podido terminar la tabla
+            #: después de la primera lectura.
+            if progress.value >= 1.0:
+                finished.append(name)
+            else:
+                self.failed.append(name)
+        for job in list(self._queue):
+            if len(self._running) >= self.workers:
+                break
+            name, g, p, steps = job
+            if name in self._running:
+                continue
+            self._queue.remove(job)
+            progress = multiprocessing.Value("d", 0.0)
+            process = multiprocessing.Process(
+                target=build_table,
+                args=(os.path.join(self.directory, name), g, p, steps, progress),
+                daemon=True
+            )
+            process.start()
+            self._running[name] = (process, progress, steps)
+        return finished
+
+    def progress(self):
+        """
+        :returns: Un `dict` con la fracción construida de cada tabla en
+            construcción o en cola.
+        """
+        status = {job[0]: 0.0 for job in self._queue}
+        status.update((name, progress.value) for name, (_, progress, _) in self._running.items())
+        return status
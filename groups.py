@@ -0,0 +1,204 @@
+"""
+Aquí se encuentran los grupos sobre los que se generan las claves
+ElGamal de las elecciones (ver :func:`crypto.generate_ElGamal_key`).
+
+Buscar un primo seguro nuevo de 2048 bits puede llevar minutos, así
+que en lugar de eso se usan primos seguros :math:`p = 2q + 1` ya
+publicados y revisados: los grupos MODP de la RFC 3526, construidos a
+partir de los dígitos de :math:`\\pi`, y los grupos ffdhe de la RFC
+7919, construidos a partir de los de e. Crear una clave solo cuesta
+elegir un x aleatorio y calcular :math:`g^x`.
+
+En todos ellos el generador es 2, que es un residuo cuadrático (p es
+congruente con 7 módulo 8) y por tanto genera el subgrupo de orden q,
+como necesitan las pruebas de :mod:`crypto`. Todas las elecciones que
+usan un mismo grupo comparten además la tabla de potencias de g (ver
+:func:`crypto.fixed_base`).
+
+Los primos se pueden comprobar con :func:`verify_group`.
+"""
+
+from arith import is_prime, jacobi
+
+
+MODP2048 = int(
+    "FFFFFFFFFFFFFFFFC90FDAA22168C234C4C6628B80DC1CD129024E088A67CC74"
+    "020BBEA63B139B22514A08798E3404DDEF9519B3CD3A431B302B0A6DF25F1437"
+    "4FE1356D6D51C245E485B576625E7EC6F44C42E9A637ED6B0BFF5CB6F406B7ED"
+    "EE386BFB5A899FA5AE9F24117C4B1FE649286651ECE45B3DC2007CB8A163BF05"
+    "98DA48361C55D39A69163FA8FD24CF5F83655D23DCA3AD961C62F356208552BB"
+    "9ED529077096966D670C354E4ABC9804F1746C08CA18217C32905E462E36CE3B"
+    "E39E772C180E86039B2783A2EC07A28FB5C55DF06F4C52C9DE2BCBF695581718"
+    "3995497CEA956AE515D2261898FA051015728E5A8AACAA68FFFFFFFFFFFFFFFF", 16)
+"""
+Grupo MODP de 2048 bits de la RFC 3526.
+"""
+
+MODP3072 = int(
+    "FFFFFFFFFFFFFFFFC90FDAA22168C234C4C6628B80DC1CD129024E088A67CC74"
+    "020BBEA63B139B22514A08798E3404DDEF9519B3CD3A431B302B0A6DF25F1437"
+    "4FE1356D6D51C245E485B576625E7EC6F44C42E9A637ED6B0BFF5CB6F406B7ED"
+    "EE386BFB5A899FA5AE9F24117C4B1FE649286651ECE45B3DC2007CB8A163BF05"
+    "98DA48361C55D39A69163FA8FD24CF5F83655D23DCA3AD961C62F356208552BB"
+    "9ED529077096966D670C354E4ABC9804F1746C08CA18217C32905E462E36CE3B"
+    "E39E772C180E86039B2783A2EC07A28FB5C55DF06F4C52C9DE2BCBF695581718"
+    "3995497CEA956AE515D2261898FA051015728E5A8AAAC42DAD33170D04507A33"
+    "A85521ABDF1CBA64ECFB850458DBEF0A8AEA71575D060C7DB3970F85A6E1E4C7"
+    "ABF5AE8CDB0933D71E8C94E04A25619DCEE3D2261AD2EE6BF12FFA06D98A0864"
+    "D87602733EC86A64521F2B18177B200CBBE117577A615D6C770988C0BAD946E2"
+    "08E24FA074E5AB3143DB5BFCE0FD108E4B82D120A93AD2CAFFFFFFFFFFFFFFFF", 16)
+"""
+Grupo MODP de 3072 bits de la RFC 3526.
+"""
+
+MODP4096 = int(
+    "FFFFFFFFFFFFFFFFC90FDAA22168C234C4C6628B80DC1CD129024E088A67CC74"
+    "020BBEA63B139B22514A08798E3404DDEF9519B3CD3A431B302B0A6DF25F1437"
+    "4FE1356D6D51C245E485B576625E7EC6F44C42E9A637ED6B0BFF5CB6F406B7ED"
+    "EE386BFB5A899FA5AE9F24117C4B1FE649286651ECE45B3DC2007CB8A163BF05"
+    "98DA48361C55D39A69163FA8FD24CF5F83655D23DCA3AD961C62F356208552BB"
+    "9ED529077096966D670C354E4ABC9804F1746C08CA18217C32905E462E36CE3B"
+    "E39E772C180E86039B2783A2EC07A28FB5C55DF06F4C52C9DE2BCBF695581718"
+    "3995497CEA956AE515D2261898FA051015728E5A8AAAC42DAD33170D04507A33"
+    "A85521ABDF1CBA64ECFB850458DBEF0A8AEA71575D060C7DB3970F85A6E1E4C7"
+    "ABF5AE8CDB0933D71E8C94E04A25619DCEE3D2261AD2EE6BF12FFA06D98A0864"
+    "D87602733EC86A64521F2B18177B200CBBE117577A615D6C770988C0BAD946E2"
+    "08E24FA074E5AB3143DB5BFCE0FD108E4B82D120A92108011A723C12A787E6D7"
+    "88719A10BDBA5B2699C327186AF4E23C1A946834B6150BDA2583E9CA2AD44CE8"
+    "DBBBC2DB04DE8EF92E8EFC141FBECAA6287C59474E6BC05D99B2964FA090C3A2"
+    "233BA186515BE7ED1F612970CEE2D7AFB81BDD762170481CD0069127D5B05AA9"
+    "93B4EA988D8FDDC186FFB7DC90A6C08F4DF435C934063199FFFFFFFFFFFFFFFF", 16)
+"""
+Grupo MODP de 4096 bits de la RFC 3526.
+"""
+
+FFDHE2048 = int(
+    "FFFFFFFFFFFFFFFFADF85458A2BB4A9AAFDC5620273D3CF1D8B9C583CE2D3695"
+    "A9E13641146433FBCC939DCE249B3EF97D2FE363630C75D8F681B202AEC4617A"
+    "D3DF1ED5D5FD65612433F51F5F066ED0856365553DED1AF3B557135E7F57C935"
+    "984F0C70E0E68B77E2A689DAF3EFE8721DF158A136ADE73530ACCA4F483A797A"
+    "BC0AB182B324FB61D108A94BB2C8E3FBB96ADAB760D7F4681D4F42A3DE394DF4"
+    "AE56EDE76372BB190B07A7C8EE0A6D709E02FCE1CDF7E2ECC03404CD28342F61"
+    "9172FE9CE98583FF8E4F1232EEF28183C3FE3B1B4C6FAD733BB5FCBC2EC22005"
+    "C58EF1837D1683B2C6F34A26C1B2EFFA886B423861285C97FFFFFFFFFFFFFFFF", 16)
+"""
+Grupo ffdhe2048 de la RFC 7919.
+"""
+
+FFDHE3072 = int(
+    "FFFFFFFFFFFFFFFFADF85458A2BB4A9AAFDC5620273D3CF1D8B9C583CE2D3695"
+    "A9E13641146433FBCC939DCE249B3EF97D2FE363630C75D8F681B202AEC4617A"
+    "D3DF1ED5D5FD65612433F51F5F066ED0856365553DED1AF3B557135E7F57C935"
+    "984F0C70E0E68B77E2A689DAF3EFE8721DF158A136ADE73530ACCA4F483A797A"
+    "BC0AB182B324FB61D108A94BB2C8E3FBB96ADAB760D7F4681D4F42A3DE394DF4"
+    "AE56EDE76372BB190B07A7C8EE0A6D709E02FCE1CDF7E2ECC03404CD28342F61"
+    "9172FE9CE98583FF8E4F1232EEF28183C3FE3B1B4C6FAD733BB5FCBC2EC22005"
+    "C58EF1837D1683B2C6F34A26C1B2EFFA886B4238611FCFDCDE355B3B6519035B"
+    "BC34F4DEF99C023861B46FC9D6E6C9077AD91D2691F7F7EE598CB0FAC186D91C"
+    "AEFE130985139270B4130C93BC437944F4FD4452E2D74DD364F2E21E71F54BFF"
+    "5CAE82AB9C9DF69EE86D2BC522363A0DABC521979B0DEADA1DBF9A42D5C4484E"
+    "0ABCD06BFA53DDEF3C1B20EE3FD59D7C25E41D2B66C62E37FFFFFFFFFFFFFFFF", 16)
+"""
+Grupo ffdhe3072 de la RFC 7919.
+"""
+
+FFDHE4096 = int(
+    "FFFFFFFFFFFFFFFFADF85458A2BB4A9AAFDC5620273D3CF1D8B9C583CE2D3695"
+    "A9E13641146433FBCC939DCE249B3EF97D2FE363630C75D8F681B202AEC4617A"
+    "D3DF1ED5D5FD65612433F51F5F066ED0856365553DED1AF3B557135E7F57C935"
+    "984F0C70E0E68B77E2A689DAF3EFE8721DF158A136ADE73530ACCA4F483A797A"
+    "BC0AB182B324FB61D108A94BB2C8E3FBB96ADAB760D7F4681D4F42A3DE394DF4"
+    "AE56EDE76372BB190B07A7C8EE0A6D709E02FCE1CDF7E2ECC03404CD28342F61"
+    "9172FE9CE98583FF8E4F1232EEF28183C3FE3B1B4C6FAD733BB5FCBC2EC22005"
+    "C58EF1837D1683B2C6F34A26C1B2EFFA886B4238611FCFDCDE355B3B6519035B"
+    "BC34F4DEF99C023861B46FC9D6E6C9077AD91D2691F7F7EE598CB0FAC186D91C"
+    "AEFE130985139270B4130C93BC437944F4FD4452E2D74DD364F2E21E71F54BFF"
+    "5CAE82AB9C9DF69EE86D2BC522363A0DABC521979B0DEADA1DBF9A42D5C4484E"
+    "0ABCD06BFA53DDEF3C1B20EE3FD59D7C25E41D2B669E1EF16E6F52C3164DF4FB"
+    "7930E9E4E58857B6AC7D5F42D69F6D187763CF1D5503400487F55BA57E31CC7A"
+    "7135C886EFB4318AED6A1E012D9E6832A907600A918130C46DC778F971AD0038"
+    "092999A333CB8B7A1A1DB93D7140003C2A4ECEA9F98D0ACC0A8291CDCEC97DCF"
+    "8EC9B55A7F88A46B4DB5A851F44182E1C68A007E5E655F6AFFFFFFFFFFFFFFFF", 16)
+"""
+Grupo ffdhe4096 de la RFC 7919.
+"""
+
+GENERATOR = 2
+"""
+El generador de todos los grupos.
+"""
+
+GROUPS = {
+    "modp2048": MODP2048,
+    "modp3072": MODP3072,
+    "modp4096": MODP4096,
+    "ffdhe2048": FFDHE2048,
+    "ffdhe3072": FFDHE3072,
+    "ffdhe4096": FFDHE4096,
+}
+"""
+Los grupos disponibles: nombre -> p.
+"""
+
+DEFAULT_GROUPS = {
+    2048: "ffdhe2048",
+    3072: "ffdhe3072",
+    4096: "ffdhe4096",
+}
+"""
+El grupo que se usa por defecto para cada tamaño de clave.
+"""
+
+
+def get_group(group):
+    """
+    Devuelve los parámetros de un grupo.
+
+    :param group: El nombre del grupo (ver :data:`GROUPS`) o un tamaño
+        de clave en bits (ver :data:`DEFAULT_GROUPS`).
+
+    :returns: Una tupla (p, g, q).
+
+    :raises ValueError: Si no existe el grupo.
+    """
+    name = DEFAULT_GROUPS.get(group, group)
+    if name not in GROUPS:
+        raise ValueError("No existe el grupo {}".format(group))
+    p = GROUPS[name]
+    return p, GENERATOR, (p - 1) // 2
+
+
+def find_group(p, g):
+    """
+    Busca el grupo al que pertenecen unos parámetros de dominio, por
+    ejemplo los de una clave cargada.
+
+    :param p: El módulo.
+    :param g: El generador.
+
+    :returns: El nombre del grupo o `None` si no es ninguno de
+        :data:`GROUPS`.
+    """
+    if g != GENERATOR:
+        return None
+    for name, prime in GROUPS.items():
+        if prime == p:
+            return name
+    return None
+
+
+def verify_group(p, g):
+    """
+    Comprueba que p es un primo seguro y que g genera el subgrupo de
+    orden :math:`q = (p - 1) / 2`. Las pruebas de primalidad son
+    probabilísticas y con primos grandes tardan, así que no se hacen al
+    cargar el módulo.
+
+    :param p: El módulo.
+    :param g: El generador.
+
+    :returns: `True` si los parámetros son válidos.
+    """
+    q = (p - 1) // 2
+    return (is_prime(p) and is_prime(q)
+            and 1 < g < p - 1 and jacobi(g, p) == 1)
@@ -0,0 +1,142 @@
+"""
+Aquí se encuentra la cola de votos pendientes (*mempool*) de una
+*blockchain*: los votos que ya se han emitido pero todavía no forman
+parte de ningún bloque.
+"""
+
+import time
+
+from collections import OrderedDict
+
+from merkle import ticket_hash
+
+
+MAX_SIZE = 100000
+"""
+La cantidad máxima de votos pendientes que admite la cola.
+"""
+
+MAX_BLOCK_VOTES = 1000
+"""
+La cantidad máxima de votos que se incluye en un bloque.
+"""
+
+MAX_BLOCK_BYTES = 4 * 2**20
+"""
+El tamaño máximo aproximado, en bytes serializados, de los votos de un
+bloque.
+"""
+
+
+class Mempool:
+    """
+    Cola acotada de votos pendientes, indexada por firma.
+
+    Los votos se guardan en orden de llegada. Cada firma tiene como
+    mucho un voto pendiente: un voto nuevo con la misma firma sustituye
+    al anterior (o se rechaza si ``replace`` es `False`).
+
+    :param max_size: la cantidad máxima de votos pendientes.
+    :param max_block_votes: la cantidad máxima de votos por bloque.
+    :param max_block_bytes: el tamaño máximo de los votos de un bloque.
+    :param replace: si un voto repetido sustituye al anterior.
+    """
+
+    def __init__(self, max_size=MAX_SIZE, max_block_votes=MAX_BLOCK_VOTES,
+                 max_block_bytes=MAX_BLOCK_BYTES, replace=True):
+        self.max_size = max_size
+        self.max_block_votes = max_block_votes
+        self.max_block_bytes = max_block_bytes
+        self.replace = replace
+        #: firma -> (voto, tamaño, tiempo de llegada)
+        self._entries = OrderedDict()
+
+    def add(self, vote, size=0):
+        """
+        Añade un voto a la cola.
+
+        :param vote: el voto, con su firma en ``vote["signature"]``.
+        :param size: el tamaño del voto serializado, en bytes.
+
+        :raises ValueError: si la cola está llena o si ya hay un voto
+            pendiente con la misma firma y no se admiten sustituciones.
+        """
+        signature = vote["signature"]
+        if signature in self._entries:
+            if not self.replace:
+                raise ValueError("Ya hay un voto pendiente con esta firma")
+            del self._entries[signature]
+        elif len(self._entries) >= self.max_size:
+            raise ValueError("La cola de votos pendientes está llena")
+        self._entries[signature] = (vote, size, time.time())
+
+    def remove(self, signatures):
+        """
+        Quita de la cola los votos pendientes de un conjunto de firmas.
+
+        :param signatures: un iterable de firmas.
+        """
+        for signature in signatures:
+            self._entries.pop(signature, None)
+
+    def discard(self, votes, tickets):
+        """
+        Quita de la cola los votos que acaban de incluirse en un bloque
+        recibido de otro nodo. Un voto pendiente más reciente con la
+        misma firma se mantiene.
+
+        :param votes: los votos del bloque.
+        :param tickets: los *hashes* de esos votos (ver
+            :func:`merkle.ticket_hash`).
+        """
+        for vote, ticket in zip(votes, tickets):
+            entry = self._entries.get(vote["signature"])
+            if entry and ticket_hash(entry[0]) == ticket:
+                del self._entries[vote["signature"]]
+
+    def take_block(self):
+        """
+        Saca de la cola los votos más antiguos que quepan en un bloque,
+        respetando :attr:`max_block_votes` y :attr:`max_block_bytes`. El
+        resto permanece en la cola. Siempre se saca al menos un voto si
+        la cola no está vacía.
+
+        :return: una lista de votos.
+        """
+        votes = []
+        total = 0
+        for signature, (vote, size, _) in self._entries.items():
+            if len(votes) >= self.max_block_votes:
+                break
+            if votes and total + size > self.max_block_bytes:
+                break
+            votes.append(vote)
+            total += size
+        for vote in votes:
+            del self._entries[vote["signature"]]
+        return votes
+
+    def oldest_age(self):
+        """
+        :return: los segundos que lleva en la cola el voto más antiguo,
+            o 0 si la cola está vacía.
+        """
+        if not self._entries:
+            return 0
+        _, _, added = next(iter(self._entries.values()))
+        return time.time() - added
+
+    def depth(self):
+        """
+        :return: la cantidad de votos pendientes.
+        """
+        return len(self._entries)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, signature):
+        return signature in self._entries
+
+    def __iter__(self):
+        return (vote for vote, _, _ in self._entries.values())
@@ -0,0 +1,117 @@
+"""
+Aquí se encuentra el árbol de Merkle con el que cada bloque se
+compromete con los votos que contiene.
+
+Las hojas son los *hashes* de los votos (ver :func:`ticket_hash`). Los
+*hashes* de las hojas y de los nodos internos se calculan con prefijos
+distintos, de modo que una hoja no se puede hacer pasar por un nodo
+interno. Un nodo sin pareja en un
+nivel sube sin cambios al nivel siguiente.
+
+Una prueba de inclusión es la lista de *hashes* hermanos desde la hoja
+hasta la raíz, así que se verifica con :math:`O(\\log n)` *hashes*.
+"""
+
+import hashlib
+
+import codec
+
+
+LEAF_PREFIX = b"\x00"
+NODE_PREFIX = b"\x01"
+
+
+def ticket_hash(vote):
+    """
+    Devuelve el *hash* de un voto, que sirve al votante como
+    comprobante y como hoja del árbol de Merkle de su bloque.
+
+    :param vote: un `dict` con las opciones cifradas, las pruebas y la
+        firma.
+
+    :return: el *hash* SHA256 de su serialización JSON canónica, en
+        hexadecimal.
+    """
+    return hashlib.sha256(codec.encode(vote)).hexdigest()
+
+
+def leaf_hash(ticket):
+    """
+    :param ticket: el *hash* de un voto, en hexadecimal.
+
+    :return: el *hash* de la hoja correspondiente, en bytes.
+    """
+    return hashlib.sha256(LEAF_PREFIX + bytes.fromhex(ticket)).digest()
+
+
+def node_hash(left, right):
+    """
+    :return: el *hash* del nodo padre de dos nodos, en bytes.
+    """
+    return hashlib.sha256(NODE_PREFIX + left + right).digest()
+
+
+def _levels(tickets):
+    """
+    Construye todos los niveles del árbol, desde las hojas hasta la
+    raíz.
+    """
+    level = [leaf_hash(ticket) for ticket in tickets]
+    levels = [level]
+    while len(level) > 1:
+        level = [node_hash(level[i], level[i + 1]) if i + 1 < len(level) else level[i]
+                 for i in range(0, len(level), 2)]
+        levels.append(level)
+    return levels
+
+
+def merkle_root(tickets):
+    """
+    Calcula la raíz del árbol de Merkle de una lista de votos.
+
+    :param tickets: los *hashes* de los votos, en hexadecimal y en el
+        orden en que aparecen en el bloque.
+
+    :return: la raíz en hexadecimal.
+    """
+    if not tickets:
+        return hashlib.sha256(b"").hexdigest()
+    return _levels(tickets)[-1][0].hex()
+
+
+def merkle_proof(tickets, position):
+    """
+    Construye la prueba de inclusión de un voto.
+
+    :param tickets: los *hashes* de los votos del bloque.
+    :param position: la posición del voto en el bloque.
+
+    :return: una lista de pares (lado, *hash* hermano en hexadecimal),
+        donde el lado es ``"L"`` si el hermano va a la izquierda y
+        ``"R"`` si va a la derecha.
+    """
+    proof = []
+    for level in _levels(tickets)[:-1]:
+        sibling = position ^ 1
+        if sibling < len(level):
+            proof.append(("L" if sibling < position else "R", level[sibling].hex()))
+        position //= 2
+    return proof
+
+
+def verify_merkle_proof(ticket, proof, root):
+    """
+    Verifica una prueba de inclusión.
+
+    :param ticket: el *hash* del voto en hexadecimal.
+    :param proof: la prueba devuelta por :func:`merkle_proof`.
+    :param root: la raíz del bloque en hexadecimal.
+
+    :return: `True` si el voto está incluido en el bloque, `False` en
+        cualquier otro caso.
+    """
+    node = leaf_hash(ticket)
+    for side, sibling in proof:
+        sibling = bytes.fromhex(sibling)
+        node = node_hash(sibling, node) if side == "L" else node_hash(node, sibling)
+    return node.hex() == root
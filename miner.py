@@ -0,0 +1,177 @@
+"""
+Aquí se encuentra el minero paralelo utilizado por la *blockchain* para
+generar *proof-of-work*.
+
+El espacio de *nonces* se reparte en bloques de tamaño fijo entre un
+conjunto de procesos: el proceso i prueba los bloques i, i + n,
+i + 2n... de modo que ningún par de procesos repite trabajo. El prefijo
+común (la prueba y el *hash* del bloque anterior) se pasa una sola vez
+por la función *hash* y cada intento solo añade el *nonce* a una copia
+de ese estado.
+
+Una prueba es válida si el *hash* del intento, leído como un entero de
+256 bits, es menor que el objetivo (*target*) de la cadena: cuanto
+menor es el objetivo, más difícil es encontrar una prueba.
+"""
+
+import hashlib
+import multiprocessing
+import os
+import queue
+
+from random import SystemRandom
+
+
+CHUNK_SIZE = 2**14
+"""
+La cantidad de *nonces* consecutivos que prueba un proceso antes de
+comprobar si otro proceso ya ha encontrado una prueba o si se ha
+cancelado la búsqueda.
+"""
+
+POLL_INTERVAL = 0.1
+"""
+Cada cuántos segundos comprueba el proceso principal la señal de
+cancelación mientras espera a los procesos mineros.
+"""
+
+WORKERS = os.cpu_count() or 1
+"""
+El número de procesos mineros por defecto.
+"""
+
+#: Los procesos mineros se crean con *spawn* y no con *fork*: el
+#: servidor mina desde un hilo verde de eventlet tras
+#: ``monkey_patch()``, y un proceso creado con *fork* desde ahí hereda
+#: el estado del *hub* y no llega a ejecutar :func:`_mine_worker`.
+_CONTEXT = multiprocessing.get_context("spawn")
+
+
+def difficulty_target(difficulty):
+    """
+    Devuelve el objetivo equivalente a exigir una cantidad de ceros
+    hexadecimales al principio del *hash*.
+
+    :param difficulty: la cantidad de ceros hexadecimales.
+    """
+    return 2**(256 - 4 * difficulty)
+
+
+def proof_value(prev_proof, prev_hash, proof):
+    """
+    Devuelve el *hash* de un intento como un entero, para compararlo
+    con el objetivo.
+    """
+    digest = hashlib.sha256(f"{prev_proof}{prev_hash}{proof}".encode()).digest()
+    return int.from_bytes(digest, "big")
+
+
+def proof_prefix(prev_proof, prev_hash):
+    """
+    Devuelve el estado de la función *hash* tras procesar el prefijo
+    común de todos los intentos de un mismo bloque.
+
+    :param prev_proof: la prueba del bloque anterior.
+    :param prev_hash: el *hash* del bloque anterior.
+
+    :return: un objeto ``hashlib.sha256`` listo para ser copiado.
+    """
+    return hashlib.sha256(f"{prev_proof}{prev_hash}".encode())
+
+
+def search_range(prefix_state, target, start, count):
+    """
+    Busca una prueba válida en el rango ``[start, start + count)``.
+
+    :param prefix_state: el estado devuelto por :func:`proof_prefix`.
+    :param target: el objetivo que debe cumplir la prueba.
+    :param start: el primer *nonce* del rango.
+    :param count: la cantidad de *nonces* a probar.
+
+    :return: el primer *nonce* válido del rango o `None` si no hay.
+    """
+    for nonce in range(start, start + count):
+        attempt = prefix_state.copy()
+        attempt.update(str(nonce).encode())
+        if int.from_bytes(attempt.digest(), "big") < target:
+            return nonce
+    return None
+
+
+def _mine_worker(prefix, target, start, stride, found, results):
+    """
+    Función ejecutada por cada proceso minero. Recorre sus bloques de
+    *nonces* hasta encontrar una prueba o hasta que se active ``found``.
+    """
+    prefix_state = hashlib.sha256(prefix)
+    nonce = start
+    while not found.is_set():
+        proof = search_range(prefix_state, target, nonce, CHUNK_SIZE)
+        if proof is not None:
+            found.set()
+            results.put(proof)
+            return
+        nonce += stride
+
+
+def mine(prev_proof, prev_hash, target, workers=None, cancel=None):
+    """
+    Busca en paralelo un *proof-of-work* para el bloque siguiente al
+    descrito por ``prev_proof`` y ``prev_hash``.
+
+    :param prev_proof: la prueba del bloque anterior.
+    :param prev_hash: el *hash* del bloque anterior.
+    :param target: el objetivo que debe cumplir la prueba (ver
+        :func:`difficulty_target`).
+    :param workers: el número de procesos a utilizar. Por defecto
+        :data:`WORKERS`. Con un solo proceso la búsqueda se hace en el
+        proceso actual.
+    :param cancel: un objeto con un método ``is_set`` (por ejemplo un
+        ``threading.Event``) que detiene la búsqueda al activarse, por
+        ejemplo cuando cambia el último bloque de la cadena.
+
+    :return: una prueba válida o `None` si se ha cancelado la búsqueda.
+    """
+    workers = workers or WORKERS
+    start = SystemRandom().randint(0, 2**128)
+
+    if workers == 1:
+        prefix_state = proof_prefix(prev_proof, prev_hash)
+        nonce = start
+        while not (cancel and cancel.is_set()):
+            proof = search_range(prefix_state, target, nonce, CHUNK_SIZE)
+            if proof is not None:
+                return proof
+            nonce += CHUNK_SIZE
+        return None
+
+    prefix = f"{prev_proof}{prev_hash}".encode()
+    found = _CONTEXT.Event()
+    results = _CONTEXT.Queue()
+    processes = [
+        _CONTEXT.Process(
+            target=_mine_worker,
+            args=(prefix, target, start + i * CHUNK_SIZE,
+                  workers * CHUNK_SIZE, found, results),
+            daemon=True
+        )
+        for i in range(workers)
+    ]
+    for process in processes:
+        process.start()
+
+    proof = None
+    try:
+        while proof is None:
+            if cancel and cancel.is_set():
+                break
+            try:
+                proof = results.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                pass
+    finally:
+        found.set()
+        for process in processes:
+            process.join()
+
+    return proof
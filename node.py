@@ -22,6 +22,7 @@ from uuid import uuid4
 import zmq
 
 from blockchain import Blockchain
+from codec import pack_message, unpack_message
 from crypto import construct_proof, encrypt_for_vote, load_keys
 
 CONNECT_FORMAT_STR = "{protocol}://{address}:{port}"
@@ -35,6 +36,12 @@ logging.basicConfig(format=LOGGER_FORMAT)
 
 HEARTBEAT_INTERVAL = 5
 
+MESSAGE_FORMAT = "binary"
+"""
+El formato del contenido de los mensajes (ver :mod:`codec`). Los
+mensajes recibidos se aceptan en cualquier formato.
+"""
+
 class Node:
     """
     La clase nodo
@@ -107,7 +114,7 @@ class Node:
         :param port: el puerto
         """
         logger.info(json.dumps(self.serialize()).encode())
-        self.send_message(b"PEER " + json.dumps(self.serialize()).encode(), address, port)
+        self.send_message(pack_message("PEER", self.serialize(), MESSAGE_FORMAT), address, port)
 
     def send_vote(self, election_id, options, signature: int):
         """
@@ -138,10 +145,10 @@ class Node:
             "signature": signature
         }
     
-        vote_message = "VOTE " + json.dumps(vote)
+        vote_message = pack_message("VOTE", vote, MESSAGE_FORMAT)
 
         self.publish_queue.append(vote_message)
-        self.send_message(vote_message.encode(), "127.0.0.1", 5560)
+        self.send_message(vote_message, "127.0.0.1", 5560)
         #:TODO: make_receipt
 
         return vote
@@ -179,7 +186,7 @@ class Node:
                     message = sub_socket.recv()
                     logger.info(f"SUB: " + str(message))
                     if message[0:4] == b"PEER":
-                        peer_info = json.loads(message.decode()[4:])
+                        _, peer_info = unpack_message(message)
                         if peer_info not in self.peers and self.serialize() != peer_info:
                             #: TODO: Hacer verificación
                             try:
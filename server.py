@@ -28,11 +28,16 @@ from flask_socketio import SocketIO, emit
 
 import eventlet.green.zmq as zmq
 
-from crypto import (encrypt_for_vote, load_keys, reconstruct_key,
-        load_decryption_table, update_decryption_table,
-        save_decryption_table)
+import codec
+
+from crypto import encrypt_for_vote, load_keys, reconstruct_key
 from blockchain import Blockchain
-from utils import get_final_votes, create_new_key_dict
+from blocklog import BlockLog
+from codec import pack_message, unpack_message
+from dlogtable import DECRYPTION_TABLE_DEFAULT, TableBuilder
+from merkle import ticket_hash
+from signature import load_signature, public_key_pem
+from utils import get_final_votes
 
 LOGGER_NAME = "Flask server"
 LOGGER_FORMAT = "[%(levelname)s][%(asctime)s][%(name)s] %(message)s"
@@ -54,11 +59,11 @@ thread = None
 publish_queue = []
 
 
-DECRYPT_TABLE_FILE = "conf/decrypt_table"
-try:
-    decrypt_table = load_decryption_table({}, DECRYPT_TABLE_FILE)
-except:
-    decrypt_table = {}
+DECRYPT_TABLE_DIR = "conf/decrypt_tables"
+"""
+El directorio con las tablas de descifrado (ver :mod:`dlogtable`).
+"""
+table_builder = TableBuilder(DECRYPT_TABLE_DIR)
 
 
 PEER_LIST_FILE = "conf/peers.json"
@@ -72,25 +77,53 @@ except Exception as e:
     logger.debug("No previous peers detected, creating new file at " + PEER_LIST_FILE)
 
 
-def load_blockchain(filepath):
+LOAD_WORKERS = 1
+"""
+El número de procesos con los que se recuenta cada cadena al cargarla.
+El servidor corre con ``eventlet.monkey_patch()``, bajo el que
+``multiprocessing.Pool`` se bloquea, así que el recuento se hace en el
+propio proceso (ver :func:`crypto.green_threads`).
+"""
+
+def load_blockchain(filepath, fmt="json"):
     """
     Función de ayuda para cargar una serie de *blockchains* desde un
     fichero y desserializarlas, instanciando los objetos que las
     representan.
 
-    :param filepath: El fichero desde donde cargar las cadenas.
+    Si ``filepath`` es un directorio, cada subdirectorio se trata como
+    el registro en disco (ver :mod:`blocklog`) de una elección cuyo id
+    es el nombre del subdirectorio. Las entradas que no se pueden
+    cargar se saltan y se anotan en el log, sin afectar a las demás.
+
+    :param filepath: El fichero o directorio desde donde cargar las
+        cadenas.
+    :param fmt: el formato en el que se escriben los registros nuevos
+        de cada cadena.
 
     :return: una tabla hash con cada blockchain indexada por el id de
         la elección que representa.
     """
     try:
-        loaded_chain = json.load(open(filepath))
         ring = {}
-        for i in list(loaded_chain.keys()):
-            # XXX: Resulta que json solo admite strings como keys, entonces
-            # hay que convertir la clave a int
-            key = int(i)
-            ring[key] = Blockchain.construct(json.loads(loaded_chain[i]))
+        if os.path.isdir(filepath):
+            for i in os.listdir(filepath):
+                try:
+                    ring[int(i)] = Blockchain.from_log(BlockLog(os.path.join(filepath, i), fmt=fmt),
+                                                       LOAD_WORKERS)
+                except Exception as e:
+                    logger.warning("No se ha podido cargar la cadena {}: {!r}".format(i, e))
+        else:
+            with open(filepath, "rb") as f:
+                loaded_chain = codec.decode(f.read())
+            for i in list(loaded_chain.keys()):
+                # XXX: Resulta que json solo admite strings como keys, entonces
+                # hay que convertir la clave a int
+                key = int(i)
+                blocks = loaded_chain[i]
+                if isinstance(blocks, str):
+                    blocks = json.loads(blocks)
+                ring[key] = Blockchain.construct(blocks)
         logger.debug("Loaded chain ring succesfully from " + filepath)
         logger.debug("Chain ring: " + repr(list(ring.keys())))
         return ring
@@ -99,23 +132,70 @@ def load_blockchain(filepath):
         logger.debug("No chains detected, creating new file at " + filepath)
         return {}
 
-def save_chain_ring(ring, filepath):
+def save_chain_ring(ring, filepath, fmt="json"):
     """
     Serializa y guarda en un fichero una lista de *blockchains*.
 
+    .. note:: El servidor guarda cada cadena en su propio registro en
+        disco a medida que cambia; esta función solo sirve para exportar
+        un conjunto de cadenas a un único fichero.
+
     :param ring: un `dict` con las blockchains
     :param filepath: El fichero donde guardar las cadenas.
+    :param fmt: el formato, ``"json"`` o ``"binary"`` (ver
+        :mod:`codec`).
     """
     try:
-        with open(filepath, "w") as f:
-            json.dump({chain_id: ring[chain_id].serialize() for chain_id in ring}, f)
+        if fmt == "binary":
+            with open(filepath, "wb") as f:
+                f.write(codec.with_header(codec.dict_value(
+                    (chain_id, ring[chain_id].binary_value()) for chain_id in ring)))
+        else:
+            with open(filepath, "w") as f:
+                json.dump({chain_id: ring[chain_id].serialize() for chain_id in ring}, f)
     except:
         pass
 
+def chain_log(election_id):
+    """
+    Devuelve el registro en disco de una elección.
+
+    :param election_id: el id de la elección.
+    """
+    return BlockLog(os.path.join(CHAIN_DIR, str(election_id)), fmt=CHAIN_FORMAT)
+
+CHAIN_FORMAT = "binary"
+"""
+El formato de los registros nuevos en disco de las cadenas. ``"json"``
+resulta más cómodo para depurar; los registros existentes se leen en
+cualquiera de los dos formatos.
+"""
+MESSAGE_FORMAT = "binary"
+"""
+El formato del contenido de los mensajes enviados a los nodos.
+"""
+CHAIN_DIR = "conf/chains"
 CHAIN_RING_FILE = "conf/chain.json"
 FINISHED_CHAIN_RING_FILE = "conf/fchain.json"
-chain_ring = load_blockchain(CHAIN_RING_FILE) 
-finished_chain_ring = load_blockchain(FINISHED_CHAIN_RING_FILE)
+#: Las elecciones en curso y las terminadas, indexadas por su id. Se
+#: llenan al arrancar el servidor (ver :func:`load_chains`).
+chain_ring = {}
+finished_chain_ring = {}
+
+def load_chains():
+    """
+    Carga en :data:`chain_ring` las elecciones guardadas en
+    :data:`CHAIN_DIR`. Las cadenas guardadas con el formato anterior,
+    en un único fichero, se pasan a su propio registro la primera vez
+    que se cargan.
+    """
+    chain_ring.update(load_blockchain(CHAIN_DIR, CHAIN_FORMAT))
+    for legacy_file in (CHAIN_RING_FILE, FINISHED_CHAIN_RING_FILE):
+        if os.path.isfile(legacy_file):
+            for election_id, chain in load_blockchain(legacy_file).items():
+                if election_id not in chain_ring:
+                    chain.attach_log(chain_log(election_id))
+                    chain_ring[election_id] = chain
 
 
 
@@ -130,18 +210,21 @@ def update_chains():
     lista de elecciones en curso a la lista de elecciones terminadas
     todas las cadenas cuyo tiempo de finalización hayan acabado.
 
-    También guarda cualquier tabla de consulta de descifrado que haya
-    cambiado.
+    Las cadenas no se guardan aquí: cada bloque y cada voto se añaden a
+    su registro en disco en el momento en que se crean.
+
+    También recoge las tablas de descifrado que se han terminado de
+    construir y empieza las que estén en cola.
     """
     finished_chains = list(filter(lambda c: chain_ring[c].end_time < time.time(), chain_ring))
     finished_chain_ring.update({c: chain_ring.pop(c) for c in finished_chains})
     if list(finished_chains):
         logger.info("LAS ELECCIONES {} HAN ACABADO".format(", ".join([str(c) for c in finished_chains])))
-    save_chain_ring(chain_ring, CHAIN_RING_FILE)
-    save_chain_ring(finished_chain_ring, FINISHED_CHAIN_RING_FILE)
-    save_decryption_table(decrypt_table, DECRYPT_TABLE_FILE)
-
-update_chains()
+    for name in table_builder.poll():
+        logger.info("Tabla de descifrado {} construida".format(name))
+    for name in table_builder.failed:
+        logger.warning("No se ha podido construir la tabla de descifrado {}".format(name))
+    table_builder.failed.clear()
 
 
 def log_messages_as_json():
@@ -208,7 +291,7 @@ def tally_final(election_id):
     election_chain = finished_chain_ring[election_id]
     return render_template("tally_final.html",
             election=election_chain.name,
-            tally = list(zip(election_chain.options, get_final_votes(election_chain)))
+            tally = list(zip(election_chain.options, get_final_votes(election_chain, DECRYPT_TABLE_DIR)))
             )
 
 @app.route("/monitor")
@@ -240,9 +323,7 @@ def vote(election):
     """
     election_chain = chain_ring[election]
     sig = hashlib.sha256(request.remote_addr.encode()+request.user_agent.string.encode()).hexdigest()
-    sig_exists = False
-    if sig in create_new_key_dict(election_chain.votes, "signature"):
-        sig_exists = True
+    sig_exists = election_chain.has_voted(sig)
     return render_template(
         "options.html",
         election=election_chain.name,
@@ -273,9 +354,14 @@ def cast():
         proofs=proofs,
         signature=hashlib.sha256(request.remote_addr.encode() + request.user_agent.string.encode()).hexdigest()
     )
-    chain.create_vote(**vote_ticket)
+    try:
+        chain.create_vote(**vote_ticket)
+    except ValueError as e:
+        logger.warning(e)
+        return str(e), 503
     #broadcast_vote(**vote_ticket)
     update_chains()
+    vote_ticket["ticket"] = ticket_hash(vote_ticket)
     vote_ticket["election_id"] = election_id
     logger.info("Voto emitido: " + str(vote_ticket))
     return render_template("cast.html", vote_ticket=json.dumps(vote_ticket)) 
@@ -293,11 +379,11 @@ def broadcast_vote(options, proofs, signature):
     for peer in peer_list:
         socket.connect("tcp://{}:{}".format(peer["ip_address"], peer["rep_port"]))
         socket.send(b"", zmq.SNDMORE)
-        socket.send(b"VOTE " + json.dumps({
+        socket.send(pack_message("VOTE", {
             "options": options,
             "proofs": proofs,
             "signature": signature,
-        }).encode())
+        }, MESSAGE_FORMAT))
     socket.close()
 
 def get_times_for_template(ring):
@@ -398,7 +484,6 @@ def api_send():
             signature=signature
         )
         chain.create_vote(**vote_ticket)
-        save_chain_ring(chain_ring, CHAIN_RING_FILE)
         vote_ticket["election_id"] = election_id
         #: XXX: Fin bloque de transmisión
         return jsonify(**vote_ticket)
@@ -420,9 +505,16 @@ def api_create():
             end_time: ...,
             public_key: ...,
             voter_list: ...,
-            option_list: ...
+            option_list: ...,
+            consensus: ...,
+            sealers: ...
         }
 
+    ``consensus`` es opcional: ``"pow"`` (por defecto) o ``"poa"``. En
+    una elección ``"poa"`` los bloques los sellan las claves de
+    ``sealers`` (en formato PEM); si no se indican, el único sellador
+    es este nodo.
+
     Con estos datos, crea el blockchain correspondiente, lo distribuye
     entre los nodos conocidos y empieza a computar la tabla de
     descifrado para usarla al final de la votación.
@@ -430,20 +522,58 @@ def api_create():
     election_data = request.get_json()
     name = election_data.get("name")
     election_id = SystemRandom().randint(0, 2**256-1)
-    while election_id in chain_ring:
+    # Un id cuyo registro existe en disco pero no se ha podido cargar
+    # tampoco se reutiliza.
+    while (election_id in chain_ring or election_id in finished_chain_ring
+           or os.path.exists(os.path.join(CHAIN_DIR, str(election_id)))):
         election_id = SystemRandom().randint(0, 2**256-1)
     start_time = float(election_data.get("start_time", time.time()))
     end_time = float(election_data.get("end_time", time.time() + 3600))
     public_key = election_data.get("public_key")
     voter_list = election_data.get("voter_list")
     option_list = election_data.get("option_list")
+    consensus = election_data.get("consensus", "pow")
+    sealers = election_data.get("sealers")
+    if consensus == "poa" and not sealers and sealer_key is not None:
+        sealers = [public_key_pem(sealer_key)]
     
-    chain_ring[election_id] = Blockchain(start_time, None, end_time, reconstruct_key(public_key), voter_list, option_list, name)
-    save_chain_ring(chain_ring, CHAIN_RING_FILE)
-    eventlet.spawn_n(update_decryption_table, decrypt_table, chain_ring[election_id].public_key)
+    chain_ring[election_id] = Blockchain(start_time, None, end_time, reconstruct_key(public_key), voter_list, option_list, name,
+                                         consensus=consensus, sealers=sealers)
+    chain_ring[election_id].attach_log(chain_log(election_id))
+    key = chain_ring[election_id].public_key
+    table_builder.request(int(key.g), int(key.p), len(voter_list) if voter_list else DECRYPTION_TABLE_DEFAULT)
     logger.info("Elección creada: " + name)
     return jsonify({election_id: chain_ring[election_id].serialize()})
 
+@app.route("/api/receipt", methods=("POST",))
+def api_receipt():
+    """
+    La función del API que devuelve el comprobante de inclusión de un
+    voto.
+
+    Acepta una petición POST que envíe un JSON con formato:
+    ::
+
+        {
+            election_id: ...,
+            signature: ...,
+            ticket: ...
+        }
+
+    donde basta con indicar la firma o el *hash* del voto (``ticket``,
+    el que se muestra al votar). Devuelve la prueba de Merkle que
+    permite comprobar que el voto está en su bloque (ver
+    :meth:`blockchain.Blockchain.vote_receipt`), o un JSON vacío si el
+    voto todavía no está en ningún bloque.
+    """
+    data = request.get_json()
+    election_id = int(data.get("election_id", 0))
+    chain = chain_ring.get(election_id) or finished_chain_ring.get(election_id)
+    if not chain:
+        return jsonify({})
+    receipt = chain.vote_receipt(data.get("signature"), data.get("ticket"))
+    return jsonify(receipt or {})
+
 @app.route("/api/log", methods=("POST",))
 def api_log():
     """
@@ -454,6 +584,15 @@ def api_log():
     """
     return jsonify(open(SERVER_LOG_FILE).readlines()[-int(request.lines):])
 
+@app.route("/api/tables")
+def api_tables():
+    """
+    Función del API que devuelve el progreso de las tablas de
+    descifrado en construcción: un JSON con la fracción construida de
+    cada tabla.
+    """
+    return jsonify(table_builder.progress())
+
 @socketio.on("connect")
 def on_connect():
     """
@@ -491,10 +630,9 @@ def handle_nodes():
             messages = dict(poller.poll(1000))
             if socket in messages:
                 msg = socket.recv()
-                logger.info("Received message on REP socket " + msg.decode())
                 socket.send(b"READY")
-                msg_header = msg.decode()[:4]
-                msg_dict = json.loads(msg.decode()[5:])
+                msg_header, msg_dict = unpack_message(msg)
+                logger.info("Received message on REP socket " + msg_header)
                 # aquí iría un "switch" para cada posible header
                 # este es solo para el header PEER
                 if msg_header == "PEER" and msg_dict not in peer_list:
@@ -511,28 +649,52 @@ def handle_nodes():
         except Exception as e:
             logger.warning(e)
 
-socketio.start_background_task(target=handle_nodes)
 
 
+MINER_WORKERS = None
+"""
+El número de procesos utilizados para buscar cada *proof-of-work*. Con
+`None` se utiliza un proceso por núcleo.
+"""
+
+SEALER_KEY_FILE = "conf/sealer.pem"
+"""
+La clave ECDSA con la que este nodo sella los bloques de las elecciones
+*proof-of-authority* en las que es sellador.
+"""
+try:
+    sealer_key = load_signature(SEALER_KEY_FILE)
+except Exception as e:
+    logger.debug("Sin clave de sellador: " + str(e))
+    sealer_key = None
 
 def run_proof_of_work():
     """
     Corre proof-of-work sobre las *blockchains* conocidas.
 
-    Esta función corre en un hilo propio.
+    Esta función corre en un hilo propio. La búsqueda de la prueba se
+    hace en procesos aparte (ver :mod:`miner`), de modo que este hilo
+    solo espera el resultado sin bloquear el resto del servidor.
     """
     logger.debug("STARTED BACKGROUND TASK: PROOF OF WORK")
     while True:
-        for chain in chain_ring.values():
-            idx = chain.create_new_block(chain.proof_of_work()).get("index")
+        for chain in list(chain_ring.values()):
+            if not chain.mempool:
+                continue
+            if chain.consensus == "poa":
+                if sealer_key is None:
+                    continue
+                idx = chain.create_new_block(sealer_key=sealer_key).get("index")
+            else:
+                idx = chain.create_new_block(chain.proof_of_work(MINER_WORKERS)).get("index")
             if idx:
                 logger.info("BLOQUE (N {}) CREADO EN ELECCIÓN {}".format(
                     idx, chain.name))
+                logger.debug("Votos pendientes en {}: {} (el más antiguo hace {:.1f}s)".format(
+                    chain.name, chain.mempool.depth(), chain.mempool.oldest_age()))
         update_chains()
         eventlet.sleep(3)
 
-socketio.start_background_task(target=run_proof_of_work)
-
 def human_readable_time(secs):
     """
     Convierte tiempo UNIX a un formato de tiempo apropiado para ser
@@ -555,5 +717,24 @@ def log_message(message):
     """
     logger.debug("Socketio message received: \"" + message + "\"")
 
+def start():
+    """
+    Carga las elecciones guardadas y lanza las tareas de fondo del
+    servidor: la comunicación con los nodos (:func:`handle_nodes`) y la
+    creación de bloques (:func:`run_proof_of_work`).
+
+    Solo se llama al ejecutar el servidor, no al importar el módulo:
+    los procesos mineros se crean con *spawn* (ver :mod:`miner`) y cada
+    uno vuelve a importar el módulo principal, que no debe cargar las
+    cadenas ni lanzar otra vez las tareas. Por lo mismo el servidor se
+    ejecuta sin el recargador automático de Flask, que lo volvería a
+    arrancar en otro proceso sobre los mismos registros.
+    """
+    load_chains()
+    update_chains()
+    socketio.start_background_task(target=handle_nodes)
+    socketio.start_background_task(target=run_proof_of_work)
+
 if __name__ == "__main__":
-    socketio.run(app, host="0.0.0.0", port=8000, debug=True) 
+    start()
+    socketio.run(app, host="0.0.0.0", port=8000, debug=True, use_reloader=False) 
@@ -13,9 +13,11 @@ copyright original:
 Las modificaciones adicionales están bajo una licencia MIT.
 """
 
-from math import ceil, log
-from random import SystemRandom
-from functools import reduce
+import os
+
+from functools import lru_cache
+
+from arith import invert
 
 MERSENNE_PRIME = 2**2203 - 1
 """
@@ -25,87 +27,154 @@ nuestra clave. (Ya que nuestra clave es de 2048 bits: :math:`2^{2203}-1
 >2^{2048}`
 """
 
+LAGRANGE_CACHE_SIZE = 256
+"""
+La cantidad de conjuntos de índices cuyos coeficientes de Lagrange se
+mantienen en memoria (ver :func:`lagrange_coefficients`).
+"""
+
+
+def _reduce(value, prime):
+    """
+    Reduce un número no negativo módulo ``prime``. Si el primo es de
+    Mersenne, :math:`2^k-1`, se usa que :math:`2^k \\equiv 1`: se suman
+    los k bits bajos y el resto desplazado, lo que con enteros de Python
+    es mucho más rápido que la división.
+    """
+    if prime & (prime + 1):
+        return value % prime
+    bits = prime.bit_length()
+    while value >> bits:
+        value = (value & prime) + (value >> bits)
+    return 0 if value == prime else value
+
+
 def _eval_at(coefficients, x, prime=MERSENNE_PRIME):
     """
     Evalúa el valor de un polinomio en un punto x dentro de un grupo
     cíclico.
 
+    Los x de los *shares* son pequeños, así que cada paso de Horner
+    solo añade unos pocos bits al acumulador y basta con reducir al
+    final.
+
     :param coefficients: La tupla de coeficientes del polinomio. En 
         orden de menor a mayor exponente.
 
     """
     accum = 0
     for coeff in reversed(coefficients):
-        accum *= x
-        accum += coeff
-        accum %= prime
-    return accum
+        accum = accum * x + coeff
+    return _reduce(accum, prime)
 
 
-def make_shares(key, minimum, shares, prime=MERSENNE_PRIME):
-    """ 
-    Divide una clave privada ElGamal en n *shares* donde como mínimo se
-    necesitan k *shares* para reconstruir la clave mediante el
-    algoritmo *Shamir's Secret Sharing*.
+def _random_coefficients(count, prime):
+    """
+    Genera ``count`` coeficientes aleatorios módulo ``prime`` con una
+    sola lectura de ``os.urandom``. Cada coeficiente usa 64 bits más
+    que el primo, así que el sesgo de la reducción es despreciable.
+    """
+    size = (prime.bit_length() + 64 + 7) // 8
+    pool = os.urandom(size * count)
+    return [_reduce(int.from_bytes(pool[k:k + size], "big"), prime)
+            for k in range(0, size * count, size)]
 
-    :param key: La clave ElGamal.
+
+def split_secrets(secrets, minimum, shares, prime=MERSENNE_PRIME):
+    """
+    Divide varios secretos a la vez en n *shares* cada uno, de los que
+    como mínimo se necesitan k para reconstruirlos. Todos los secretos
+    usan los mismos índices, así que el *share* i de cada uno se
+    reparte junto al mismo custodio y se recuperan juntos con
+    :func:`recover_secrets`.
+
+    :param secrets: Los secretos, enteros menores que ``prime``.
     :param minimum: La cantidad *k* mínima de shares.
     :param shares: La cantidad *n* de shares.
+    :param prime: El orden del campo finito.
 
-    :return: Una lista de tuplas :math:`(i, f(i))` que representan las
-        *shares* de la clave.
+    :return: Una lista de tuplas :math:`(i, [f_1(i), f_2(i), ...])`.
+
+    :raises ValueError: Si el mínimo es mayor que el total de *shares*.
     """
     if minimum > shares:
         raise ValueError(
             "El número de puntos mínimo debe ser menor que el número total de puntos"
         )
 
-    #: Construimos el polinomio, donde el término independiente es la
-    #: clave secreta.
-    poly = [key.x] + [SystemRandom().randint(0, prime) for i in range(minimum)]
+    #: Un polinomio de grado k - 1 por secreto, donde el término
+    #: independiente es el secreto.
+    polys = [[secret] + _random_coefficients(minimum - 1, prime) for secret in secrets]
+
+    return [(i, [_eval_at(poly, i, prime) for poly in polys])
+            for i in range(1, shares + 1)]
 
-    #: Los shares son las tuplas :math:`(i, f(i))` de puntos evaluados
-    #: del polinomio.
-    shares = [(i, _eval_at(poly, i, prime))
-              for i in range(1, shares + 1)]
 
-    return shares
+def make_shares(key, minimum, shares, prime=MERSENNE_PRIME):
+    """ 
+    Divide una clave privada ElGamal en n *shares* donde como mínimo se
+    necesitan k *shares* para reconstruir la clave mediante el
+    algoritmo *Shamir's Secret Sharing*.
 
+    :param key: La clave ElGamal.
+    :param minimum: La cantidad *k* mínima de shares.
+    :param shares: La cantidad *n* de shares.
 
-def _extended_gcd(a, b):
+    :return: Una lista de tuplas :math:`(i, f(i))` que representan las
+        *shares* de la clave.
     """
-    Algoritmo para conseguir el minimo común divisor extendido a
-    grupos cíclicos mediante el algoritmo extendido de
-    Euclides. Necesaria para la división de números en grupos cíclicos.
+    return [(i, y[0]) for i, y in split_secrets([key.x], minimum, shares, prime)]
 
-    :param a: El primer número
-    :param b: El segundo número
 
-    :return: Los coeficientes :math:`x, y` tal que :math:`ax + by = 1`.
+@lru_cache(maxsize=LAGRANGE_CACHE_SIZE)
+def _cached_coefficients(x_s, prime, x):
+    if len(set(x_i % prime for x_i in x_s)) != len(x_s):
+        raise ValueError("Los shares deben tener índices distintos")
+    nums = []
+    dens = []
+    for i, x_i in enumerate(x_s):
+        num = 1
+        den = 1
+        for j, x_j in enumerate(x_s):
+            if i != j:
+                num = num * (x - x_j) % prime
+                den = den * (x_i - x_j) % prime
+        nums.append(num)
+        dens.append(den)
+    #: Una sola inversión para todos los denominadores: se invierte su
+    #: producto y se recupera cada inverso con productos parciales.
+    prefix = [1]
+    for den in dens:
+        prefix.append(_reduce(prefix[-1] * den, prime))
+    inverse = invert(prefix[-1], prime)
+    coefficients = [0] * len(x_s)
+    for i in reversed(range(len(x_s))):
+        coefficients[i] = _reduce(_reduce(nums[i] * inverse, prime) * prefix[i], prime)
+        inverse = _reduce(inverse * dens[i], prime)
+    return tuple(coefficients)
+
+
+def lagrange_coefficients(x_s, prime, x=0):
     """
+    Calcula los coeficientes de Lagrange en x para un conjunto de
+    puntos: :math:`f(x) = \\sum_i \\lambda_i f(x_i)`. Sirven para
+    combinar los *shares* sin llegar a juntarlos, por ejemplo en el
+    exponente de una potencia.
 
-    x = 0
-    last_x = 1
-    y = 1
-    last_y = 0
-    while b != 0:
-        quot = a // b
-        a, b = b,  a%b
-        x, last_x = last_x - quot * x, x
-        y, last_y = last_y - quot * y, y
-    return last_x, last_y
+    Los coeficientes solo dependen de los índices, así que se guardan
+    en caché: recuperar varios secretos con los mismos custodios los
+    calcula una sola vez.
 
+    :param x_s: Los valores de x de los *shares*, todos distintos.
+    :param prime: El orden del campo finito.
+    :param x: El punto en el que se interpola. Por defecto 0, el
+        secreto.
 
-def _divmod(num, den, p):
-    '''
-    Calcula la división :math:`{num\over{den}}\pmod{p}`
+    :return: Una tupla con el coeficiente de cada x.
 
-    :param num: numerador.
-    :param den: denominador.
-    :param p: módulo.
-    '''
-    inv, _ = _extended_gcd(den, p)
-    return num * inv
+    :raises ValueError: Si hay valores de x repetidos.
+    """
+    return _cached_coefficients(tuple(x_s), prime, x)
 
 
 def _lagrange_interpolate(x, x_s, y_s, p):
@@ -121,20 +190,25 @@ def _lagrange_interpolate(x, x_s, y_s, p):
 
     :return: El polinomio.
     """
-    k = len(x_s)
-    assert k == len(set(x_s))
-    PI = lambda vals: reduce(lambda x, y: x*y, vals)
-    nums = []  # avoid inexact division
-    dens = []
-    for i in range(k):
-        others = list(x_s)
-        cur = others.pop(i)
-        nums.append(PI(x - o for o in others))
-        dens.append(PI(cur - o for o in others))
-    den = PI(dens)
-    num = sum([_divmod(nums[i] * den * y_s[i] % p, dens[i], p)
-               for i in range(k)])
-    return (_divmod(num, den, p) + p) % p
+    coefficients = lagrange_coefficients(x_s, p, x)
+    return _reduce(sum(c * y for c, y in zip(coefficients, y_s)), p)
+
+
+def recover_secrets(shares, prime=MERSENNE_PRIME):
+    """
+    Recupera a la vez varios secretos repartidos con
+    :func:`split_secrets`.
+
+    :param shares: Una lista de tuplas :math:`(i, [f_1(i), f_2(i), ...])`.
+
+    :return: La lista de secretos.
+    """
+    if len(shares) < 2:
+        raise ValueError("Son necesarios al menos dos shares")
+    x_s = [i for i, _ in shares]
+    coefficients = lagrange_coefficients(x_s, prime)
+    return [_reduce(sum(c * y for c, y in zip(coefficients, y_s)), prime)
+            for y_s in zip(*(ys for _, ys in shares))]
 
 
 def recover_secret(shares, prime=MERSENNE_PRIME):
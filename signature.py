@@ -23,6 +23,39 @@ def generate_signature():
     return ECC.generate(curve=CURVE)
 
 
+def load_signature(filepath):
+    """
+    Carga una clave ECDSA desde un fichero en formato PEM.
+
+    :param filepath: La ruta del fichero.
+
+    :return: Una clave ECDSA.
+    """
+    with open(filepath) as f:
+        return ECC.import_key(f.read())
+
+
+def import_public_key(pem):
+    """
+    Importa una clave pública ECDSA en formato PEM.
+
+    :param pem: La clave exportada en formato PEM.
+
+    :return: Una clave ECDSA.
+    """
+    return ECC.import_key(pem)
+
+
+def public_key_pem(key):
+    """
+    Exporta la componente pública de una clave ECDSA en formato PEM,
+    tal y como aparece en las listas de votantes y de selladores.
+
+    :param key: Una clave ECDSA.
+    """
+    return key.public_key().export_key(format="PEM")
+
+
 def sign(key, msg):
     """
     Firma un mensaje digitalmente con una clave privada.
@@ -83,12 +116,20 @@ def is_valid_signature(signature, signature_list):
     contrastarla con la lista de votantes para saber si la
     firma es válida.
     
-    :param signature: La firma digital.
-    :param signature_list: La lista de claves públicas de los votantes
+    :param signature: La firma digital, en bytes o en hexadecimal.
+    :param signature_list: La lista de claves públicas de los votantes,
+        como objetos de clave o exportadas en formato PEM.
 
     :returns: `True` si la firma es válida, `False` en cualquier otro
         caso.
     """
+    if isinstance(signature, str):
+        try:
+            signature = bytes.fromhex(signature)
+        except ValueError:
+            return False
+    signature_list = [ECC.import_key(sig) if isinstance(sig, str) else sig
+                      for sig in signature_list]
     hashes = [sig.export_key(format="DER") for sig in signature_list]
     for pk, h in zip(signature_list, hashes):
         if verify(pk, signature, h):
@@ -0,0 +1,52 @@
+import os
+import random
+import sys
+
+import pytest
+
+#: Los módulos del proyecto están en la raíz del repositorio.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+#: Un primo seguro pequeño, para que las pruebas sean rápidas.
+TEST_PRIME = 88517432375583489123310538234032850869640640638960443655836501313641793111279
+
+
+@pytest.fixture(scope="session")
+def key():
+    """
+    Una clave ElGamal de prueba sobre :data:`TEST_PRIME`.
+    """
+    from crypto import reconstruct_key
+    x = random.randrange(2, (TEST_PRIME - 1) // 2)
+    return reconstruct_key({"p": TEST_PRIME, "g": 4, "y": pow(4, x, TEST_PRIME), "x": x})
+
+
+@pytest.fixture
+def make_vote(key):
+    """
+    Devuelve una función que crea un voto cifrado para una opción al
+    azar, con la firma indicada o una nueva.
+    """
+    from crypto import encrypt_for_vote
+
+    def make(signature=None, options=3):
+        ballot = [0] * options
+        ballot[random.randrange(options)] = 1
+        encrypted, proofs = encrypt_for_vote(key, ballot)
+        return {
+            "options": [list(c) for c in encrypted],
+            "proofs": [list(p) for p in proofs],
+            "signature": signature or os.urandom(8).hex(),
+        }
+    return make
+
+
+@pytest.fixture
+def easy_mining(monkeypatch):
+    """
+    Baja la dificultad del *proof-of-work* para que minar sea
+    inmediato.
+    """
+    import blockchain
+    monkeypatch.setattr(blockchain, "INITIAL_TARGET", 2**252)
+    monkeypatch.setattr(blockchain, "MAX_TARGET", 2**255)
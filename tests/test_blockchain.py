@@ -0,0 +1,149 @@
+import random
+import time
+
+import pytest
+
+import blockchain
+
+from blockchain import Block, Blockchain, _valid_header, _valid_seal
+from blocklog import BlockLog
+from signature import generate_signature, public_key_pem
+
+
+def new_chain(key, log=None):
+    chain = Blockchain(time.time(), time.time(), time.time() + 1000, key, None, ["a", "b", "c"])
+    if log is not None:
+        chain.attach_log(log)
+    return chain
+
+
+def mine_block(chain, votes):
+    for vote in votes:
+        chain.create_vote(**vote)
+    chain.create_new_block(chain.proof_of_work(workers=1))
+
+
+def fork(chain, height):
+    return Blockchain.construct([chain.blocks[i].serializable() for i in range(height + 1)])
+
+
+def index_state(chain):
+    return (dict(chain.signature_index), dict(chain.ticket_index), chain._vote_count,
+            chain._signatures_digest, dict(chain._superseded),
+            [tuple(c) for c in chain.encrypted_tally()])
+
+
+def test_reload_keeps_revote_after_peer_block(key, make_vote, easy_mining, tmp_path):
+    chain = new_chain(key, BlockLog(str(tmp_path)))
+    mine_block(chain, [make_vote() for _ in range(2)])
+    peer = fork(chain, 1)
+    older = make_vote("voter")
+    mine_block(peer, [older, make_vote()])
+    mine_block(peer, [make_vote()])
+
+    chain.create_vote(**make_vote("voter"))
+    assert chain.update_chain([peer])
+    assert len(chain.mempool) == 1
+
+    chain.log.close()
+    reloaded = Blockchain.load(str(tmp_path))
+    assert len(reloaded.mempool) == 1
+    assert "voter" in reloaded.mempool
+
+
+@pytest.mark.parametrize("interval", [100, 3])
+def test_reorg_undoes_only_divergent_blocks(key, make_vote, easy_mining, monkeypatch, interval):
+    monkeypatch.setattr(blockchain, "CHECKPOINT_INTERVAL", interval)
+    voters = ["v{}".format(i) for i in range(6)]
+    chain = new_chain(key)
+    for _ in range(5):
+        mine_block(chain, [make_vote(random.choice(voters)) for _ in range(3)])
+    peer = fork(chain, 2)
+    for _ in range(5):
+        mine_block(peer, [make_vote(random.choice(voters)) for _ in range(3)])
+
+    reindexed = []
+    monkeypatch.setattr(chain, "_reindex", lambda *args: reindexed.append(args))
+    assert chain.update_chain([peer])
+    assert reindexed == []
+    assert [b.hash for b in chain.blocks] == [b.hash for b in peer.blocks]
+
+    assert len(chain.checkpoints) == (len(chain.blocks) - 1) // interval
+    spliced = index_state(chain)
+    monkeypatch.undo()
+    monkeypatch.setattr(blockchain, "CHECKPOINT_INTERVAL", interval)
+    chain._reindex()
+    assert spliced == index_state(chain)
+
+
+def test_reorg_without_undo_log_reindexes(key, make_vote, easy_mining):
+    chain = new_chain(key)
+    for _ in range(3):
+        mine_block(chain, [make_vote("voter")])
+    peer = fork(chain, 1)
+    for _ in range(3):
+        mine_block(peer, [make_vote("voter")])
+    chain._undo = {}
+    assert chain.update_chain([peer])
+    assert chain.get_vote("voter") == peer.get_vote("voter")
+    assert [tuple(c) for c in chain.encrypted_tally()] == [tuple(c) for c in peer.encrypted_tally()]
+
+
+def test_seal_missing_fields_is_invalid(key, make_vote):
+    sealer_key = generate_signature()
+    chain = Blockchain(time.time(), time.time(), time.time() + 1000, key, None, ["a", "b", "c"],
+                       consensus="poa", sealers=[public_key_pem(sealer_key)])
+    chain.create_vote(**make_vote())
+    chain.create_new_block(sealer_key=sealer_key)
+    genesis, block = chain.blocks[0], chain.blocks[1]
+    assert _valid_header(genesis, block, chain._sealer_keys)
+    for field in blockchain.SEAL_FIELDS + ("seal",):
+        stripped = {k: v for k, v in block.items() if k != field}
+        assert not _valid_seal(Block(stripped), chain._sealer_keys)
+    without_root = Block({k: v for k, v in block.items() if k != "merkle_root"})
+    assert not _valid_header(genesis, without_root, chain._sealer_keys)
+
+
+def test_from_log_recounts_with_given_workers(key, make_vote, easy_mining, tmp_path, monkeypatch):
+    chain = new_chain(key, BlockLog(str(tmp_path)))
+    mine_block(chain, [make_vote() for _ in range(3)])
+    chain.log.close()
+    seen = []
+    original = blockchain.parallel_tally
+
+    def recording(key, ballots, workers=None, *args, **kwargs):
+        seen.append(workers)
+        return original(key, ballots, workers, *args, **kwargs)
+
+    monkeypatch.setattr(blockchain, "parallel_tally", recording)
+    reloaded = Blockchain.from_log(BlockLog(str(tmp_path)), workers=1)
+    assert seen == [1]
+    assert [tuple(c) for c in reloaded.encrypted_tally()] == [tuple(c) for c in chain.encrypted_tally()]
+
+
+def test_reorg_replays_orphaned_revote(key, make_vote, easy_mining):
+    chain = new_chain(key)
+    older, newer = make_vote("voter"), make_vote("voter")
+    mine_block(chain, [older])
+    mine_block(chain, [newer])
+    peer = fork(chain, 1)
+    for _ in range(2):
+        mine_block(peer, [make_vote()])
+
+    assert chain.update_chain([peer])
+    assert chain.get_vote("voter") == older
+    assert list(chain.mempool) == [newer]
+
+
+def test_full_validation_checks_checkpoint_tally(key, make_vote, easy_mining, monkeypatch):
+    monkeypatch.setattr(blockchain, "CHECKPOINT_INTERVAL", 2)
+    chain = new_chain(key)
+    for _ in range(4):
+        mine_block(chain, [make_vote(), make_vote()])
+    assert len(chain.checkpoints) == 2
+    assert chain.validate(full=True, workers=1)
+
+    first, second = chain.checkpoints
+    first["tally"] = second["tally"]
+    assert chain.validate()
+    assert not chain.validate(full=True, workers=1)
@@ -0,0 +1,55 @@
+import time
+
+import pytest
+
+import codec
+
+from blockchain import Block, Blockchain
+
+VALUES = [
+    None, True, False, 0, 1, -1, 2**2048 + 1, -(2**300), 1.5, "", "voto ñ", b"\x00\xff",
+    [], [7], [0, 0], [3, 2**256, 5], [1, -1], [[1, 2], [3, 4]],
+    {"a": [1, "b"], "c": {"d": None}},
+]
+
+
+@pytest.mark.parametrize("value", VALUES)
+def test_round_trip(value):
+    encoded = codec.encode(value, "binary")
+    assert codec.is_binary(encoded)
+    assert codec.decode(encoded) == value
+
+
+def test_tuples_decode_as_lists():
+    assert codec.decode(codec.encode((1, (2, "x")), "binary")) == [1, [2, "x"]]
+
+
+def test_json_and_binary_agree(make_vote):
+    vote = make_vote()
+    assert codec.decode(codec.encode(vote)) == codec.decode(codec.encode(vote, "binary")) == vote
+    assert len(codec.encode(vote, "binary")) < len(codec.encode(vote))
+
+
+def test_errors():
+    with pytest.raises(TypeError):
+        codec.encode({1, 2}, "binary")
+    with pytest.raises(ValueError):
+        codec.encode(1, "xml")
+    with pytest.raises(ValueError):
+        codec.loads(codec.MAGIC + bytes((codec.VERSION + 1,)) + codec.encode_value(1))
+
+
+@pytest.mark.parametrize("fmt", codec.FORMATS)
+def test_message_round_trip(fmt):
+    message = codec.pack_message("VOTE", {"signature": "s", "options": [[1, 2]]}, fmt)
+    assert codec.unpack_message(message) == ("VOTE", {"signature": "s", "options": [[1, 2]]})
+
+
+@pytest.mark.parametrize("fmt", codec.FORMATS)
+def test_block_round_trip(key, make_vote, fmt):
+    chain = Blockchain(time.time(), time.time(), time.time() + 1000, key, None, ["a", "b", "c"])
+    for block in (chain.blocks[0],
+                  Block({"index": 1, "transactions": [make_vote(), make_vote()], "proof": 3})):
+        decoded = Block.decode(block.encoded(fmt))
+        assert decoded.hash == block.hash
+        assert decoded.serializable() == block.serializable()
@@ -0,0 +1,142 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+import arith
+
+from crypto import (batch_verify_proofs, decode_tally, decrypt_vote_tally, encrypt_for_vote,
+                    find_invalid_proofs, tally_votes, verify_proof)
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(params=arith.BACKENDS)
+def backend(request):
+    if request.param == "gmpy2" and arith.gmpy2 is None:
+        pytest.skip("gmpy2 no está instalado")
+    previous = arith.BACKEND
+    arith.use_backend(request.param)
+    yield request.param
+    arith.use_backend(previous)
+
+
+def test_vote_and_tally(key, backend):
+    ballots = [[1, 0, 0], [0, 0, 1], [0, 0, 1]]
+    encrypted = []
+    for ballot in ballots:
+        ciphertexts, proofs = encrypt_for_vote(key, ballot)
+        assert all(verify_proof(key, c, p) for c, p in zip(ciphertexts, proofs))
+        encrypted.append(ciphertexts)
+    tally = tally_votes(key, encrypted)
+    assert decode_tally(key, decrypt_vote_tally(key, tally), len(ballots)) == [1, 0, 2]
+
+
+def test_import_without_gmpy2():
+    code = "import sys; sys.modules['gmpy2'] = None; import arith, crypto; print(arith.BACKEND)"
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [ROOT, os.environ.get("PYTHONPATH")])))
+    result = subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=env, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == "python"
+
+
+def test_keys_have_int_components(key):
+    from Crypto.PublicKey import ElGamal
+    from crypto import int_key, precompute, reconstruct_key, serialize_key
+    rebuilt = reconstruct_key(serialize_key(key))
+    assert all(type(getattr(rebuilt, c)) is int for c in ("p", "g", "y", "x"))
+    raw = ElGamal.construct((key.p, key.g, key.y))
+    assert precompute(raw) == precompute(key)
+    assert type(int_key(raw).y) is int
+
+
+def test_decode_tally_with_pycryptodome_key(key):
+    from Crypto.PublicKey import ElGamal
+    raw = ElGamal.construct((key.p, key.g, key.y, key.x))
+    tally = tally_votes(key, [encrypt_for_vote(key, [0, 1])[0] for _ in range(3)])
+    assert decode_tally(raw, decrypt_vote_tally(key, tally), 3) == [0, 3]
+
+
+PARALLEL_TALLY_UNDER_EVENTLET = """
+import eventlet
+eventlet.monkey_patch()
+
+import crypto
+from crypto import parallel_tally, reconstruct_key, tally_votes
+
+p = 23
+key = reconstruct_key({"p": p, "g": 4, "y": pow(4, 3, p)})
+ballots = [[(4, 8), (2, 3)]] * 50
+assert crypto.green_threads()
+assert parallel_tally(key, ballots, workers=2, chunk_size=4) == tally_votes(key, ballots)
+print("ok")
+"""
+
+
+def test_parallel_tally_under_eventlet():
+    pytest.importorskip("eventlet")
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [ROOT, os.environ.get("PYTHONPATH")])))
+    result = subprocess.run([sys.executable, "-c", PARALLEL_TALLY_UNDER_EVENTLET], cwd=ROOT, env=env,
+                            capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == "ok"
+
+
+def test_parallel_tally_matches_tally(key):
+    from crypto import parallel_tally
+    ballots = [encrypt_for_vote(key, [1, 0])[0] for _ in range(9)]
+    assert parallel_tally(key, ballots, workers=2, chunk_size=2) == tally_votes(key, ballots)
+
+
+def proof_items(key, ballots):
+    items = []
+    for ballot in ballots:
+        ciphertexts, proofs = encrypt_for_vote(key, ballot)
+        items.extend(zip(ciphertexts, proofs))
+    return items
+
+
+def test_batch_verification_finds_planted_proofs(key, backend):
+    items = proof_items(key, [[0, 1, 0], [1, 0, 0], [0, 0, 1], [0, 0, 0]] * 3)
+    assert batch_verify_proofs(key, items)
+    assert find_invalid_proofs(key, items) == []
+
+    (a, b), proof = items[4]
+    items[4] = ((a, b * key.g % key.p), proof)
+    (a, b), proof = items[7]
+    items[7] = ((a, b), list(proof[:-1]) + [proof[-1] + 1])
+    items[11] = (items[11][0], items[2][1])
+    assert not batch_verify_proofs(key, items)
+    assert find_invalid_proofs(key, items) == [4, 7, 11]
+    assert [i for i, (c, p) in enumerate(items) if not verify_proof(key, c, p)] == [4, 7, 11]
+
+
+def test_batch_verification_rejects_malformed_items(key):
+    (ciphertext, proof), = proof_items(key, [[1]])
+    assert not batch_verify_proofs(key, [(ciphertext, proof[:-1])])
+    assert not batch_verify_proofs(key, [((0, ciphertext[1]), proof)])
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_threshold_decryption_matches_direct(key, workers):
+    from crypto import decrypt_vote_tally_threshold, make_key_shares
+    ballots = [[1, 0, 0], [0, 0, 1], [0, 0, 1], [0, 0, 0]]
+    tally = tally_votes(key, [encrypt_for_vote(key, ballot)[0] for ballot in ballots])
+    shares = make_key_shares(key, 3, 5)
+    direct = [m * m % key.p for m in decrypt_vote_tally(key, tally)]
+    for chosen in (shares[:3], shares[2:], [shares[4], shares[0], shares[2]]):
+        squared = decrypt_vote_tally_threshold(key, chosen, tally, workers)
+        assert squared == direct
+        assert decode_tally(key, squared, len(ballots), squared=True) == [1, 0, 2]
+    assert decrypt_vote_tally_threshold(key, shares[:2], tally, workers) != direct
+
+
+def test_partial_decryptions_combine_in_any_order(key):
+    from crypto import combine_partial_decryptions, make_key_shares, partial_decrypt
+    tally = tally_votes(key, [encrypt_for_vote(key, [0, 1])[0] for _ in range(2)])
+    partials = [partial_decrypt(key, share, tally) for share in make_key_shares(key, 2, 3)]
+    combined = combine_partial_decryptions(key, partials[:2], tally)
+    assert combine_partial_decryptions(key, partials[:0:-1], tally) == combined
+    with pytest.raises(ValueError):
+        combine_partial_decryptions(key, [partials[0], partials[0]], tally)
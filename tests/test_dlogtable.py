@@ -0,0 +1,75 @@
+import multiprocessing
+import time
+
+from cryptoutils import DiscreteLogSolver
+from dlogtable import TableBuilder, open_table, table_name
+
+G = 4
+P = 10007
+
+
+def wait_finished(builder, timeout=30):
+    finished = []
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        finished += builder.poll()
+        if not builder.progress():
+            return finished
+        time.sleep(0.05)
+    raise AssertionError("La tabla no ha terminado: {}".format(builder.progress()))
+
+
+def test_build_and_solve(tmp_path):
+    builder = TableBuilder(str(tmp_path))
+    builder.request(G, P, 1000)
+    assert wait_finished(builder) == [table_name(G, P)]
+    table = open_table(str(tmp_path), G, P)
+    assert DiscreteLogSolver(G, P, 1000, table).solve(pow(G, 777, P)) == 777
+    table.close()
+
+
+def test_poll_finishes_when_is_alive_lies(tmp_path, monkeypatch):
+    # Con eventlet, is_alive puede seguir devolviendo True después de
+    # que el proceso termine.
+    monkeypatch.setattr(multiprocessing.Process, "is_alive", lambda self: True)
+    builder = TableBuilder(str(tmp_path))
+    builder.request(G, P, 1000)
+    assert wait_finished(builder) == [table_name(G, P)]
+
+
+def test_larger_request_while_building(tmp_path):
+    builder = TableBuilder(str(tmp_path))
+    builder.request(G, P, 100)
+    builder.request(G, P, 5000)
+    builder.request(G, P, 2000)
+    wait_finished(builder)
+    table = open_table(str(tmp_path), G, P)
+    assert table.steps == DiscreteLogSolver.steps_for(5000)
+    table.close()
+
+
+def test_larger_request_replaces_queued(tmp_path):
+    builder = TableBuilder(str(tmp_path), workers=0)
+    builder.request(G, P, 100)
+    builder.request(G, P, 5000)
+    assert [job[3] for job in builder._queue] == [DiscreteLogSolver.steps_for(5000)]
+
+
+def test_failed_build_is_not_reported(tmp_path, monkeypatch):
+    import dlogtable
+
+    def crash(path, g, p, steps, progress=None):
+        raise RuntimeError("fallo")
+
+    monkeypatch.setattr(dlogtable, "build_table", crash)
+    builder = TableBuilder(str(tmp_path))
+    builder.request(G, P, 1000)
+    assert wait_finished(builder) == []
+    assert builder.failed == [table_name(G, P)]
+
+
+def test_request_accepts_integer_objects(tmp_path):
+    from Crypto.Math.Numbers import Integer
+    builder = TableBuilder(str(tmp_path))
+    builder.request(Integer(G), Integer(P), 1000)
+    assert wait_finished(builder) == [table_name(G, P)]
@@ -0,0 +1,39 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+import arith
+import groups
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def python_backend():
+    previous = arith.BACKEND
+    arith.use_backend("python")
+    yield
+    arith.use_backend(previous)
+
+
+def test_is_prime_python_backend(python_backend):
+    primes = [n for n in range(100) if arith.is_prime(n)]
+    assert primes == [2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37, 41, 43, 47, 53, 59, 61, 67, 71,
+                      73, 79, 83, 89, 97]
+    assert arith.is_prime(2**127 - 1)
+    assert not arith.is_prime(561)
+    assert not arith.is_prime((2**61 - 1) * (2**89 - 1))
+
+
+def test_verify_group_python_backend(python_backend):
+    assert groups.verify_group(groups.FFDHE2048, groups.GENERATOR)
+    assert not groups.verify_group(groups.FFDHE2048 + 2, groups.GENERATOR)
+
+
+def test_groups_without_gmpy2():
+    code = "import sys; sys.modules['gmpy2'] = None; import arith, groups; print(arith.BACKEND)"
+    result = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == "python"
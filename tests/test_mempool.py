@@ -0,0 +1,54 @@
+import pytest
+
+from mempool import Mempool
+from merkle import ticket_hash
+
+
+def vote(signature, options="x"):
+    return {"options": options, "proofs": [], "signature": signature}
+
+
+def test_full_pool_rejects_new_signatures():
+    pool = Mempool(max_size=2)
+    pool.add(vote("a"))
+    pool.add(vote("b"))
+    with pytest.raises(ValueError):
+        pool.add(vote("c"))
+    pool.add(vote("a", "y"))
+    assert len(pool) == 2
+    assert [v["options"] for v in pool] == ["x", "y"]
+
+
+def test_repeated_signature_without_replace():
+    pool = Mempool(replace=False)
+    pool.add(vote("a"))
+    with pytest.raises(ValueError):
+        pool.add(vote("a", "y"))
+    assert list(pool) == [vote("a")]
+
+
+def test_take_block_respects_caps():
+    pool = Mempool(max_block_votes=3, max_block_bytes=250)
+    for i in range(5):
+        pool.add(vote(str(i)), 100)
+    assert [v["signature"] for v in pool.take_block()] == ["0", "1"]
+    pool.max_block_bytes = 1000
+    assert [v["signature"] for v in pool.take_block()] == ["2", "3", "4"]
+    assert pool.take_block() == []
+
+
+def test_take_block_takes_one_oversized_vote():
+    pool = Mempool(max_block_bytes=10)
+    pool.add(vote("a"), 100)
+    pool.add(vote("b"), 100)
+    assert pool.take_block() == [vote("a")]
+    assert pool.depth() == 1
+
+
+def test_discard_keeps_newer_vote():
+    pool = Mempool()
+    pool.add(vote("a", "new"))
+    pool.add(vote("b"))
+    mined = [vote("a", "old"), vote("b")]
+    pool.discard(mined, [ticket_hash(v) for v in mined])
+    assert list(pool) == [vote("a", "new")]
@@ -0,0 +1,43 @@
+import hashlib
+
+import pytest
+
+from merkle import merkle_proof, merkle_root, ticket_hash, verify_merkle_proof
+
+
+def tickets(count):
+    return [hashlib.sha256(str(i).encode()).hexdigest() for i in range(count)]
+
+
+@pytest.mark.parametrize("count", [1, 2, 3, 5, 8, 13])
+def test_every_proof_verifies(count):
+    leaves = tickets(count)
+    root = merkle_root(leaves)
+    for position, ticket in enumerate(leaves):
+        proof = merkle_proof(leaves, position)
+        assert len(proof) <= count.bit_length()
+        assert verify_merkle_proof(ticket, proof, root)
+
+
+def test_proof_rejects_other_ticket_and_root():
+    leaves = tickets(6)
+    root = merkle_root(leaves)
+    proof = merkle_proof(leaves, 2)
+    assert not verify_merkle_proof(leaves[3], proof, root)
+    assert not verify_merkle_proof(leaves[2], proof, merkle_root(leaves[:5]))
+
+
+def test_root_depends_on_order():
+    leaves = tickets(4)
+    assert merkle_root(leaves) != merkle_root(leaves[::-1])
+
+
+def test_leaf_is_not_an_inner_node():
+    leaves = tickets(2)
+    root = merkle_root(leaves)
+    assert merkle_root([root]) != root
+
+
+def test_ticket_hash_ignores_key_order():
+    vote = {"options": [[1, 2]], "proofs": [], "signature": "s"}
+    assert ticket_hash(vote) == ticket_hash(dict(reversed(list(vote.items()))))
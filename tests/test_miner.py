@@ -0,0 +1,38 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from miner import difficulty_target, mine, proof_value
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+EVENTLET_MINE = """
+import eventlet
+eventlet.monkey_patch()
+
+import miner
+
+def run():
+    return miner.mine(1, "abc", miner.difficulty_target(3), workers=2)
+
+proof = eventlet.spawn(run).wait()
+assert miner.proof_value(1, "abc", proof) < miner.difficulty_target(3)
+print("ok")
+"""
+
+
+def test_mine_parallel():
+    target = difficulty_target(3)
+    proof = mine(1, "abc", target, workers=2)
+    assert proof_value(1, "abc", proof) < target
+
+
+def test_mine_parallel_under_eventlet():
+    pytest.importorskip("eventlet")
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [ROOT, os.environ.get("PYTHONPATH")])))
+    result = subprocess.run([sys.executable, "-c", EVENTLET_MINE], env=env, cwd=ROOT,
+                            capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == "ok"
@@ -0,0 +1,96 @@
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+from blockchain import Blockchain
+from blocklog import BlockLog
+
+for module in ("eventlet", "flask", "flask_socketio", "zmq", "Cryptodome"):
+    pytest.importorskip(module)
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVER = os.path.join(ROOT, "server.py")
+
+#: Ejecuta server.py como lo hace un proceso creado con *spawn*, con el
+#: nombre ``__mp_main__``, y después llama a su función de arranque.
+IMPORT_THEN_START = """
+import runpy
+
+import flask_socketio
+
+tasks = []
+flask_socketio.SocketIO.start_background_task = lambda self, target, *args, **kwargs: tasks.append(target.__name__)
+
+server = runpy.run_path({server!r}, run_name="__mp_main__")
+assert tasks == [], tasks
+assert server["chain_ring"] == {{}}, server["chain_ring"]
+
+server["start"]()
+assert tasks == ["handle_nodes", "run_proof_of_work"], tasks
+assert list(server["chain_ring"]) == [42], server["chain_ring"]
+print("ok")
+"""
+
+#: Mina con varios procesos con server.py como módulo principal: cada
+#: proceso minero lo vuelve a importar.
+MINE_FROM_SERVER = """
+import runpy
+import sys
+
+server = runpy.run_path({server!r}, run_name="__mp_main__")
+sys.modules["__main__"].__file__ = {server!r}
+
+import miner
+proof = miner.mine(1, "abc", miner.difficulty_target(3), workers=2)
+assert miner.proof_value(1, "abc", proof) < miner.difficulty_target(3)
+print("ok")
+"""
+
+
+def run(code, cwd):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [ROOT, os.environ.get("PYTHONPATH")])))
+    result = subprocess.run([sys.executable, "-c", code], cwd=cwd, env=env,
+                            capture_output=True, text=True, timeout=120)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip().endswith("ok")
+
+
+@pytest.fixture
+def server_dir(tmp_path, key):
+    chain = Blockchain(time.time(), time.time(), time.time() + 3600, key, None, ["a", "b"])
+    chain.attach_log(BlockLog(str(tmp_path / "conf" / "chains" / "42"), fmt="binary"))
+    chain.log.close()
+    return tmp_path
+
+
+def test_import_has_no_startup_side_effects(server_dir):
+    run(IMPORT_THEN_START.format(server=SERVER), str(server_dir))
+
+
+def test_mining_workers_do_not_restart_server(server_dir):
+    run(MINE_FROM_SERVER.format(server=SERVER), str(server_dir))
+    with open(server_dir / "conf" / "server.log") as f:
+        log = f.read()
+    assert "Loaded chain ring" not in log
+    assert "STARTED BACKGROUND TASK" not in log
+
+LOAD_WITH_BAD_ENTRIES = """
+import runpy
+
+server = runpy.run_path({server!r}, run_name="__mp_main__")
+ring = server["load_blockchain"]("conf/chains", "binary")
+assert list(ring) == [42], ring
+print("ok")
+"""
+
+
+def test_load_skips_bad_entries(server_dir):
+    chains = server_dir / "conf" / "chains"
+    (chains / "not-an-id").mkdir()
+    broken = chains / "7"
+    broken.mkdir()
+    (broken / "00000000.log").write_bytes(b"basura")
+    run(LOAD_WITH_BAD_ENTRIES.format(server=SERVER), str(server_dir))
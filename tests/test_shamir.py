@@ -0,0 +1,41 @@
+import random
+
+import pytest
+
+from shamir import (MERSENNE_PRIME, make_shares, recover_secret, recover_secrets,
+                    split_secrets)
+
+
+@pytest.mark.parametrize("prime", [MERSENNE_PRIME, 2**127 - 1])
+def test_any_k_shares_recover_the_secrets(prime):
+    secrets = [random.randrange(prime) for _ in range(4)]
+    shares = split_secrets(secrets, 3, 6, prime)
+    assert len(shares) == 6
+    for _ in range(5):
+        assert recover_secrets(random.sample(shares, 3), prime) == secrets
+    assert recover_secrets(shares, prime) == secrets
+
+
+def test_k_minus_one_shares_do_not_recover():
+    secrets = [random.randrange(MERSENNE_PRIME) for _ in range(3)]
+    shares = split_secrets(secrets, 4, 6)
+    recovered = recover_secrets(shares[:3])
+    assert all(r != s for r, s in zip(recovered, secrets))
+
+
+def test_single_secret_matches_batch(key):
+    shares = make_shares(key, 2, 3)
+    assert recover_secret(shares[1:]) == key.x
+    assert recover_secrets([(i, [y]) for i, y in shares[:2]]) == [key.x]
+
+
+def test_invalid_shares():
+    shares = split_secrets([1], 2, 3)
+    with pytest.raises(ValueError):
+        split_secrets([1], 4, 3)
+    with pytest.raises(ValueError):
+        recover_secrets(shares[:1])
+    with pytest.raises(ValueError):
+        recover_secrets([shares[0], shares[0]])
+    with pytest.raises(ValueError):
+        recover_secret([(1, 5)])
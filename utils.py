@@ -6,26 +6,21 @@ módulos del sistema.
 from functools import partial
 
 import crypto
+import dlogtable
 
-from pprint import pprint
-
-def get_final_votes(blockchain):
+def get_final_votes(blockchain, table_dir=None):
     pk = blockchain.public_key
-    votes = blockchain.votes
 
-    final_tally = []
-    sig_votes = create_new_key_dict(votes, "signature")
-    pprint(sig_votes)
-    options = list(map(lambda x: sig_votes.get(x).get("options"), sig_votes.keys()))
-    vote_tally = crypto.tally_votes(pk, options)
+    vote_tally = blockchain.encrypted_tally()
 
     decrypted_tally = crypto.decrypt_vote_tally(pk, vote_tally)
-    
-    final_tally = []
-    for i in decrypted_tally:
-        final_tally.append(crypto.consult_decryption_table({pk.y: crypto.vote_lookup_table(pk, 100)}, pk, i))
 
-    return final_tally
+    table = dlogtable.open_table(table_dir, int(pk.g), int(pk.p)) if table_dir else None
+    try:
+        return crypto.decode_tally(pk, decrypted_tally, len(blockchain.signature_index), table)
+    finally:
+        if table:
+            table.close()
 
 def create_new_key_dict(d_list: [dict], k: object) -> dict:
     """